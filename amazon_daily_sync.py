@@ -8,7 +8,8 @@ GitHub Actions用（楽天と同じ仕組み）
 import os
 import sys
 from datetime import datetime, timedelta, timezone
-from supabase import create_client
+from core.database import Database
+from core.stock import REASON_SALE, adjust_stock, stock_adjustment
 import logging
 import requests
 import json
@@ -32,7 +33,7 @@ if not all([SUPABASE_URL, SUPABASE_KEY, AMAZON_SECRET, AMAZON_KEY]):
     sys.exit(1)
 
 # Supabaseクライアント初期化
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = Database.get_client()
 
 def sync_amazon_orders(days=1):
     """
@@ -181,42 +182,26 @@ def process_order_item(order_id, item):
             'created_at': datetime.now(timezone.utc).isoformat()
         }
         
-        supabase.table('order_items').insert(item_data).execute()
+        inserted = supabase.table('order_items').insert(item_data).execute()
         
         # 在庫を更新（共通コードがある場合）
         if common_code:
-            update_inventory(common_code, -item_data['quantity'])
+            update_inventory(common_code, -item_data['quantity'], inserted.data[0].get('id') if inserted.data else None)
             logger.info(f"在庫更新: ASIN {asin} → {common_code} (-{item_data['quantity']})")
             
     except Exception as e:
         logger.error(f"商品データ保存エラー: {e}")
 
-def update_inventory(common_code, quantity_change):
+def update_inventory(common_code, quantity_change, reference=None):
     """
-    在庫を更新
+    在庫を更新（在庫行がない場合は新規作成、負の在庫は0で止める）
     """
     try:
-        # 現在の在庫を取得
-        current = supabase.table('inventory').select('current_stock').eq('common_code', common_code).execute()
-        
-        if current.data:
-            new_stock = current.data[0]['current_stock'] + quantity_change
-            new_stock = max(0, new_stock)  # 負の在庫を防ぐ
-            
-            supabase.table('inventory').update({
-                'current_stock': new_stock,
-                'last_updated': datetime.now(timezone.utc).isoformat()
-            }).eq('common_code', common_code).execute()
-            
-            logger.info(f"在庫更新完了: {common_code} → {new_stock}個")
-        else:
-            # 新規在庫レコード作成
-            supabase.table('inventory').insert({
-                'common_code': common_code,
-                'current_stock': max(0, quantity_change),
-                'minimum_stock': 10,
-                'last_updated': datetime.now(timezone.utc).isoformat()
-            }).execute()
+        levels = adjust_stock(
+            [stock_adjustment(common_code, quantity_change, REASON_SALE, reference, minimum_stock=10)],
+            clamp_at_zero=True, create_missing=True, client=supabase
+        )
+        logger.info(f"在庫更新完了: {common_code} → {levels[common_code]['new_stock']}個")
             
     except Exception as e:
         logger.error(f"在庫更新エラー: {str(e)}")
@@ -18,6 +18,7 @@ import logging
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from improved_mapping_system import InventoryMappingSystem
+from core.ledger import InventoryLedger
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -43,8 +44,6 @@ def apply_historical_inventory_changes(start_date_str="2025-02-10", end_date_str
         start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
         end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
         
-        # 日別に処理（メモリ使用量を抑えるため）
-        current_date = start_date
         total_results = {
             'total_days_processed': 0,
             'total_rakuten_sales': 0,
@@ -55,59 +54,31 @@ def apply_historical_inventory_changes(start_date_str="2025-02-10", end_date_str
             'mapping_success_rate': 0
         }
         
-        while current_date <= end_date:
-            logger.info(f"\n📅 処理日: {current_date.strftime('%Y-%m-%d')}")
+        # 期間全体を1回で取得・マッピングし、日別の減算をまとめて適用（DRY RUNも同じ処理）
+        replay = mapping_system.replay_range(start_date, end_date, dry_run=dry_run)
+        
+        for day in replay['daily_summaries']:
+            logger.info(f"\n📅 処理日: {day['date']}")
+            logger.info(f"  📦 楽天商品: {day['rakuten_sales']}件")
+            logger.info(f"  ✅ マッピング成功: {day['mapped_items']}件")
+            logger.info(f"  ❌ マッピング失敗: {day['unmapped_items']}件")
+            logger.info(f"  📊 在庫変動: {day['inventory_changes']}商品")
             
-            try:
-                # その日のデータを処理
-                day_result = mapping_system.run_full_process(target_date=current_date, dry_run=dry_run)
-                
-                # 結果を集計
-                rakuten_sales_count = len(day_result.get('rakuten_sales', []))
-                mapped_items_count = len(day_result.get('mapped_items', []))
-                unmapped_items_count = len(day_result.get('unmapped_items', []))
-                inventory_changes_count = len(day_result.get('inventory_changes', []))
-                
-                if rakuten_sales_count > 0:
-                    logger.info(f"  📦 楽天商品: {rakuten_sales_count}件")
-                    logger.info(f"  ✅ マッピング成功: {mapped_items_count}件")
-                    logger.info(f"  ❌ マッピング失敗: {unmapped_items_count}件")
-                    logger.info(f"  📊 在庫変動: {inventory_changes_count}商品")
-                    
-                    if mapped_items_count + unmapped_items_count > 0:
-                        day_success_rate = (mapped_items_count / (mapped_items_count + unmapped_items_count)) * 100
-                        logger.info(f"  🎯 日別成功率: {day_success_rate:.1f}%")
-                else:
-                    logger.info(f"  📭 データなし")
-                
-                # 総計に追加
-                total_results['total_rakuten_sales'] += rakuten_sales_count
-                total_results['total_mapped_items'] += mapped_items_count
-                total_results['total_unmapped_items'] += unmapped_items_count
-                total_results['total_inventory_changes'] += inventory_changes_count
-                total_results['total_days_processed'] += 1
-                
-                # 日別サマリー
-                daily_summary = {
-                    'date': current_date.strftime('%Y-%m-%d'),
-                    'rakuten_sales': rakuten_sales_count,
-                    'mapped_items': mapped_items_count,
-                    'unmapped_items': unmapped_items_count,
-                    'inventory_changes': inventory_changes_count,
-                    'success_rate': day_success_rate if rakuten_sales_count > 0 else 100
-                }
-                total_results['daily_summaries'].append(daily_summary)
-                
-            except Exception as e:
-                logger.error(f"❌ {current_date} の処理でエラー: {str(e)}")
-                daily_summary = {
-                    'date': current_date.strftime('%Y-%m-%d'),
-                    'error': str(e)
-                }
-                total_results['daily_summaries'].append(daily_summary)
+            day_total = day['mapped_items'] + day['unmapped_items']
+            day_success_rate = (day['mapped_items'] / day_total) * 100 if day_total > 0 else 100
+            logger.info(f"  🎯 日別成功率: {day_success_rate:.1f}%")
             
-            # 次の日へ
-            current_date += timedelta(days=1)
+            # 総計に追加
+            total_results['total_rakuten_sales'] += day['rakuten_sales']
+            total_results['total_mapped_items'] += day['mapped_items']
+            total_results['total_unmapped_items'] += day['unmapped_items']
+            total_results['total_inventory_changes'] += day['inventory_changes']
+            total_results['daily_summaries'].append({**day, 'success_rate': day_success_rate})
+        
+        total_results['total_days_processed'] = (end_date - start_date).days + 1
+        total_results['inventory_results'] = replay['results']
+        if replay['conflicts']:
+            logger.warning(f"⚠️  他の処理と重なった{replay['conflicts']}バッチをスキップしました（再実行で未減算分のみ処理されます）")
         
         # 全体の成功率計算
         if total_results['total_mapped_items'] + total_results['total_unmapped_items'] > 0:
@@ -132,6 +103,14 @@ def apply_historical_inventory_changes(start_date_str="2025-02-10", end_date_str
             logger.info("実際に適用する場合は dry_run=False で実行してください")
         else:
             logger.info("\n✅ 実際の在庫変更完了")
+            
+            # 台帳（各日の変動として記録済み）とinventory.current_stockの一致を確認
+            audit = InventoryLedger(mapping_system.supabase).rebuild_current_stock(dry_run=True)
+            total_results['ledger_audit'] = audit
+            if audit.get('status') == 'success':
+                logger.info(f"📒 台帳との差分: {len(audit['differences'])}商品")
+            else:
+                logger.warning(f"📒 台帳の確認をスキップ: {audit.get('message')}")
         
         # 未マッピング商品があれば警告
         if total_results['total_unmapped_items'] > 0:
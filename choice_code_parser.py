@@ -4,8 +4,8 @@
 選択肢コードから実際の商品コードを抽出する機能
 """
 
-import re
 from typing import List, Dict, Set
+from core.choice_scanner import scan_choice_codes
 
 def extract_product_codes_from_choice(choice_code: str) -> List[str]:
     """
@@ -17,25 +17,9 @@ def extract_product_codes_from_choice(choice_code: str) -> List[str]:
     Returns:
         List[str]: 抽出された商品コードのリスト
     """
-    if not choice_code:
-        return []
-    
     # Rで始まる数字のパターンを抽出（R05, R13, R14, R08等）
-    # パターン: R + 2桁以上の数字
-    pattern = r'R\d{2,}'
-    
-    # 全てのマッチを取得
-    matches = re.findall(pattern, choice_code)
-    
-    # 重複を除去して順序を保持
-    seen = set()
-    result = []
-    for match in matches:
-        if match not in seen:
-            seen.add(match)
-            result.append(match)
-    
-    return result
+    # パターン: R + 2桁以上の数字（重複除去・出現順）
+    return scan_choice_codes(choice_code, 'rakuten')
 
 def analyze_choice_code_detailed(choice_code: str) -> Dict:
     """
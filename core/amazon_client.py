@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Amazon SP-API 非同期クライアント
+注文・注文商品の取得を、コネクションプール付きの共有HTTPクライアントで並行に行う
+
+- アクセストークンはLWA（Login with Amazon）のリフレッシュトークンから取得し、期限まで再利用
+- 操作（getOrders / getOrderItems など）ごとにSP-APIの使用量制限（レートとバースト）の
+  トークンバケットを持ち、プロセス内のすべてのリクエストで共有する
+- 429/5xxと通信エラーはジッター付きの指数バックオフで再試行し、429の場合は同じ操作の
+  リクエストを一時停止する
+
+使い方:
+    async with AmazonSPAPIClient() as api:
+        orders = await api.get_orders(start_date, end_date)
+        items_by_order = await api.get_order_items_many([o['AmazonOrderId'] for o in orders])
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+import httpx
+from .config import Config
+from .rate_limit import AsyncTokenBucket, RETRYABLE_STATUS_CODES, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+LWA_TOKEN_URL = 'https://api.amazon.com/auth/o2/token'
+DEFAULT_ENDPOINT = 'https://sellingpartnerapi-fe.amazon.com'  # 極東（日本）
+DEFAULT_MARKETPLACE_ID = 'A1VC38T7YXB528'  # 日本
+
+# 操作ごとの使用量制限（リクエスト/秒, バースト） Orders API v0
+OPERATION_QUOTAS = {
+    'getOrders': (0.0167, 20),
+    'getOrder': (0.5, 30),
+    'getOrderItems': (0.5, 30),
+}
+
+# アクセストークンの期限の何秒前に更新するか
+TOKEN_REFRESH_MARGIN = 60
+
+_buckets: Dict[str, AsyncTokenBucket] = {}
+
+
+def operation_bucket(operation: str) -> AsyncTokenBucket:
+    """操作ごとのトークンバケット（使用量制限はアカウント単位のため、プロセス内で共有）"""
+    if operation not in _buckets:
+        rate, burst = OPERATION_QUOTAS.get(operation, (1.0, 1))
+        _buckets[operation] = AsyncTokenBucket(rate, burst)
+    return _buckets[operation]
+
+
+class AmazonAPIError(Exception):
+    """SP-APIがエラーを返した（再試行しても成功しなかった）"""
+
+    def __init__(self, operation: str, response: httpx.Response):
+        super().__init__(f"{operation}: {response.status_code} {response.text[:500]}")
+        self.operation = operation
+        self.status_code = response.status_code
+
+
+class AmazonSPAPIClient:
+    """Amazon SP-API（Orders API）の非同期クライアント"""
+
+    def __init__(self, client_id: Optional[str] = None, client_secret: Optional[str] = None,
+                 refresh_token: Optional[str] = None, marketplace_id: Optional[str] = None,
+                 endpoint: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None):
+        self.client_id = client_id or os.getenv('AMAZON_CLIENT_ID')
+        self.client_secret = client_secret or os.getenv('AMAZON_CLIENT_SECRET')
+        self.refresh_token = refresh_token or os.getenv('AMAZON_REFRESH_TOKEN')
+        self.marketplace_id = marketplace_id or os.getenv('AMAZON_MARKETPLACE_ID', DEFAULT_MARKETPLACE_ID)
+        self.endpoint = (endpoint or DEFAULT_ENDPOINT).rstrip('/')
+        self.max_concurrency = max_concurrency or Config.get_amazon_max_concurrency()
+        self.max_retries = max_retries if max_retries is not None else Config.get_amazon_max_retries()
+
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_loop = None
+        self._token_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> 'AmazonSPAPIClient':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """コネクションプール付きの共有HTTPクライアントを取得
+
+        AsyncClientは作成したイベントループに紐づくため、
+        別のループ（asyncio.runの再実行など）から呼ばれた場合は作り直す
+        """
+        loop = asyncio.get_running_loop()
+        if self._http_client is None or self._http_client.is_closed or self._http_client_loop is not loop:
+            self._http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._http_client_loop = loop
+            self._token_lock = asyncio.Lock()
+        return self._http_client
+
+    async def aclose(self):
+        """共有HTTPクライアントを閉じる"""
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+        self._http_client = None
+
+    async def _get_access_token(self, force: bool = False) -> str:
+        """LWAのアクセストークンを取得（期限内は再利用、同時に呼ばれても更新は1回）"""
+        client = self._get_http_client()
+        async with self._token_lock:
+            if not force and self._access_token and time.monotonic() < self._token_expires_at:
+                return self._access_token
+            response = await client.post(LWA_TOKEN_URL, data={
+                'grant_type': 'refresh_token',
+                'refresh_token': self.refresh_token,
+                'client_id': self.client_id,
+                'client_secret': self.client_secret
+            })
+            if response.status_code != 200:
+                raise AmazonAPIError('LWA token', response)
+            token = response.json()
+            self._access_token = token['access_token']
+            self._token_expires_at = time.monotonic() + int(token.get('expires_in', 3600)) - TOKEN_REFRESH_MARGIN
+            return self._access_token
+
+    async def _get(self, operation: str, path: str, params: Optional[Dict] = None) -> Dict:
+        """レート制限とリトライ付きでGETし、レスポンスのpayloadを返す"""
+        client = self._get_http_client()
+        bucket = operation_bucket(operation)
+        token_refreshed = False
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            access_token = await self._get_access_token()
+            try:
+                response = await client.get(
+                    f'{self.endpoint}{path}', params=params,
+                    headers={'x-amz-access-token': access_token}
+                )
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"SP-API {operation} 通信エラー: {e} ({delay:.1f}秒後に再試行)")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            # SP-APIは現在の使用量制限をヘッダーで返すため、バケットのレートを合わせる
+            limit = response.headers.get('x-amzn-RateLimit-Limit')
+            if limit:
+                try:
+                    if float(limit) > 0:
+                        bucket.rate = float(limit)
+                except ValueError:
+                    pass
+
+            if response.status_code == 403 and not token_refreshed:
+                # アクセストークンの期限切れ（時計のずれなど）は1回だけ取り直す
+                token_refreshed = True
+                await self._get_access_token(force=True)
+                continue
+
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                delay = backoff_delay(attempt, response)
+                logger.warning(f"SP-API {operation} {response.status_code}: {delay:.1f}秒後に再試行 ({attempt + 1}/{self.max_retries})")
+                if response.status_code == 429:
+                    # 同じ操作の他のリクエストも含めて一時停止
+                    bucket.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code != 200:
+                raise AmazonAPIError(operation, response)
+            return response.json().get('payload') or {}
+
+    async def get_orders(self, created_after: datetime, created_before: datetime) -> List[Dict]:
+        """期間内に作成された注文（NextTokenのページをすべて取得）"""
+        # CreatedBeforeは現在時刻の2分以上前である必要がある
+        latest = datetime.now(timezone.utc) - timedelta(minutes=2)
+        created_before = min(created_before, latest)
+        params = {
+            'MarketplaceIds': self.marketplace_id,
+            'CreatedAfter': created_after.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'CreatedBefore': created_before.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
+        orders = []
+        while True:
+            payload = await self._get('getOrders', '/orders/v0/orders', params)
+            orders.extend(payload.get('Orders', []))
+            next_token = payload.get('NextToken')
+            if not next_token:
+                return orders
+            params = {'MarketplaceIds': self.marketplace_id, 'NextToken': next_token}
+
+    async def get_order_items(self, amazon_order_id: str) -> List[Dict]:
+        """1注文の商品（NextTokenのページをすべて取得）"""
+        path = f'/orders/v0/orders/{amazon_order_id}/orderItems'
+        params = None
+        items = []
+        while True:
+            payload = await self._get('getOrderItems', path, params)
+            items.extend(payload.get('OrderItems', []))
+            next_token = payload.get('NextToken')
+            if not next_token:
+                return items
+            params = {'NextToken': next_token}
+
+    async def get_order_items_many(self, amazon_order_ids: Iterable[str]) -> Dict[str, List[Dict]]:
+        """複数注文の商品を並行に取得（取得に失敗した注文は結果に含めない）"""
+        order_ids = list(dict.fromkeys(amazon_order_ids))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(order_id: str):
+            async with semaphore:
+                try:
+                    return order_id, await self.get_order_items(order_id)
+                except Exception as e:
+                    logger.error(f"注文商品の取得に失敗しました {order_id}: {e}")
+                    return order_id, None
+
+        results = await asyncio.gather(*(fetch(order_id) for order_id in order_ids))
+        items_by_order = {order_id: items for order_id, items in results if items is not None}
+        logger.info(f"注文商品を取得しました: {len(items_by_order)}/{len(order_ids)}注文")
+        return items_by_order
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+過去データ一括同期（バックフィル）パイプラインモジュール
+期間をウィンドウに分割し、
+    ウィンドウ検索 → 詳細取得 → 変換 → 一括書き込み
+の各段を上限付きasyncio.Queueでつないで複数ウィンドウを同時に処理する
+
+ウィンドウごとに完了をsync_logs（sync_type='backfill:<ジョブ名>'）へ記録し、
+途中で停止した場合も再実行時は未完了のウィンドウだけを処理する
+
+使い方:
+    pipeline = BackfillPipeline(
+        'historical_rakuten',
+        search=fetch_orders,          # (start, end) -> 注文リスト
+        transform=to_records,         # 注文リスト -> 書き込み用データ
+        write=save_records,           # 書き込み用データ -> {'orders': n, 'items': m}
+    )
+    results = await pipeline.run(split_windows(start, end, days=30))
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from .database import Database, run_sync
+from .rate_limit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PREFIX = 'backfill:'
+
+
+def split_windows(start: datetime, end: datetime, days: int) -> List[Tuple[datetime, datetime]]:
+    """期間をdays日ごとのウィンドウに分割（各ウィンドウは[開始, 終了)）"""
+    windows = []
+    current = start
+    while current < end:
+        window_end = min(current + timedelta(days=days), end)
+        windows.append((current, window_end))
+        current = window_end
+    return windows
+
+
+def split_monthly_windows(start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """期間を月ごとのウィンドウに分割"""
+    windows = []
+    current = start
+    while current < end:
+        if current.month == 12:
+            next_month = current.replace(year=current.year + 1, month=1, day=1)
+        else:
+            next_month = current.replace(month=current.month + 1, day=1)
+        window_end = min(next_month, end)
+        windows.append((current, window_end))
+        current = window_end
+    return windows
+
+
+def _window_key(window: Tuple[datetime, datetime]) -> str:
+    return f"{window[0].isoformat()}/{window[1].isoformat()}"
+
+
+async def _call(func: Callable, *args):
+    """async関数はそのまま、同期関数はDB用スレッドプールで実行"""
+    if inspect.iscoroutinefunction(func):
+        return await func(*args)
+    return await run_sync(func, *args)
+
+
+class _WindowState:
+    """処理中ウィンドウの進捗"""
+
+    def __init__(self, window: Tuple[datetime, datetime]):
+        self.window = window
+        self.key = _window_key(window)
+        self.pending = 0
+        self.searched = False
+        self.error: Optional[str] = None
+        self.counts: Dict[str, int] = {}
+        self.started_at = time.monotonic()
+        self.done = asyncio.Event()
+
+
+class BackfillPipeline:
+    """ウィンドウ単位でチェックポイントを取るステージ型バックフィル
+
+    Args:
+        job_name: チェックポイントのジョブ名
+        search: (開始, 終了) -> 検索結果のリスト（注文番号または注文データ）
+        write: 変換後のデータ -> 件数の辞書（例: {'orders': 10, 'items': 25}）
+        fetch_details: 検索結果のバッチ -> 詳細データのリスト（Noneの場合は検索結果をそのまま変換へ）
+        transform: 詳細データのリスト -> 書き込み用データ（Noneの場合はそのまま書き込みへ）
+        window_concurrency: 同時に検索するウィンドウ数
+        detail_concurrency: 詳細取得の同時実行数
+        write_concurrency: 書き込みの同時実行数
+        batch_size: 詳細取得・書き込みの1バッチの件数
+        rate_limiter: 検索・詳細取得の前に待機するトークンバケット
+    """
+
+    def __init__(self, job_name: str, search: Callable, write: Callable,
+                 fetch_details: Optional[Callable] = None, transform: Optional[Callable] = None,
+                 window_concurrency: int = 2, detail_concurrency: int = 3, write_concurrency: int = 2,
+                 batch_size: int = 100, rate_limiter: Optional[AsyncTokenBucket] = None, client=None):
+        self.job_name = job_name
+        self.search = search
+        self.fetch_details = fetch_details
+        self.transform = transform
+        self.write = write
+        self.window_concurrency = window_concurrency
+        self.detail_concurrency = detail_concurrency
+        self.write_concurrency = write_concurrency
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter
+        self._client = client
+
+    @property
+    def sync_type(self) -> str:
+        return f"{CHECKPOINT_PREFIX}{self.job_name}"
+
+    def load_completed_windows(self) -> Set[str]:
+        """チェックポイント済みのウィンドウを取得"""
+        client = self._client or Database.get_client()
+        if client is None:
+            return set()
+        try:
+            result = client.table("sync_logs").select("results").eq(
+                "sync_type", self.sync_type
+            ).eq("status", "completed").execute()
+            return {row['results'].get('window') for row in result.data or [] if row.get('results')}
+        except Exception as e:
+            logger.warning(f"チェックポイントの読み込みに失敗しました ({self.job_name}): {e}")
+            return set()
+
+    def save_checkpoint(self, state: _WindowState):
+        """ウィンドウの完了を記録"""
+        client = self._client or Database.get_client()
+        if client is None:
+            return
+        try:
+            client.table("sync_logs").insert({
+                'sync_type': self.sync_type,
+                'status': 'completed',
+                'results': {'window': state.key, **state.counts}
+            }).execute()
+        except Exception as e:
+            logger.error(f"チェックポイントの保存に失敗しました ({state.key}): {e}")
+
+    def reset_checkpoints(self):
+        """チェックポイントを削除（最初からやり直す場合）"""
+        client = self._client or Database.get_client()
+        if client is not None:
+            client.table("sync_logs").delete().eq("sync_type", self.sync_type).execute()
+
+    async def run(self, windows: List[Tuple[datetime, datetime]], resume: bool = True) -> List[Dict]:
+        """全ウィンドウを処理し、ウィンドウごとの結果を期間順に返す"""
+        completed = await run_sync(self.load_completed_windows) if resume else set()
+        states = [_WindowState(window) for window in windows]
+        todo = [state for state in states if state.key not in completed]
+        if len(todo) < len(states):
+            logger.info(f"{self.job_name}: {len(states) - len(todo)}ウィンドウは完了済みのためスキップ")
+
+        window_queue: asyncio.Queue = asyncio.Queue()
+        detail_queue: asyncio.Queue = asyncio.Queue(maxsize=self.detail_concurrency * 2)
+        transform_queue: asyncio.Queue = asyncio.Queue(maxsize=self.write_concurrency * 2)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.write_concurrency * 2)
+        for state in todo:
+            window_queue.put_nowait(state)
+
+        async def acquire():
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+
+        def fail(state: _WindowState, stage: str, error: Exception):
+            if state.error is None:
+                state.error = f"{stage}: {error}"
+            logger.error(f"{self.job_name} {state.key} {stage}エラー: {error}")
+
+        async def finish_batch(state: _WindowState):
+            state.pending -= 1
+            if state.searched and state.pending == 0:
+                await finish_window(state)
+
+        async def finish_window(state: _WindowState):
+            elapsed = time.monotonic() - state.started_at
+            if state.error is None:
+                await run_sync(self.save_checkpoint, state)
+                logger.info(f"{self.job_name} {state.key} 完了: {state.counts} ({elapsed:.1f}秒)")
+            state.done.set()
+
+        async def search_worker():
+            while True:
+                state = await window_queue.get()
+                try:
+                    state.started_at = time.monotonic()
+                    await acquire()
+                    found = await _call(self.search, *state.window) or []
+                    next_queue = detail_queue if self.fetch_details else transform_queue
+                    for i in range(0, len(found), self.batch_size):
+                        state.pending += 1
+                        await next_queue.put((state, found[i:i + self.batch_size]))
+                except Exception as e:
+                    fail(state, '検索', e)
+                finally:
+                    state.searched = True
+                    if state.pending == 0:
+                        await finish_window(state)
+                    window_queue.task_done()
+
+        async def detail_worker():
+            while True:
+                state, batch = await detail_queue.get()
+                try:
+                    await acquire()
+                    records = await _call(self.fetch_details, batch) or []
+                    await transform_queue.put((state, records))
+                except Exception as e:
+                    fail(state, '詳細取得', e)
+                    await finish_batch(state)
+                finally:
+                    detail_queue.task_done()
+
+        async def transform_worker():
+            while True:
+                state, records = await transform_queue.get()
+                try:
+                    rows = self.transform(records) if self.transform else records
+                    await write_queue.put((state, rows))
+                except Exception as e:
+                    fail(state, '変換', e)
+                    await finish_batch(state)
+                finally:
+                    transform_queue.task_done()
+
+        async def write_worker():
+            while True:
+                state, rows = await write_queue.get()
+                try:
+                    counts = await _call(self.write, rows) or {}
+                    for name, value in counts.items():
+                        state.counts[name] = state.counts.get(name, 0) + value
+                except Exception as e:
+                    fail(state, '書き込み', e)
+                finally:
+                    await finish_batch(state)
+                    write_queue.task_done()
+
+        workers = (
+            [asyncio.ensure_future(search_worker()) for _ in range(self.window_concurrency)]
+            + [asyncio.ensure_future(detail_worker()) for _ in range(self.detail_concurrency if self.fetch_details else 0)]
+            + [asyncio.ensure_future(transform_worker())]
+            + [asyncio.ensure_future(write_worker()) for _ in range(self.write_concurrency)]
+        )
+        try:
+            await asyncio.gather(*(state.done.wait() for state in todo))
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        results = []
+        for state in states:
+            if state.key in completed:
+                status = 'skipped'
+            elif state.error is None:
+                status = 'success'
+            else:
+                status = 'error'
+            result = {'status': status, 'start': state.window[0], 'end': state.window[1], **state.counts}
+            if state.error:
+                result['message'] = state.error
+            results.append(result)
+        return results
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+まとめ商品の部品表（BOM）展開モジュール
+package_componentsを読み込んだ時点で、各package_codeを
+最終構成品（それ以上分解できない商品）→数量 のベクトルに平坦化しておく
+
+- まとめ商品の中に別のまとめ商品（セット）が含まれる場合も再帰的に展開する
+- 循環参照（A→B→A）は検出してログに記録し、循環した構成品はそれ以上展開しない
+
+使い方:
+    bom = BomEngine.build(package_component_rows)
+    bom.expand('C01', 2)     # {'S01': 4, 'S02': 2}
+"""
+
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _quantity_of(row: Dict) -> float:
+    """構成数量（未設定の場合は1）"""
+    quantity = row.get('quantity')
+    return quantity if quantity is not None else 1
+
+
+class BomEngine:
+    """まとめ商品の展開済み部品表
+
+    Attributes:
+        direct: package_code → 直下の構成品コード→数量
+        flattened: package_code → 最終構成品コード→数量
+        cycles: 検出した循環参照（package_codeの経路）
+    """
+
+    def __init__(self):
+        self.direct: Dict[str, Dict[str, float]] = {}
+        self.flattened: Dict[str, Dict[str, float]] = {}
+        self.cycles: List[Tuple[str, ...]] = []
+
+    @classmethod
+    def build(cls, component_rows: Iterable[Dict]) -> 'BomEngine':
+        """package_componentsの行から展開済み部品表を作成"""
+        engine = cls()
+        for row in component_rows:
+            package_code = row.get('package_code')
+            component_code = row.get('component_code')
+            if not package_code or not component_code:
+                continue
+            components = engine.direct.setdefault(package_code, {})
+            components[component_code] = components.get(component_code, 0) + _quantity_of(row)
+
+        for package_code in engine.direct:
+            engine._flatten(package_code, ())
+
+        if engine.cycles:
+            logger.warning(
+                "まとめ商品の循環参照を検出しました: "
+                + ", ".join(" → ".join(path) for path in engine.cycles)
+            )
+        return engine
+
+    def _flatten(self, package_code: str, path: Tuple[str, ...]) -> Dict[str, float]:
+        """深さ優先で展開（経路上に同じコードが現れたら循環として構成品扱い）"""
+        cached = self.flattened.get(package_code)
+        if cached is not None:
+            return cached
+
+        path = path + (package_code,)
+        result: Dict[str, float] = {}
+        for component_code, quantity in self.direct[package_code].items():
+            if component_code in path:
+                self.cycles.append(path + (component_code,))
+                leaf = {component_code: 1}
+            elif component_code in self.direct:
+                leaf = self._flatten(component_code, path)
+            else:
+                leaf = {component_code: 1}
+            for code, count in leaf.items():
+                result[code] = result.get(code, 0) + quantity * count
+
+        self.flattened[package_code] = result
+        return result
+
+    def __len__(self):
+        return len(self.direct)
+
+    def is_package(self, code: str) -> bool:
+        """まとめ商品かどうか"""
+        return code in self.direct
+
+    def components(self, package_code: str) -> Dict[str, float]:
+        """まとめ商品1個あたりの最終構成品（まとめ商品でなければ空）"""
+        return self.flattened.get(package_code, {})
+
+    def expand(self, code: str, quantity: float = 1) -> Dict[str, float]:
+        """商品をquantity個分の最終構成品に展開（まとめ商品でなければそのまま）"""
+        components = self.flattened.get(code)
+        if components is None:
+            return {code: quantity}
+        return {component_code: count * quantity for component_code, count in components.items()}
+
+    def component_rows(self, package_code: str) -> List[Dict]:
+        """package_componentsと同じ形（component_code/quantity）の行リスト"""
+        return [
+            {'package_code': package_code, 'component_code': component_code, 'quantity': quantity}
+            for component_code, quantity in self.components(package_code).items()
+        ]
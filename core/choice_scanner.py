@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+選択肢コード抽出モジュール
+楽天の選択肢テキスト（selected_choice_raw / choice_code）から選択肢コードを抽出する
+
+- choice_code_mappingに登録済みのコードはトライ木から生成した1本の正規表現で一括検出
+- 未登録のコードは従来のパターン規則（R05, A01等）で検出
+- 同じ選択肢テキストは何千回も繰り返し現れるため、結果をLRUキャッシュで再利用
+
+使い方:
+    codes = scan_choice_codes(item['choice_code'])              # [A-Z]\\d{2}
+    codes = scan_choice_codes(item['choice_code'], 'rakuten')   # R\\d{2,}
+"""
+
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# パターン規則（呼び出し元ごとに従来の抽出ルールを維持する）
+PATTERN_RULES: Dict[str, Pattern] = {
+    'standard': re.compile(r'[A-Z]\d{2}'),   # A01, R05（英字1文字+数字2桁）
+    'rakuten': re.compile(r'R\d{2,}'),       # R05, R123（R+数字2桁以上）
+    'item': re.compile(r'R\d+|S\d+'),        # R5, S01（選択肢行の商品コード）
+}
+
+
+def _trie_regex(words: Iterable[str]) -> Optional[str]:
+    """文字列集合からトライ木を組み立て、共通接頭辞をまとめた正規表現を生成"""
+    trie: Dict = {}
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def render(node: Dict) -> str:
+        terminal = '' in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        return body + '?' if terminal else body
+
+    if not trie:
+        return None
+    return render(trie)
+
+
+class ChoiceCodeScanner:
+    """選択肢コードの抽出器
+
+    登録済みコードは前後が英数字でない位置のみ一致とし（R05がR051に誤一致しないように）、
+    同じ位置では最も長いコードを採る。規則のパターンで始まらない登録済みコードは使わない
+    （'rakuten'ではC01等を抽出しない）。パターン規則の一致は、登録済みコードと重なるものを除いて
+    出現位置順にマージし、重複を除去する。
+    """
+
+    def __init__(self, known_codes: Iterable[str] = (), cache_size: Optional[int] = None):
+        known = sorted({code for code in known_codes if code})
+        self.known_codes = frozenset(known)
+        pattern = _trie_regex(known)
+        self._known_regex = (
+            re.compile(r'(?<![0-9A-Za-z])(?:' + pattern + r')(?![0-9A-Za-z])') if pattern else None
+        )
+        size = cache_size if cache_size is not None else Config.get_choice_scan_cache_size()
+        self._scan_cached = lru_cache(maxsize=size)(self._scan)
+
+    def _scan(self, text: str, rule: str) -> Tuple[str, ...]:
+        pattern = PATTERN_RULES[rule]
+        # トライ木の正規表現は貪欲に一致するため、各位置で最も長い登録済みコードが重ならずに得られる
+        known = list(self._known_regex.finditer(text)) if self._known_regex is not None else []
+        found = [(match.start(), match.group()) for match in known if pattern.match(match.group())]
+        found.extend(
+            (match.start(), match.group()) for match in pattern.finditer(text)
+            if not any(match.start() < other.end() and other.start() < match.end() for other in known)
+        )
+        found.sort(key=lambda position_code: position_code[0])
+        return tuple(dict.fromkeys(code for _, code in found))
+
+    def scan(self, text: Optional[str], rule: str = 'standard') -> List[str]:
+        """選択肢テキストからコードを抽出（出現順・重複除去）"""
+        if not text:
+            return []
+        return list(self._scan_cached(text, rule))
+
+    def first(self, text: Optional[str], rule: str = 'standard') -> str:
+        """最初に現れるコード（見つからない場合は空文字）"""
+        codes = self.scan(text, rule)
+        return codes[0] if codes else ''
+
+    def cache_info(self):
+        return self._scan_cached.cache_info()
+
+
+_default_scanner = ChoiceCodeScanner()
+_active_scanner: Optional[ChoiceCodeScanner] = None
+
+
+def set_choice_scanner(scanner: Optional[ChoiceCodeScanner]):
+    """共有の抽出器を差し替える（マッピングインデックスの再読み込み時に呼ばれる）"""
+    global _active_scanner
+    _active_scanner = scanner
+
+
+def get_choice_scanner() -> ChoiceCodeScanner:
+    """読み込み済みのマッピングインデックスの抽出器（未読み込みならパターン規則のみ）"""
+    return _active_scanner or _default_scanner
+
+
+def scan_choice_codes(text: Optional[str], rule: str = 'standard') -> List[str]:
+    """選択肢テキストからコードを抽出"""
+    return get_choice_scanner().scan(text, rule)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+列指向（DataFrame）マッピングモジュール
+1日分・1か月分のorder_itemsをまとめてDataFrameに載せ、
+    選択肢コードの展開（explode） → マッピング表との結合 → 部品表との結合 → common_code別の集計
+を一括で行う（注文アイテムごとのPythonループと辞書の組み立てを排除）
+
+マッピング表・部品表はMappingIndexから作成し、インデックスのversionが変わるまで再利用する。
+
+使い方:
+    frames = map_order_items(items, MappingIndex.get(supabase))
+    frames['changes']       # common_code, quantity_to_reduce, reasons, source_types
+    result = to_mapping_records(frames)   # InventoryMappingSystemのステップ1〜3と同じ形
+"""
+
+import logging
+import weakref
+from typing import Dict, Iterable, List, Tuple
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 構成品に展開する商品タイプ
+BUNDLE_TYPES = ("まとめ(固定)", "まとめ(複合)", "セット(固定)", "セット(選択)")
+
+SALES_COLUMNS = [
+    "type", "rakuten_code", "quantity", "order_item_id", "product_name", "source", "fallback_product_code"
+]
+
+# MappingIndex → (version, マッピング表)
+_frames_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def mapping_frames(index) -> Dict[str, pd.DataFrame]:
+    """MappingIndexから結合用のマッピング表を作成（同じversionの間はキャッシュ）"""
+    cached = _frames_cache.get(index)
+    if cached is not None and cached[0] == index.version:
+        return cached[1]
+
+    choice = pd.DataFrame(
+        [(code, row.get("common_code"), row.get("product_name")) for code, row in index.choice_codes.items()],
+        columns=["rakuten_code", "common_code", "product_name"]
+    ).set_index("rakuten_code")
+    sku = pd.DataFrame(
+        [(code, row.get("common_code"), row.get("product_name"), row.get("product_type"))
+         for code, row in index.rakuten_skus.items()],
+        columns=["rakuten_code", "common_code", "product_name", "product_type"]
+    ).set_index("rakuten_code")
+    bom = pd.DataFrame(
+        [(package_code, component_code, quantity)
+         for package_code, components in index.bom.flattened.items()
+         for component_code, quantity in components.items()],
+        columns=["common_code", "component_code", "component_quantity"]
+    )
+
+    frames = {"choice": choice, "sku": sku, "bom": bom}
+    _frames_cache[index] = (index.version, frames)
+    return frames
+
+
+def items_frame(items: Iterable[Dict]) -> pd.DataFrame:
+    """order_itemsの行リストをDataFrameに変換（必要な列がなければ補う）"""
+    frame = pd.DataFrame(list(items))
+    for column in ("id", "order_id", "quantity", "choice_code", "product_code", "product_name", "rakuten_item_number"):
+        if column not in frame.columns:
+            frame[column] = None
+    frame["choice_code"] = frame["choice_code"].fillna("").astype(str)
+    return frame.reset_index(drop=True)
+
+
+def explode_choice_codes(items: pd.DataFrame, scanner, rule: str = "standard") -> pd.DataFrame:
+    """選択肢テキストから抽出したコードを1コード1行に展開（列: choice_code_value）
+
+    同じ選択肢テキストは1回だけ抽出する。コードが抽出できなかった行は含まれない。
+    """
+    texts = items["choice_code"]
+    codes_by_text = {text: scanner.scan(text, rule) for text in texts.unique()}
+    exploded = items.assign(choice_code_value=texts.map(codes_by_text)).explode("choice_code_value")
+    return exploded[exploded["choice_code_value"].notna()]
+
+
+def build_sales_frame(items: pd.DataFrame, scanner) -> pd.DataFrame:
+    """ステップ1: 選択肢商品・通常商品の在庫変動データ（元の並び順を維持）"""
+    items = items.assign(_position=range(len(items)))
+    has_choice = items["choice_code"] != ""
+
+    exploded = explode_choice_codes(items[has_choice], scanner)
+    choice_sales = pd.DataFrame({
+        "_position": exploded["_position"],
+        "type": "choice_item",
+        "rakuten_code": exploded["choice_code_value"].astype(str),
+        "quantity": exploded["quantity"],
+        "order_item_id": exploded["id"],
+        "product_name": "選択肢商品 " + exploded["choice_code_value"].astype(str),
+        "source": "楽天選択肢",
+        "fallback_product_code": None,
+    })
+
+    normal = items[~has_choice]
+    # 楽天SKU（rakuten_item_number）、なければproduct_code
+    rakuten_code = normal["rakuten_item_number"].where(
+        normal["rakuten_item_number"].notna() & (normal["rakuten_item_number"].astype(str) != ""),
+        normal["product_code"]
+    )
+    normal_sales = pd.DataFrame({
+        "_position": normal["_position"],
+        "type": "normal_item",
+        "rakuten_code": rakuten_code.fillna(""),
+        "quantity": normal["quantity"],
+        "order_item_id": normal["id"],
+        "product_name": normal["product_name"],
+        "source": "楽天通常商品",
+        "fallback_product_code": normal["product_code"],
+    })
+
+    sales = pd.concat([choice_sales, normal_sales], ignore_index=True)
+    sales = sales.sort_values("_position", kind="stable").drop(columns="_position")
+    return sales.reset_index(drop=True)
+
+
+def map_sales_frame(sales: pd.DataFrame, frames: Dict[str, pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """ステップ2: マッピング表と結合して共通コードを付与し、(マッピング成功, 失敗) に分ける"""
+    choice = frames["choice"]
+    sku = frames["sku"]
+    is_choice = sales["type"] == "choice_item"
+    code = sales["rakuten_code"].astype(str)
+
+    # 通常商品は楽天SKU → product_codeの順で検索
+    primary_hit = ~is_choice & (code != "") & code.isin(sku.index)
+    fallback = sales["fallback_product_code"].where(sales["fallback_product_code"].notna(), "").astype(str)
+    fallback_hit = ~is_choice & ~primary_hit & (fallback != "") & (fallback != code) & fallback.isin(sku.index)
+    choice_hit = is_choice & code.isin(choice.index)
+
+    sku_key = code.where(primary_hit, fallback)
+    mapped = sales.assign(
+        common_code=None, mapped_product_name=None, item_type="単品"
+    )
+    mapped.loc[choice_hit, "common_code"] = code[choice_hit].map(choice["common_code"])
+    mapped.loc[choice_hit, "mapped_product_name"] = code[choice_hit].map(choice["product_name"])
+    sku_hit = primary_hit | fallback_hit
+    mapped.loc[sku_hit, "common_code"] = sku_key[sku_hit].map(sku["common_code"])
+    mapped.loc[sku_hit, "mapped_product_name"] = sku_key[sku_hit].map(sku["product_name"])
+    mapped.loc[sku_hit, "item_type"] = sku_key[sku_hit].map(sku["product_type"]).fillna("単品")
+
+    hit = choice_hit | sku_hit
+    return mapped[hit], sales[~hit]
+
+
+def expand_bundles(mapped: pd.DataFrame, frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """ステップ3: まとめ商品を部品表で構成品に展開し、common_code別に集計"""
+    bom = frames["bom"]
+    mapped = mapped.assign(_sequence=range(len(mapped)))
+    is_bundle = mapped["item_type"].isin(BUNDLE_TYPES)
+    has_components = is_bundle & mapped["common_code"].isin(bom["common_code"])
+
+    components = mapped[has_components].merge(bom, on="common_code", how="inner", sort=False)
+    component_changes = pd.DataFrame({
+        "_sequence": components["_sequence"],
+        "common_code": components["component_code"],
+        "quantity_to_reduce": components["quantity"] * components["component_quantity"],
+        "reason": "まとめ商品 " + components["common_code"].astype(str) + " 売上",
+        "source_type": "まとめ商品構成品",
+    })
+
+    undefined = mapped[is_bundle & ~has_components]
+    single = mapped[~is_bundle]
+    direct_changes = pd.DataFrame({
+        "_sequence": pd.concat([undefined["_sequence"], single["_sequence"]]),
+        "common_code": pd.concat([undefined["common_code"], single["common_code"]]),
+        "quantity_to_reduce": pd.concat([undefined["quantity"], single["quantity"]]),
+        "reason": ["まとめ商品（構成品未定義）"] * len(undefined) + ["楽天単品売上"] * len(single),
+        "source_type": ["まとめ商品"] * len(undefined) + ["単品"] * len(single),
+    })
+
+    changes = pd.concat([component_changes, direct_changes], ignore_index=True)
+    changes = changes.sort_values("_sequence", kind="stable")
+    return changes.groupby("common_code", sort=False).agg(
+        quantity_to_reduce=("quantity_to_reduce", "sum"),
+        reasons=("reason", list),
+        source_types=("source_type", lambda values: [values.iloc[0]]),
+    ).reset_index()
+
+
+def map_order_items(items: Iterable[Dict], index) -> Dict[str, pd.DataFrame]:
+    """order_itemsをステップ1〜3まで一括処理
+
+    Returns:
+        {'sales': 在庫変動データ, 'mapped': マッピング成功, 'unmapped': マッピング失敗,
+         'changes': common_code別の最終在庫変動}
+    """
+    frames = mapping_frames(index)
+    sales = build_sales_frame(items_frame(items), index.choice_scanner)
+    mapped, unmapped = map_sales_frame(sales, frames)
+    changes = expand_bundles(mapped, frames)
+    logger.info(
+        f"列指向マッピング: 在庫変動データ{len(sales)}件, マッピング成功{len(mapped)}件, "
+        f"失敗{len(unmapped)}件, 最終在庫変動{len(changes)}商品"
+    )
+    return {"sales": sales, "mapped": mapped, "unmapped": unmapped, "changes": changes}
+
+
+def _sales_record(row: Dict) -> Dict:
+    record = {column: row[column] for column in SALES_COLUMNS}
+    if record["type"] == "choice_item":
+        del record["fallback_product_code"]
+    return record
+
+
+def to_mapping_records(frames: Dict[str, pd.DataFrame]) -> Dict[str, List[Dict]]:
+    """map_order_itemsの結果をInventoryMappingSystemのステップ1〜3と同じ辞書リストに変換"""
+    sales = [_sales_record(row) for row in frames["sales"].to_dict("records")]
+    mapped_items = [
+        {
+            "common_code": row["common_code"],
+            "quantity": row["quantity"],
+            "item_type": row["item_type"],
+            "source_item": _sales_record(row),
+            "product_name": row["mapped_product_name"],
+        }
+        for row in frames["mapped"].to_dict("records")
+    ]
+    unmapped_items = [_sales_record(row) for row in frames["unmapped"].to_dict("records")]
+    return {
+        "rakuten_sales": sales,
+        "mapped_items": mapped_items,
+        "unmapped_items": unmapped_items,
+        "inventory_changes": frames["changes"].to_dict("records"),
+    }
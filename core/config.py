@@ -37,9 +37,170 @@ class Config:
     def SUPABASE_KEY(self):
         return os.getenv('SUPABASE_KEY')
     
+    # Supabase接続プール設定
+    @classmethod
+    def get_supabase_pool_size(cls):
+        return int(os.getenv('SUPABASE_POOL_SIZE', '20'))
+
+    @classmethod
+    def get_supabase_keepalive_expiry(cls):
+        return float(os.getenv('SUPABASE_KEEPALIVE_EXPIRY', '60'))
+
+    @classmethod
+    def get_supabase_timeout(cls):
+        return float(os.getenv('SUPABASE_TIMEOUT', '30'))
+
+    @classmethod
+    def get_supabase_connect_timeout(cls):
+        return float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '10'))
+
+    @classmethod
+    def get_db_executor_workers(cls):
+        return int(os.getenv('DB_EXECUTOR_WORKERS', str(cls.get_supabase_pool_size())))
+
+    @classmethod
+    def is_supabase_http2_enabled(cls):
+        return os.getenv('SUPABASE_HTTP2', 'true').lower() in ('1', 'true', 'yes')
+
+    # IN句分割取得の設定
+    @classmethod
+    def get_in_query_max_chars(cls):
+        return int(os.getenv('IN_QUERY_MAX_CHARS', '4000'))
+
+    @classmethod
+    def get_in_query_max_items(cls):
+        return int(os.getenv('IN_QUERY_MAX_ITEMS', '200'))
+
+    @classmethod
+    def get_in_query_concurrency(cls):
+        return int(os.getenv('IN_QUERY_CONCURRENCY', '4'))
+
+    # マッピングインデックスの有効期限（秒）
+    @classmethod
+    def get_mapping_index_ttl(cls):
+        return int(os.getenv('MAPPING_INDEX_TTL_SECONDS', '600'))
+
+    # 商品名のあいまい一致を採用する最低スコア（bi-gram Dice係数）
+    @classmethod
+    def get_name_match_min_score(cls):
+        return float(os.getenv('NAME_MATCH_MIN_SCORE', '0.8'))
+
+    # 商品名の部分一致（検索語を含む名前）を採用する最低スコア（短すぎる検索語で無関係な商品に一致しないように）
+    @classmethod
+    def get_name_partial_min_score(cls):
+        return float(os.getenv('NAME_PARTIAL_MIN_SCORE', '0.5'))
+
+    # 選択肢コード抽出結果のキャッシュ件数
+    @classmethod
+    def get_choice_scan_cache_size(cls):
+        return int(os.getenv('CHOICE_SCAN_CACHE_SIZE', '8192'))
+
+    # 注文アイテムのマッピングをDataFrameで一括処理するか（列指向モード）
+    @classmethod
+    def is_columnar_mapping_enabled(cls):
+        return os.getenv('COLUMNAR_MAPPING', 'false').lower() in ('1', 'true', 'yes')
+
+    # 在庫スナップショットを保存する間隔（日）
+    @classmethod
+    def get_ledger_snapshot_interval_days(cls):
+        return int(os.getenv('LEDGER_SNAPSHOT_INTERVAL_DAYS', '7'))
+
+    # 在庫減算を1回のRPCで適用する注文アイテム数
+    @classmethod
+    def get_reduction_batch_size(cls):
+        return int(os.getenv('REDUCTION_BATCH_SIZE', '200'))
+
+    # 返品・キャンセルの在庫戻しを1回のRPCで適用する注文数
+    @classmethod
+    def get_return_batch_size(cls):
+        return int(os.getenv('RETURN_BATCH_SIZE', '200'))
+
+    # 注文取り込み時に在庫を即時減算するか（未減算分は日次処理で減算される）
+    @classmethod
+    def is_realtime_deduction_enabled(cls):
+        return os.getenv('REALTIME_DEDUCTION', 'false').lower() in ('1', 'true', 'yes')
+
+    @classmethod
+    def get_deduction_queue_max_items(cls):
+        return int(os.getenv('DEDUCTION_QUEUE_MAX_ITEMS', '5000'))
+
+    @classmethod
+    def get_deduction_flush_seconds(cls):
+        return float(os.getenv('DEDUCTION_FLUSH_SECONDS', '2'))
+
+    @classmethod
+    def get_deduction_enqueue_timeout(cls):
+        return float(os.getenv('DEDUCTION_ENQUEUE_TIMEOUT', '1'))
+
+    # 需要予測・発注点（core.forecast）
+    @classmethod
+    def get_forecast_lookback_days(cls):
+        return int(os.getenv('FORECAST_LOOKBACK_DAYS', '84'))
+
+    @classmethod
+    def get_forecast_ma_window(cls):
+        return int(os.getenv('FORECAST_MA_WINDOW', '28'))
+
+    @classmethod
+    def get_forecast_smoothing_alpha(cls):
+        return float(os.getenv('FORECAST_SMOOTHING_ALPHA', '0.3'))
+
+    @classmethod
+    def get_forecast_lead_time_days(cls):
+        return int(os.getenv('FORECAST_LEAD_TIME_DAYS', '7'))
+
+    @classmethod
+    def get_forecast_safety_z(cls):
+        return float(os.getenv('FORECAST_SAFETY_Z', '1.65'))
+
+    @classmethod
+    def get_forecast_cover_days(cls):
+        return int(os.getenv('FORECAST_COVER_DAYS', '30'))
+
     # 楽天API設定
     RAKUTEN_SERVICE_SECRET = os.getenv('RAKUTEN_SERVICE_SECRET')
     RAKUTEN_LICENSE_KEY = os.getenv('RAKUTEN_LICENSE_KEY')
+
+    # 楽天RMS APIの同時実行数とレート制限
+    @classmethod
+    def get_rakuten_max_concurrency(cls):
+        return int(os.getenv('RAKUTEN_MAX_CONCURRENCY', '3'))
+
+    @classmethod
+    def get_rakuten_requests_per_second(cls):
+        return float(os.getenv('RAKUTEN_REQUESTS_PER_SECOND', '1'))
+
+    @classmethod
+    def get_rakuten_burst(cls):
+        return float(os.getenv('RAKUTEN_BURST', '2'))
+
+    @classmethod
+    def get_rakuten_max_retries(cls):
+        return int(os.getenv('RAKUTEN_MAX_RETRIES', '5'))
+
+    # Amazon SP-APIの同時実行数とリトライ回数（レートは操作ごとの使用量制限に従う）
+    @classmethod
+    def get_amazon_max_concurrency(cls):
+        return int(os.getenv('AMAZON_MAX_CONCURRENCY', '10'))
+
+    @classmethod
+    def get_amazon_max_retries(cls):
+        return int(os.getenv('AMAZON_MAX_RETRIES', '5'))
+
+    # 差分同期でカーソルより前に遡って再取得する時間（分）
+    @classmethod
+    def get_sync_overlap_minutes(cls):
+        return int(os.getenv('SYNC_OVERLAP_MINUTES', '30'))
+
+    # 注文ステータスの変更（キャンセル・返品など）を検出するため、取り直す注文日の期間（日）
+    @classmethod
+    def get_order_status_window_days(cls):
+        return int(os.getenv('ORDER_STATUS_WINDOW_DAYS', '30'))
+    
+    # ステータス変更の検出のため、上の期間の注文を取り直す間隔（時間）
+    @classmethod
+    def get_order_status_recheck_hours(cls):
+        return int(os.getenv('ORDER_STATUS_RECHECK_HOURS', '24'))
     
     # Google Sheets設定
     GOOGLE_CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE')
@@ -3,10 +3,20 @@
 """
 データベース接続管理モジュール
 Supabaseクライアントの初期化と接続管理
+
+プロセス内で1つのクライアントを共有し、PostgRESTのHTTPセッションは
+コネクションプール（HTTP/2・keep-alive）で再利用する
+async関数からは execute_async / run_sync でスレッドプール経由で実行し、
+イベントループをブロックしない
 """
 
+import asyncio
+import functools
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
+import httpx
 from supabase import create_client, Client
 from .config import Config
 
@@ -14,21 +24,29 @@ logger = logging.getLogger(__name__)
 
 class Database:
     """データベース接続管理クラス"""
-    
+
     _instance: Optional[Client] = None
-    
+    _lock = threading.Lock()
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.Lock()
+
     @classmethod
     def get_client(cls) -> Optional[Client]:
         """Supabaseクライアントを取得"""
         if cls._instance is None:
-            cls._instance = cls._initialize_client()
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls._initialize_client()
         return cls._instance
-    
+
     @classmethod
     def reset_client(cls):
         """クライアントをリセット（環境変数変更時に使用）"""
-        cls._instance = None
-    
+        with cls._lock:
+            if cls._instance is not None:
+                cls._close_session(cls._instance)
+            cls._instance = None
+
     @classmethod
     def _initialize_client(cls) -> Optional[Client]:
         """Supabaseクライアントを初期化"""
@@ -36,26 +54,86 @@ class Database:
             # 動的に環境変数を取得
             supabase_url = Config.get_supabase_url()
             supabase_key = Config.get_supabase_key()
-            
+
             if not supabase_url or not supabase_key:
                 logger.warning("Supabase認証情報が設定されていません")
                 return None
-            
+
             client = create_client(supabase_url, supabase_key)
+            cls._install_pooled_session(client)
             logger.info(f"Supabaseクライアントを正常に初期化しました: {supabase_url}")
             return client
-            
+
         except Exception as e:
             logger.error(f"Supabaseクライアントの初期化に失敗しました: {e}")
             return None
-    
+
+    @classmethod
+    def create_session(cls, base_url: str, headers: dict) -> httpx.Client:
+        """コネクションプール付きのHTTPセッションを作成"""
+        limits = httpx.Limits(
+            max_connections=Config.get_supabase_pool_size(),
+            max_keepalive_connections=Config.get_supabase_pool_size(),
+            keepalive_expiry=Config.get_supabase_keepalive_expiry()
+        )
+        timeout = httpx.Timeout(
+            Config.get_supabase_timeout(),
+            connect=Config.get_supabase_connect_timeout()
+        )
+        options = dict(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=limits,
+            follow_redirects=True
+        )
+
+        if Config.is_supabase_http2_enabled():
+            try:
+                return httpx.Client(http2=True, **options)
+            except ImportError:
+                # h2パッケージが未インストールの場合はHTTP/1.1で接続
+                logger.warning("h2パッケージがないためHTTP/1.1 keep-aliveで接続します")
+        return httpx.Client(**options)
+
+    @classmethod
+    def _install_pooled_session(cls, client: Client):
+        """PostgRESTクライアントのセッションをプール付きセッションに差し替える"""
+        postgrest = client.postgrest
+        default_session = postgrest.session
+        postgrest.session = cls.create_session(
+            base_url=str(default_session.base_url),
+            headers=dict(default_session.headers)
+        )
+        default_session.close()
+
+    @classmethod
+    def _close_session(cls, client: Client):
+        """PostgRESTセッションのコネクションを解放"""
+        try:
+            client.postgrest.session.close()
+        except Exception as e:
+            logger.warning(f"Supabaseセッションのクローズに失敗しました: {e}")
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """DBアクセス用のスレッドプールを取得（同時実行数はプールサイズで制限）"""
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=Config.get_db_executor_workers(),
+                        thread_name_prefix="supabase"
+                    )
+        return cls._executor
+
     @classmethod
     def test_connection(cls) -> bool:
         """データベース接続をテスト"""
         client = cls.get_client()
         if not client:
             return False
-        
+
         try:
             # platformテーブルから1件取得してテスト
             result = client.table("platform").select("id").limit(1).execute()
@@ -64,8 +142,23 @@ class Database:
             logger.error(f"データベース接続テストに失敗しました: {e}")
             return False
 
+async def run_sync(func, *args, **kwargs):
+    """同期関数をDB用スレッドプールで実行して結果を待つ"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        Database.get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+async def execute_async(query):
+    """PostgRESTクエリの.execute()をイベントループをブロックせずに実行"""
+    return await run_sync(query.execute)
+
+async def gather_queries(*queries):
+    """互いに依存しない複数のクエリを同時に実行"""
+    return await asyncio.gather(*(execute_async(query) for query in queries))
+
 # グローバルなSupabaseクライアントインスタンス（動的に取得）
 def get_supabase():
     return Database.get_client()
 
-supabase = get_supabase()
\ No newline at end of file
+supabase = get_supabase()
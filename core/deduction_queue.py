@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+注文取り込み時の在庫減算キュー
+保存した注文アイテムをプロセス内のasyncioキューに積み、ワーカーが数秒分をまとめて
+1回の減算（reducer）で適用する。深夜の日次処理を待たずに在庫を減らすための任意の機能。
+
+- キューの上限（アイテム数）を超える場合は、取り込み側を最大enqueue_timeout秒待たせ、
+  それでも空かなければ積まずに諦める（バックプレッシャー）
+- 積めなかったアイテムや減算に失敗したアイテムは減算済みマークが付かないため、
+  日次処理（InventoryMappingSystem.run_pending）の未減算アイテムとして処理される
+
+使い方:
+    queue = DeductionQueue(InventoryMappingSystem().reduce_new_items)
+    await queue.start()
+    ...
+    await queue.submit(inserted_rows)   # order_itemsにinsertした行
+    queue.submit_threadsafe(inserted_rows)  # スレッドプールで実行中の同期処理から積む場合
+    ...
+    await queue.stop()
+"""
+
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+from .config import Config
+from .database import run_sync
+
+logger = logging.getLogger(__name__)
+
+
+class DeductionQueue:
+    """注文アイテムを短時間まとめて在庫を減算するキュー
+
+    reducerは注文アイテムのリストを受け取って減算する同期関数（DB用スレッドプールで実行する）。
+    """
+
+    def __init__(self, reducer: Callable[[List[Dict]], Dict], max_items: Optional[int] = None,
+                 batch_size: Optional[int] = None, flush_seconds: Optional[float] = None,
+                 enqueue_timeout: Optional[float] = None):
+        self.reducer = reducer
+        self.max_items = max_items or Config.get_deduction_queue_max_items()
+        self.batch_size = batch_size or Config.get_reduction_batch_size()
+        self.flush_seconds = flush_seconds if flush_seconds is not None else Config.get_deduction_flush_seconds()
+        self.enqueue_timeout = (enqueue_timeout if enqueue_timeout is not None
+                                else Config.get_deduction_enqueue_timeout())
+        self.stats = {'submitted': 0, 'dropped': 0, 'applied': 0, 'failed': 0, 'batches': 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def pending(self) -> int:
+        """キューに積まれている未処理のアイテム数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """ワーカーを起動（イベントループ上で呼び出す）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_items)
+        self._loop = asyncio.get_running_loop()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"在庫減算キューを開始しました（上限{self.max_items}件, {self.flush_seconds}秒ごと）")
+
+    async def stop(self, drain: bool = True):
+        """ワーカーを停止（drain=Trueの場合は積まれているアイテムを減算してから停止）"""
+        if not self.running:
+            return
+        if drain:
+            await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        logger.info(f"在庫減算キューを停止しました: {self.stats}")
+
+    async def submit(self, items: Iterable[Dict]) -> int:
+        """注文アイテムをキューに積み、積めた件数を返す
+
+        キューが一杯の場合は空くまで最大enqueue_timeout秒待ち、それでも空かなければ
+        残りを積まずに返す（日次処理で減算される）
+        """
+        items = [item for item in items if item.get('id') is not None]
+        if not self.running or not items:
+            return 0
+
+        deadline = time.monotonic() + self.enqueue_timeout
+        accepted = 0
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                try:
+                    await asyncio.wait_for(self._queue.put(item), max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    break
+            accepted += 1
+
+        self.stats['submitted'] += accepted
+        if accepted < len(items):
+            self.stats['dropped'] += len(items) - accepted
+            logger.warning(f"在庫減算キューが一杯のため{len(items) - accepted}件を日次処理に回します")
+        return accepted
+
+    def submit_threadsafe(self, items: Iterable[Dict]) -> int:
+        """イベントループ以外のスレッド（run_syncで実行中の同期処理など）からキューに積む
+
+        積み終わる（またはenqueue_timeout秒で諦める）まで呼び出し元のスレッドを待たせる
+        """
+        if not self.running:
+            return 0
+        return asyncio.run_coroutine_threadsafe(self.submit(list(items)), self._loop).result()
+
+    async def _next_batch(self) -> List[Dict]:
+        """最初の1件を待ち、flush_seconds秒またはbatch_size件までまとめて取り出す"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await run_sync(self.reducer, batch)
+                self.stats['applied'] += len(batch)
+                self.stats['batches'] += 1
+            except Exception as e:
+                # 減算済みマークが付いていないため、日次処理で減算される
+                self.stats['failed'] += len(batch)
+                logger.error(f"在庫の即時減算に失敗しました（{len(batch)}件は日次処理に回します）: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
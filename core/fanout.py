@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IN句分割取得モジュール
+大量のIDを .in_() に渡すとURL長の上限を超えるため、
+URLに収まるチャンクに分割して並列に取得し、結果を結合する
+
+使い方:
+    rows, chunk_stats = await afetch_in_chunks(
+        lambda: supabase.table('order_items').select('order_id, quantity'),
+        'order_id', order_ids
+    )
+"""
+
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+from .config import Config
+from .pagination import afetch_all, fetch_all
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_values(values: Iterable, max_chars: int = None, max_items: int = None) -> List[List]:
+    """IN句の値リストをURLに収まるチャンクに分割（重複は除去）
+
+    Args:
+        values: IN句に渡す値
+        max_chars: 1チャンクあたりの値の合計文字数（カンマ区切り込み）の上限
+        max_items: 1チャンクあたりの件数の上限
+    """
+    max_chars = max_chars or Config.get_in_query_max_chars()
+    max_items = max_items or Config.get_in_query_max_items()
+
+    chunks = []
+    current = []
+    current_chars = 0
+    for value in dict.fromkeys(values):
+        # URLエンコード後の長さを概算（非ASCIIは3倍）
+        text = str(value)
+        size = len(text.encode('utf-8')) * 3 if not text.isascii() else len(text)
+        size += 1  # 区切りのカンマ
+        if current and (current_chars + size > max_chars or len(current) >= max_items):
+            chunks.append(current)
+            current = []
+            current_chars = 0
+        current.append(value)
+        current_chars += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _chunk_stat(index: int, chunk: List, rows: List[Dict], started: float) -> Dict:
+    return {
+        'chunk': index,
+        'values': len(chunk),
+        'rows': len(rows),
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+
+async def afetch_in_chunks(query_factory: Callable, column: str, values: Iterable,
+                           concurrency: int = None, key: str = 'id',
+                           max_chars: int = None, max_items: int = None) -> Tuple[List[Dict], List[Dict]]:
+    """IN句をチャンク分割し、同時実行数を制限して並列取得
+
+    各チャンクの結果が1000件を超える場合もページングで全件取得する。
+
+    Returns:
+        (結合した行リスト, チャンクごとの件数・所要時間のリスト)
+    """
+    chunks = chunk_values(values, max_chars, max_items)
+    if not chunks:
+        return [], []
+
+    semaphore = asyncio.Semaphore(concurrency or Config.get_in_query_concurrency())
+
+    async def fetch_chunk(index: int, chunk: List):
+        async with semaphore:
+            started = time.monotonic()
+            rows = await afetch_all(lambda: query_factory().in_(column, chunk), key=key)
+            return rows, _chunk_stat(index, chunk, rows, started)
+
+    results = await asyncio.gather(*(fetch_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+
+    rows = []
+    chunk_stats = []
+    for chunk_rows, stat in results:
+        rows.extend(chunk_rows)
+        chunk_stats.append(stat)
+
+    logger.debug(f"IN句分割取得: {column} {len(chunks)}チャンク, {len(rows)}件, "
+                 f"最大{max(s['elapsed_ms'] for s in chunk_stats)}ms")
+    return rows, chunk_stats
+
+
+def fetch_in_chunks(query_factory: Callable, column: str, values: Iterable,
+                    concurrency: int = None, key: str = 'id',
+                    max_chars: int = None, max_items: int = None) -> Tuple[List[Dict], List[Dict]]:
+    """afetch_in_chunksの同期版（バッチ処理・スクリプト用）"""
+    chunks = chunk_values(values, max_chars, max_items)
+    if not chunks:
+        return [], []
+
+    def fetch_chunk(args):
+        index, chunk = args
+        started = time.monotonic()
+        rows = fetch_all(lambda: query_factory().in_(column, chunk), key=key)
+        return rows, _chunk_stat(index, chunk, rows, started)
+
+    with ThreadPoolExecutor(max_workers=concurrency or Config.get_in_query_concurrency()) as executor:
+        results = list(executor.map(fetch_chunk, enumerate(chunks)))
+
+    rows = []
+    chunk_stats = []
+    for chunk_rows, stat in results:
+        rows.extend(chunk_rows)
+        chunk_stats.append(stat)
+    return rows, chunk_stats
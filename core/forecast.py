@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+需要予測・発注点モジュール
+在庫台帳の売上から 共通コード × 日 の需要行列を作り、全商品の予測をNumPyで一括計算する
+
+- 移動平均（直近ma_window日）
+- 単純指数平滑（全期間の重み付き和として1回の行列積で計算）
+- 曜日別の季節指数（売上日数の少ない商品は全商品の曜日パターンに寄せる）
+- リードタイム中の予測需要 + 安全在庫 = 発注点、在庫日数、推奨補充数
+
+売上は RPC（daily_sales_matrix）で日別に集計して1回で取得する（SQLは sql/create_daily_demand.sql）。
+台帳にはすべてのプラットフォームの売上が記録されるため、需要はプラットフォーム合計になる。
+計算結果はプロセス内で共有し、台帳に新しい行が追加されるか日付が変わるまで再利用する。
+
+使い方:
+    forecast = RestockForecast.get(supabase)
+    forecast.recommendations()                   # 補充が必要な商品（優先度順）
+    forecast.for_code('S01')
+"""
+
+import math
+import logging
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Mapping, Optional, Tuple
+import numpy as np
+from .config import Config
+from .database import Database
+from .ledger import LEDGER_TABLE, InventoryLedger, as_of_timestamp
+from .pagination import fetch_all
+from .stock import REASON_SALE
+
+logger = logging.getLogger(__name__)
+
+DEMAND_RPC = 'daily_sales_matrix'
+
+# 曜日指数を全商品のパターンに寄せる強さ（売上日数に換算）
+SEASONAL_PRIOR_DAYS = 28
+
+# 在庫日数の表示上限（需要がない商品）
+MAX_DAYS_OF_COVER = 999
+
+PRIORITY_HIGH = 'high'
+PRIORITY_MEDIUM = 'medium'
+PRIORITY_LOW = 'low'
+
+
+def demand_matrix(sales: Mapping[str, Mapping[str, int]], start: date, days: int,
+                  codes: Optional[List[str]] = None) -> Tuple[List[str], np.ndarray]:
+    """{共通コード: {日付: 売上数}} を 商品数 × 日数 の行列に変換（列はstartからの日付順）"""
+    codes = sorted(set(codes or []) | set(sales))
+    index = {code: i for i, code in enumerate(codes)}
+    matrix = np.zeros((len(codes), days), dtype=np.float64)
+    for code, daily in sales.items():
+        row = index[code]
+        for day, quantity in daily.items():
+            column = (date.fromisoformat(str(day)[:10]) - start).days
+            if 0 <= column < days:
+                matrix[row, column] += float(quantity or 0)
+    return codes, matrix
+
+
+def moving_average(matrix: np.ndarray, window: int) -> np.ndarray:
+    """直近window日の平均"""
+    window = max(1, min(window, matrix.shape[1]))
+    return matrix[:, -window:].mean(axis=1)
+
+
+def exponential_smoothing(matrix: np.ndarray, alpha: float) -> np.ndarray:
+    """単純指数平滑の最終水準（初期値は最初の日の値）
+
+    level_t = alpha * x_t + (1 - alpha) * level_(t-1) を展開した重みで、全商品を1回の行列積で求める
+    """
+    days = matrix.shape[1]
+    if days == 0:
+        return np.zeros(matrix.shape[0])
+    decay = (1 - alpha) ** np.arange(days - 1, -1, -1)
+    weights = alpha * decay
+    return matrix @ weights + (1 - alpha) ** days * matrix[:, 0]
+
+
+def weekday_profile(matrix: np.ndarray, start: date, prior_days: int = SEASONAL_PRIOR_DAYS) -> np.ndarray:
+    """商品数 × 7（月曜=0）の曜日指数（平均が1になる倍率）"""
+    weekdays = (start.weekday() + np.arange(matrix.shape[1])) % 7
+    counts = np.bincount(weekdays, minlength=7).astype(np.float64)
+    counts[counts == 0] = 1
+
+    sums = np.zeros((matrix.shape[0], 7))
+    for weekday in range(7):
+        sums[:, weekday] = matrix[:, weekdays == weekday].sum(axis=1)
+    weekday_mean = sums / counts
+    overall = weekday_mean.mean(axis=1, keepdims=True)
+    own = np.divide(weekday_mean, overall, out=np.ones_like(weekday_mean), where=overall > 0)
+
+    total = weekday_mean.sum(axis=0)
+    shared = total / total.mean() if total.mean() > 0 else np.ones(7)
+
+    # 売上のあった日数が少ない商品ほど全商品の曜日パターンを使う
+    sales_days = (matrix > 0).sum(axis=1, keepdims=True)
+    weight = sales_days / (sales_days + prior_days)
+    return weight * own + (1 - weight) * shared
+
+
+def forecast_days(level: np.ndarray, profile: np.ndarray, first_day: date, horizon: int) -> np.ndarray:
+    """first_dayからhorizon日分の日別予測（商品数 × horizon）"""
+    weekdays = (first_day.weekday() + np.arange(horizon)) % 7
+    return level[:, None] * profile[:, weekdays]
+
+
+class RestockForecast:
+    """全商品の需要予測と発注点（台帳に新しい行が追加されるか日付が変わるまで結果を再利用）"""
+
+    _shared: Optional['RestockForecast'] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, client=None, lookback_days: Optional[int] = None, lead_time_days: Optional[int] = None):
+        self._client = client
+        self.lookback_days = lookback_days or Config.get_forecast_lookback_days()
+        self.lead_time_days = lead_time_days or Config.get_forecast_lead_time_days()
+        self.ma_window = Config.get_forecast_ma_window()
+        self.alpha = Config.get_forecast_smoothing_alpha()
+        self.safety_z = Config.get_forecast_safety_z()
+        self.cover_days = Config.get_forecast_cover_days()
+        self._lock = threading.Lock()
+
+        self.ledger_id = None
+        self.as_of: Optional[date] = None
+        self.computed_at: Optional[str] = None
+        self.codes: List[str] = []
+        self.rows: Dict[str, Dict] = {}
+
+    @classmethod
+    def get(cls, client=None) -> 'RestockForecast':
+        """プロセス内で共有される予測を取得（台帳か日付が変わっていれば再計算）"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(client)
+            elif client is not None and cls._shared._client is None:
+                cls._shared._client = client
+        cls._shared.ensure_fresh()
+        return cls._shared
+
+    @property
+    def client(self):
+        return self._client or Database.get_client()
+
+    def latest_ledger_id(self):
+        """台帳の最新の行のid（新しい売上・製造などが記録されると変わる）"""
+        result = self.client.table(LEDGER_TABLE).select("id").order("id", desc=True).limit(1).execute()
+        return result.data[0]['id'] if result.data else None
+
+    def _is_fresh(self, latest, today: date) -> bool:
+        return self.computed_at is not None and latest == self.ledger_id and today == self.as_of
+
+    def ensure_fresh(self):
+        """台帳に新しい行がある場合か、前回の計算から日付が変わった場合だけ再計算"""
+        latest = self.latest_ledger_id()
+        today = datetime.now(timezone.utc).date()
+        if self._is_fresh(latest, today):
+            return
+        with self._lock:
+            if not self._is_fresh(latest, today):
+                self.compute(today)
+                self.ledger_id = latest
+
+    def _load_sales(self, start: date, end: date) -> Dict[str, Dict[str, int]]:
+        """start〜end（両端を含む）の 共通コード → {日付: 売上数}"""
+        try:
+            result = self.client.rpc(DEMAND_RPC, {
+                'from_date': start.isoformat(),
+                'to_date': end.isoformat()
+            }).execute()
+            return result.data or {}
+        except Exception as e:
+            # RPC未作成の場合は台帳の行を読み込んで集計
+            logger.warning(f"{DEMAND_RPC} が使えないため台帳から集計します: {e}")
+        sales: Dict[str, Dict[str, int]] = {}
+        # 日の区切りはRPCと同じUTC
+        rows = InventoryLedger(self.client).transactions(
+            as_of_timestamp(datetime.combine(start - timedelta(days=1), time.max, tzinfo=timezone.utc)),
+            as_of_timestamp(datetime.combine(end, time.max, tzinfo=timezone.utc))
+        )
+        for row in rows:
+            if row.get('transaction_type') != REASON_SALE or not row.get('common_code'):
+                continue
+            day = str(row.get('occurred_at') or '')[:10]
+            daily = sales.setdefault(row['common_code'], {})
+            daily[day] = daily.get(day, 0) - int(row.get('quantity_change') or 0)
+        return sales
+
+    def compute(self, today: Optional[date] = None):
+        """today（省略時は今日）の前日までの需要行列を作り、全商品の予測・発注点を計算"""
+        today = today or datetime.now(timezone.utc).date()
+        end = today - timedelta(days=1)
+        start = end - timedelta(days=self.lookback_days - 1)
+
+        sales = self._load_sales(start, end)
+        inventory = {}
+        for row in fetch_all(lambda: self.client.table("inventory").select(
+            "id, common_code, product_name, current_stock, minimum_stock"
+        )):
+            if row.get('common_code'):
+                inventory.setdefault(row['common_code'], row)
+
+        codes, matrix = demand_matrix(sales, start, self.lookback_days, list(inventory))
+        stock = np.array([int(inventory.get(code, {}).get('current_stock') or 0) for code in codes], dtype=np.float64)
+        minimum = np.array([int(inventory.get(code, {}).get('minimum_stock') or 0) for code in codes], dtype=np.float64)
+
+        average = moving_average(matrix, self.ma_window)
+        level = exponential_smoothing(matrix, self.alpha)
+        profile = weekday_profile(matrix, start)
+        horizon = max(self.lead_time_days, self.cover_days)
+        daily = forecast_days(level, profile, today, horizon)
+
+        lead_demand = daily[:, :self.lead_time_days].sum(axis=1)
+        residual = matrix[:, -max(1, min(self.ma_window, matrix.shape[1])):] - average[:, None]
+        safety = self.safety_z * residual.std(axis=1) * math.sqrt(self.lead_time_days)
+        reorder_point = np.maximum(np.ceil(lead_demand + safety), minimum)
+        cover_demand = daily[:, :self.cover_days].mean(axis=1)
+        days_of_cover = np.divide(stock, cover_demand, out=np.full_like(stock, np.inf), where=cover_demand > 0)
+        days_of_cover = np.where(stock <= 0, 0, np.minimum(days_of_cover, MAX_DAYS_OF_COVER))
+        recommended = np.maximum(np.ceil(reorder_point + cover_demand * self.cover_days - stock), 0)
+        totals = matrix.sum(axis=1)
+        # 期間中に売上がなく最低在庫数も設定されていない商品は補充対象にしない
+        needs_restock = (stock <= reorder_point) & ((totals > 0) | (minimum > 0))
+
+        priority = np.where(
+            needs_restock & ((stock <= 0) | (days_of_cover <= self.lead_time_days)), PRIORITY_HIGH,
+            np.where(needs_restock, PRIORITY_MEDIUM, PRIORITY_LOW)
+        )
+
+        self.codes = codes
+        self.as_of = today
+        self.rows = {
+            code: {
+                'common_code': code,
+                'product_name': inventory.get(code, {}).get('product_name') or '',
+                'current_stock': int(stock[i]),
+                'total_sales': int(totals[i]),
+                'daily_average_sales': round(float(average[i]), 2),
+                'smoothed_daily_sales': round(float(level[i]), 2),
+                'forecast_daily_sales': round(float(cover_demand[i]), 2),
+                'lead_time_demand': round(float(lead_demand[i]), 1),
+                'safety_stock': round(float(safety[i]), 1),
+                'reorder_point': int(reorder_point[i]),
+                'days_of_cover': round(float(days_of_cover[i]), 1),
+                'recommended_restock_qty': int(recommended[i]) if needs_restock[i] else 0,
+                'needs_restock': bool(needs_restock[i]),
+                'priority': str(priority[i])
+            }
+            for i, code in enumerate(codes)
+        }
+        self.computed_at = datetime.now(timezone.utc).isoformat()
+        logger.info(f"需要予測: {len(codes)}商品, {start}〜{end}, 補充が必要な商品{int(needs_restock.sum())}件")
+
+    def recommendations(self, include_all: bool = False) -> List[Dict]:
+        """補充が必要な商品（include_all=Trueの場合は全商品）を優先度・在庫日数の順に返す"""
+        order = {PRIORITY_HIGH: 0, PRIORITY_MEDIUM: 1, PRIORITY_LOW: 2}
+        rows = [row for row in self.rows.values() if include_all or row['needs_restock']]
+        rows.sort(key=lambda row: (order[row['priority']], row['days_of_cover'], row['common_code']))
+        return rows
+
+    def for_code(self, common_code: str) -> Optional[Dict]:
+        """1商品の予測"""
+        return self.rows.get(common_code)
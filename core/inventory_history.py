@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+在庫履歴（inventory_history）の日次集計モジュール
+在庫台帳（inventory_transactions）からRPC（rollup_inventory_history）で
+日別・商品別の 期首在庫 / 製造 / 売上 / 調整 / 期末在庫 を集計する（SQLは sql/create_inventory_history_rollup.sql）
+
+前回の集計以降に台帳へ追加された行（返品や後から取り込んだ注文など）の発生日のうち
+最も古い日から再集計するため、過去の日付は変更があった場合だけ作り直される。
+どこまで集計したか（台帳のid）は sync_logs の cursor:inventory_history に保存する。
+
+使い方:
+    InventoryHistoryRollup(supabase).run()                          # 差分だけ集計
+    InventoryHistoryRollup(supabase).rollup(date(2025, 2, 1), date(2025, 2, 28))
+"""
+
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+from .database import Database
+from .ledger import LEDGER_TABLE
+from .sync_cursor import SyncCursor
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = 'inventory_history'
+ROLLUP_RPC = 'rollup_inventory_history'
+HISTORY_CURSOR_NAME = 'inventory_history'
+
+# 1回のRPCで集計する日数（期末在庫を繰り越すため古い期間から順に実行）
+ROLLUP_WINDOW_DAYS = 31
+
+
+def _to_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).date() if value.tzinfo else value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value)
+    if len(text) <= 10:
+        return date.fromisoformat(text)
+    return _to_date(datetime.fromisoformat(text))
+
+
+class InventoryHistoryRollup:
+    """inventory_historyの差分集計"""
+
+    def __init__(self, client=None):
+        self.client = client or Database.get_client()
+
+    def rollup(self, from_date: date, to_date: date) -> int:
+        """from_date〜to_date（両端を含む）を再集計し、書き込んだ行数を返す"""
+        written = 0
+        start = from_date
+        while start <= to_date:
+            end = min(start + timedelta(days=ROLLUP_WINDOW_DAYS - 1), to_date)
+            result = self.client.rpc(ROLLUP_RPC, {
+                'from_date': start.isoformat(),
+                'to_date': end.isoformat()
+            }).execute()
+            written += int(result.data or 0)
+            start = end + timedelta(days=1)
+        logger.info(f"在庫履歴集計: {from_date}〜{to_date} {written}行")
+        return written
+
+    def _ledger_edge(self, column: str, desc: bool, after_id: int = 0) -> Optional[Dict]:
+        """台帳のうちafter_idより後の行で、columnが最小（desc=Trueなら最大）の行"""
+        result = self.client.table(LEDGER_TABLE).select("id, occurred_at").gt(
+            "id", after_id
+        ).order(column, desc=desc).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def _last_rolled_date(self) -> Optional[date]:
+        result = self.client.table(HISTORY_TABLE).select("date").order("date", desc=True).limit(1).execute()
+        return _to_date(result.data[0]['date']) if result.data else None
+
+    def run(self, until: Optional[date] = None) -> Dict:
+        """前回の集計以降の台帳の変更に該当する日から until（省略時は今日）までを集計"""
+        until = until or datetime.now(timezone.utc).date()
+        cursor = SyncCursor.load(HISTORY_CURSOR_NAME, self.client)
+        last_id = int(cursor.value or 0)
+
+        latest = self._ledger_edge("id", desc=True)
+        earliest_new = self._ledger_edge("occurred_at", desc=False, after_id=last_id)
+        last_rolled = self._last_rolled_date()
+
+        if last_rolled is None:
+            # 初回は台帳の最初の発生日から
+            start = _to_date(earliest_new['occurred_at']) if earliest_new else until
+        else:
+            start = last_rolled + timedelta(days=1)
+            if earliest_new:
+                # 後から追加された過去日付の変動があればその日から作り直す
+                start = min(start, _to_date(earliest_new['occurred_at']))
+        start = min(start, until)
+
+        written = self.rollup(start, until)
+        high_watermark = latest['id'] if latest else last_id
+        stats = {'from_date': start.isoformat(), 'to_date': until.isoformat(), 'rows': written}
+        cursor.advance(high_watermark, stats=stats)
+        return {'status': 'success', 'ledger_id': high_watermark, **stats}
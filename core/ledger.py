@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+在庫台帳（イベントソーシング）モジュール
+inventory_transactions を追記専用の在庫台帳とし、在庫数を台帳の変動数の合計として扱う
+
+- inventory_snapshots に共通コード別の在庫数を定期的に保存する
+- 「日付Dの商品Xの在庫」は直前のスナップショットに、それ以降の変動数だけを畳み込んで求める
+- 時系列は変動の発生日時（occurred_at）で扱う。過去日付の変動が追加された場合は、
+  それ以降のスナップショットにもトリガーで同じ変動数が反映される
+- 日付だけの指定は日本時間（JST）のその日の終わりまでとして扱う
+- rebuild_current_stock で台帳とinventory.current_stockの差分を確認できる。
+  current_stockを直接更新するスクリプト（製造・初期設定・Amazon在庫減算など）の変動は
+  台帳に記録されないため、両者が一致するとは限らない
+
+台帳への記録は core/stock.py の adjust_stock が在庫更新と同じトランザクションで行う
+（テーブルは sql/create_inventory_ledger.sql）。
+
+使い方:
+    ledger = InventoryLedger(supabase)
+    ledger.stock_of('S01', date(2025, 3, 31))           # 3/31終了時点の在庫
+    ledger.stock_as_of(date(2025, 3, 31))               # 全商品
+    ledger.take_snapshot()                               # 現時点のスナップショットを保存
+    ledger.rebuild_current_stock(dry_run=True)           # 台帳とinventoryの差分を確認
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Union
+from .config import Config
+from .database import Database
+from .fanout import chunk_values, fetch_in_chunks
+from .pagination import fetch_all
+
+logger = logging.getLogger(__name__)
+
+LEDGER_TABLE = 'inventory_transactions'
+SNAPSHOT_TABLE = 'inventory_snapshots'
+
+# adjust_inventory_stockが在庫の0未満切り捨て分を記録する行のメモ
+CLAMP_NOTE = '在庫の0未満切り捨て'
+
+_WRITE_BATCH_SIZE = 500
+
+JST = timezone(timedelta(hours=9))
+
+AsOf = Union[date, datetime, str, None]
+
+
+def as_of_timestamp(as_of: AsOf = None) -> str:
+    """as_ofをISO形式の時刻に変換（日付はJSTでのその日の終わり、Noneは現在）"""
+    if as_of is None:
+        return datetime.now(timezone.utc).isoformat()
+    if isinstance(as_of, datetime):
+        return as_of.isoformat()
+    if isinstance(as_of, date):
+        return datetime.combine(as_of, time.max, tzinfo=JST).isoformat()
+    return str(as_of)
+
+
+def fold_stock(opening: Dict[str, int], transactions: Iterable[Dict]) -> Dict[str, int]:
+    """期首在庫に台帳の変動数を畳み込む"""
+    levels = dict(opening)
+    for row in transactions:
+        code = row.get('common_code')
+        if code:
+            levels[code] = levels.get(code, 0) + int(row.get('quantity_change') or 0)
+    return levels
+
+
+class InventoryLedger:
+    """在庫台帳とスナップショットによる時点在庫の計算"""
+
+    def __init__(self, client=None):
+        self.client = client or Database.get_client()
+
+    # ----- 読み取り -----
+
+    def latest_snapshot_at(self, as_of: AsOf = None) -> Optional[str]:
+        """as_of以前で最新のスナップショット時点（なければNone）"""
+        result = self.client.table(SNAPSHOT_TABLE).select("snapshot_at").lte(
+            "snapshot_at", as_of_timestamp(as_of)
+        ).order("snapshot_at", desc=True).limit(1).execute()
+        return result.data[0]['snapshot_at'] if result.data else None
+
+    def _snapshot(self, snapshot_at: str, codes: Optional[List[str]] = None) -> Dict[str, int]:
+        """スナップショットの在庫数"""
+        query = lambda: self.client.table(SNAPSHOT_TABLE).select("id, common_code, stock").eq("snapshot_at", snapshot_at)
+        if codes is None:
+            rows = fetch_all(query)
+        else:
+            rows, _ = fetch_in_chunks(query, "common_code", codes)
+        return {row['common_code']: int(row.get('stock') or 0) for row in rows}
+
+    def transactions(self, after: Optional[str], until: str, codes: Optional[List[str]] = None) -> List[Dict]:
+        """発生日時がafter（含まない）からuntil（含む）までの台帳の行"""
+        def query():
+            q = self.client.table(LEDGER_TABLE).select(
+                "id, common_code, transaction_type, quantity_change, reference_order_item_id, notes, occurred_at"
+            ).lte("occurred_at", until)
+            return q.gt("occurred_at", after) if after else q
+
+        if codes is None:
+            return fetch_all(query)
+        rows, _ = fetch_in_chunks(query, "common_code", codes)
+        return rows
+
+    def stock_as_of(self, as_of: AsOf = None, codes: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """as_of時点の共通コード別在庫数（直前のスナップショット + それ以降の変動数）
+
+        スナップショットがない場合は台帳の先頭から畳み込む。
+        """
+        until = as_of_timestamp(as_of)
+        codes = sorted(set(codes)) if codes is not None else None
+        snapshot_at = self.latest_snapshot_at(until)
+        opening = self._snapshot(snapshot_at, codes) if snapshot_at else {}
+        transactions = self.transactions(snapshot_at, until, codes)
+        levels = fold_stock(opening, transactions)
+        if codes is not None:
+            levels = {code: levels.get(code, 0) for code in codes}
+        logger.debug(f"時点在庫: {until} スナップショット{snapshot_at}, 変動{len(transactions)}件, {len(levels)}商品")
+        return levels
+
+    def stock_of(self, common_code: str, as_of: AsOf = None) -> int:
+        """1商品のas_of時点の在庫数"""
+        return self.stock_as_of(as_of, [common_code])[common_code]
+
+    # ----- スナップショット -----
+
+    def write_snapshot(self, levels: Dict[str, int], snapshot_at: AsOf = None) -> int:
+        """在庫数をスナップショットとして保存（同じ時点・共通コードは上書き）"""
+        snapshot_at = as_of_timestamp(snapshot_at)
+        rows = [
+            {'snapshot_at': snapshot_at, 'common_code': code, 'stock': int(stock)}
+            for code, stock in sorted(levels.items())
+        ]
+        for i in range(0, len(rows), _WRITE_BATCH_SIZE):
+            self.client.table(SNAPSHOT_TABLE).upsert(
+                rows[i:i + _WRITE_BATCH_SIZE], on_conflict="snapshot_at,common_code"
+            ).execute()
+        logger.info(f"在庫スナップショット保存: {snapshot_at} {len(rows)}商品")
+        return len(rows)
+
+    def take_snapshot(self, as_of: AsOf = None) -> int:
+        """as_of時点の在庫を台帳から求めてスナップショットを保存"""
+        snapshot_at = as_of_timestamp(as_of)
+        return self.write_snapshot(self.stock_as_of(snapshot_at), snapshot_at)
+
+    def take_snapshot_if_due(self) -> Optional[int]:
+        """最新のスナップショットがLEDGER_SNAPSHOT_INTERVAL_DAYS日以上前なら保存（初回はinventoryから作成）"""
+        latest = self.latest_snapshot_at()
+        if not latest:
+            return self.seed_from_inventory()
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(latest)
+        if age.days < Config.get_ledger_snapshot_interval_days():
+            return None
+        return self.take_snapshot()
+
+    def seed_from_inventory(self) -> int:
+        """スナップショットがない場合、inventory.current_stockを現時点の期首在庫として保存
+
+        台帳の導入前の在庫は台帳から再現できないため、これを起点に以降の変動を畳み込む。
+        """
+        if self.latest_snapshot_at():
+            return 0
+        rows = fetch_all(lambda: self.client.table("inventory").select("id, common_code, current_stock"))
+        levels = {
+            row['common_code']: int(row.get('current_stock') or 0)
+            for row in rows if row.get('common_code')
+        }
+        return self.write_snapshot(levels)
+
+    # ----- inventoryの再計算 -----
+
+    def rebuild_current_stock(self, dry_run: bool = True, force: bool = False) -> Dict:
+        """台帳から現在の在庫数を求め、inventory.current_stockとの差分を返す
+
+        current_stockを台帳を通さずに更新するスクリプトがまだあるため、台帳の値で上書きすると
+        それらの変動が失われる。更新（dry_run=False）はforce=Trueを指定した場合だけ行う。
+        """
+        if not dry_run and not force:
+            return {
+                'status': 'refused',
+                'message': '台帳を通さずにcurrent_stockを更新する処理があるため、上書きにはforce=Trueが必要です'
+            }
+        if not self.latest_snapshot_at():
+            return {'status': 'no_snapshot', 'message': 'スナップショットがありません（seed_from_inventoryを先に実行）'}
+
+        levels = self.stock_as_of()
+        rows = fetch_all(lambda: self.client.table("inventory").select("id, common_code, current_stock"))
+        inventory_codes = {row['common_code'] for row in rows if row.get('common_code')}
+
+        differences = []
+        for row in rows:
+            code = row.get('common_code')
+            if not code:
+                continue
+            expected = levels.get(code, 0)
+            actual = int(row.get('current_stock') or 0)
+            if expected != actual:
+                differences.append({'common_code': code, 'current_stock': actual, 'ledger_stock': expected})
+        missing = sorted(code for code in levels if code not in inventory_codes)
+
+        if not dry_run and differences:
+            # 同じ在庫数になる商品は1回のupdateにまとめる
+            groups: Dict[int, List[str]] = {}
+            for difference in differences:
+                groups.setdefault(difference['ledger_stock'], []).append(difference['common_code'])
+            now = datetime.now(timezone.utc).isoformat()
+            for stock, codes in groups.items():
+                for chunk in chunk_values(codes):
+                    self.client.table("inventory").update({
+                        'current_stock': stock,
+                        'last_updated': now,
+                        'updated_at': now
+                    }).in_("common_code", chunk).execute()
+
+        logger.info(f"在庫再計算: 差分{len(differences)}商品, inventory未登録{len(missing)}商品 (dry_run={dry_run})")
+        return {
+            'status': 'success',
+            'dry_run': dry_run,
+            'checked': len(rows),
+            'differences': differences,
+            'missing_in_inventory': missing
+        }
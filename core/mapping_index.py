@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+マッピングインデックスモジュール
+product_master / choice_code_mapping / package_components を一括で読み込み、
+メモリ内辞書で共通コードを解決する（行ごとのSupabase問い合わせを排除）
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+from .config import Config
+from .database import Database
+from .bom import BomEngine
+from .choice_scanner import ChoiceCodeScanner, set_choice_scanner
+from .name_index import NameIndex
+from .pagination import fetch_all
+
+logger = logging.getLogger(__name__)
+
+
+def _choice_code_of(row: Dict) -> str:
+    """choice_code_mappingの行から選択肢コードを取り出す"""
+    choice_info = row.get('choice_info')
+    if isinstance(choice_info, dict) and choice_info.get('choice_code'):
+        return choice_info['choice_code']
+    return row.get('choice_code') or ''
+
+
+class MappingIndex:
+    """共通コードマッピングのメモリ内インデックス
+
+    - choice_code → choice_code_mappingの行
+    - rakuten_sku → product_masterの行
+    - common_code → 商品名
+    - package_code → package_componentsの行リスト
+    - まとめ商品の展開済み部品表（bom、入れ子のまとめ商品も展開済み）
+    - 登録済み選択肢コードの抽出器（choice_scanner）
+    - 商品名のn-gramインデックス（name_index）
+
+    TTL経過後の初回アクセス、またはinvalidate()後の初回アクセスで再読み込みする。
+    再読み込みのたびにversionが1つ進む。
+    """
+
+    _shared: Optional['MappingIndex'] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, client=None, ttl_seconds: Optional[int] = None):
+        self._client = client
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.get_mapping_index_ttl()
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+        self.choice_codes: Dict[str, Dict] = {}
+        self.rakuten_skus: Dict[str, Dict] = {}
+        self.product_names: Dict[str, str] = {}
+        self.package_components: Dict[str, List[Dict]] = {}
+        self.bom = BomEngine()
+        self.product_master: Dict[str, Dict] = {}
+        self.choice_scanner: Optional[ChoiceCodeScanner] = None
+        self.name_index = NameIndex()
+
+    @classmethod
+    def get(cls, client=None) -> 'MappingIndex':
+        """プロセス内で共有されるインデックスを取得（必要に応じて読み込み）"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(client)
+            elif client is not None and cls._shared._client is None:
+                cls._shared._client = client
+        cls._shared.ensure_fresh()
+        return cls._shared
+
+    @classmethod
+    def invalidate(cls):
+        """共有インデックスを無効化（Google Sheets同期後などに呼び出す）"""
+        if cls._shared is not None:
+            cls._shared.loaded_at = None
+            logger.info("マッピングインデックスを無効化しました")
+
+    def is_stale(self) -> bool:
+        """再読み込みが必要かどうか"""
+        if self.loaded_at is None:
+            return True
+        return time.monotonic() - self.loaded_at > self.ttl_seconds
+
+    def ensure_fresh(self):
+        """期限切れの場合のみ再読み込み"""
+        if not self.is_stale():
+            return
+        with self._lock:
+            if self.is_stale():
+                self.reload()
+
+    def reload(self):
+        """マッピングテーブルを一括読み込みしてインデックスを再構築"""
+        client = self._client or Database.get_client()
+        if client is None:
+            raise RuntimeError("Supabaseクライアントが利用できません")
+
+        started = time.monotonic()
+        pm_rows = fetch_all(lambda: client.table("product_master").select("*"))
+        ccm_rows = fetch_all(lambda: client.table("choice_code_mapping").select("*"))
+        pc_rows = fetch_all(lambda: client.table("package_components").select("*"))
+
+        product_master = {}
+        rakuten_skus = {}
+        for row in pm_rows:
+            common_code = row.get('common_code')
+            if common_code and common_code not in product_master:
+                product_master[common_code] = row
+            sku = row.get('rakuten_sku')
+            if sku and str(sku) not in rakuten_skus:
+                rakuten_skus[str(sku)] = row
+
+        choice_codes = {}
+        for row in ccm_rows:
+            code = _choice_code_of(row)
+            if code and code not in choice_codes:
+                choice_codes[code] = row
+
+        # 商品名はproduct_masterを優先し、なければchoice_code_mappingを使用
+        product_names = {}
+        for row in ccm_rows:
+            if row.get('common_code') and row.get('product_name'):
+                product_names.setdefault(row['common_code'], row['product_name'])
+        for common_code, row in product_master.items():
+            if row.get('product_name'):
+                product_names[common_code] = row['product_name']
+
+        package_components = {}
+        for row in pc_rows:
+            if row.get('package_code'):
+                package_components.setdefault(row['package_code'], []).append(row)
+
+        self.product_master = product_master
+        self.rakuten_skus = rakuten_skus
+        self.choice_codes = choice_codes
+        self.product_names = product_names
+        self.package_components = package_components
+        self.bom = BomEngine.build(pc_rows)
+        # 登録済みの選択肢コードから抽出器を作り直す（キャッシュもここでリセットされる）
+        self.choice_scanner = ChoiceCodeScanner(choice_codes.keys())
+        if MappingIndex._shared is self:
+            set_choice_scanner(self.choice_scanner)
+        self.name_index = NameIndex.build({
+            'product_master': pm_rows,
+            'choice_code_mapping': ccm_rows
+        })
+        self.version += 1
+        self.loaded_at = time.monotonic()
+
+        logger.info(
+            f"マッピングインデックス読み込み完了 (v{self.version}): "
+            f"選択肢コード{len(choice_codes)}件, 楽天SKU{len(rakuten_skus)}件, "
+            f"まとめ商品{len(package_components)}件 ({time.monotonic() - started:.2f}秒)"
+        )
+
+    def find_choice_code(self, choice_code: str) -> Optional[Dict]:
+        """選択肢コードからchoice_code_mappingの行を取得"""
+        if not choice_code:
+            return None
+        return self.choice_codes.get(choice_code)
+
+    def find_rakuten_sku(self, rakuten_sku) -> Optional[Dict]:
+        """楽天SKUからproduct_masterの行を取得"""
+        if not rakuten_sku:
+            return None
+        return self.rakuten_skus.get(str(rakuten_sku))
+
+    def find_product(self, common_code: str) -> Optional[Dict]:
+        """共通コードからproduct_masterの行を取得"""
+        return self.product_master.get(common_code)
+
+    def get_product_name(self, common_code: str) -> str:
+        """共通コードから商品名を取得（見つからない場合は空文字）"""
+        return self.product_names.get(common_code, '')
+
+    def find_by_name(self, product_name: str, sources=None, min_score: Optional[float] = None):
+        """商品名から共通コードを検索（完全一致 → 部分一致 → あいまい一致の順）"""
+        if min_score is None:
+            min_score = Config.get_name_match_min_score()
+        return self.name_index.best(product_name, min_score=min_score, sources=sources)
+
+    def get_components(self, package_code: str) -> List[Dict]:
+        """まとめ商品の構成品を取得（直下の構成のみ）"""
+        return self.package_components.get(package_code, [])
+
+    def expand_bundle(self, code: str, quantity: float = 1) -> Dict[str, float]:
+        """商品をquantity個分の最終構成品コード→数量に展開（まとめ商品でなければそのまま）"""
+        return self.bom.expand(code, quantity)
+
+
+def get_mapping_index(client=None) -> MappingIndex:
+    """共有マッピングインデックスを取得"""
+    return MappingIndex.get(client)
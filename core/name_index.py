@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+商品名n-gramインデックスモジュール
+product_master / choice_code_mapping の商品名をbi-gramで索引化し、
+商品名による共通コード解決をメモリ内で行う（行ごとのilike検索を排除）
+
+日本語の表記ゆれに対応するため、検索前に以下の正規化を行う
+- NFKCで全角英数・半角カナを統一
+- ひらがなをカタカナに統一
+- 英字を小文字に統一、空白と記号を除去（長音符「ー」は語の一部のため残す）
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .config import Config
+
+# 正規化時に除去する空白・記号
+_STRIP_PATTERN = re.compile(r'[\s　・･\-‐－―_/／\\|｜:：;；,，、。.．!！?？"\'“”‘’()（）\[\]［］{}｛｝【】「」『』〈〉《》<>＜＞]+')
+_HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+
+# 一致の種類（優先順）
+MATCH_EXACT = 'exact'
+MATCH_PARTIAL = 'partial'
+MATCH_FUZZY = 'fuzzy'
+_MATCH_RANK = {MATCH_EXACT: 0, MATCH_PARTIAL: 1, MATCH_FUZZY: 2}
+
+
+@lru_cache(maxsize=16384)
+def normalize_name(name: Optional[str]) -> str:
+    """商品名を比較用に正規化"""
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFKC', str(name))
+    text = text.translate(_HIRAGANA_TO_KATAKANA).lower()
+    return _STRIP_PATTERN.sub('', text)
+
+
+def _ngrams(text: str, n: int = 2) -> Set[str]:
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NameMatch:
+    """商品名検索の候補"""
+
+    __slots__ = ('common_code', 'product_name', 'source', 'score', 'kind')
+
+    def __init__(self, common_code: str, product_name: str, source: str, score: float, kind: str):
+        self.common_code = common_code
+        self.product_name = product_name
+        self.source = source
+        self.score = score
+        self.kind = kind
+
+    def to_dict(self) -> Dict:
+        return {
+            'common_code': self.common_code,
+            'product_name': self.product_name,
+            'source': self.source,
+            'score': round(self.score, 3),
+            'kind': self.kind
+        }
+
+
+class NameIndex:
+    """商品名のbi-gram転置インデックス
+
+    スコアはbi-gram集合のDice係数（0〜1）。
+    候補は 完全一致 → 部分一致（検索語を含む名前） → あいまい一致 の順、同順位はスコア順に並ぶ。
+    部分一致はpartial_min_score、あいまい一致はmin_score以上のもののみ。
+    """
+
+    def __init__(self):
+        self._entries: List[Tuple[str, str, str, str, Set[str]]] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._sources: List[str] = []
+
+    def add(self, common_code: str, product_name: str, source: str):
+        """商品名を登録"""
+        normalized = normalize_name(product_name)
+        if not common_code or not normalized:
+            return
+        key = (source, normalized)
+        if key in self._exact:
+            return
+        grams = _ngrams(normalized)
+        entry_id = len(self._entries)
+        self._entries.append((common_code, product_name, source, normalized, grams))
+        self._exact[key] = entry_id
+        if source not in self._sources:
+            self._sources.append(source)
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(entry_id)
+
+    @classmethod
+    def build(cls, rows_by_source: Dict[str, Iterable[Dict]]) -> 'NameIndex':
+        """{ソース名: 行リスト} からインデックスを作成（行はcommon_code/product_nameを持つ）"""
+        index = cls()
+        for source, rows in rows_by_source.items():
+            for row in rows:
+                index.add(row.get('common_code'), row.get('product_name'), source)
+        return index
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, name: str, limit: int = 5, min_score: float = 0.0,
+               sources: Optional[Iterable[str]] = None,
+               partial_min_score: Optional[float] = None) -> List[NameMatch]:
+        """商品名に近い候補をスコア付きで返す（partial_min_score省略時は環境変数NAME_PARTIAL_MIN_SCORE）"""
+        query = normalize_name(name)
+        if not query:
+            return []
+        if partial_min_score is None:
+            partial_min_score = Config.get_name_partial_min_score()
+        allowed = set(sources) if sources else None
+        query_grams = _ngrams(query)
+
+        # 共通するbi-gramの数を数える
+        overlaps: Dict[int, int] = {}
+        for gram in query_grams:
+            for entry_id in self._postings.get(gram, ()):
+                overlaps[entry_id] = overlaps.get(entry_id, 0) + 1
+
+        matches = []
+        for entry_id, overlap in overlaps.items():
+            common_code, product_name, source, normalized, grams = self._entries[entry_id]
+            if allowed is not None and source not in allowed:
+                continue
+            score = 2.0 * overlap / (len(query_grams) + len(grams))
+            if normalized == query:
+                kind = MATCH_EXACT
+            elif query in normalized:
+                kind = MATCH_PARTIAL
+                if score < partial_min_score:
+                    continue
+            else:
+                kind = MATCH_FUZZY
+                if score < min_score:
+                    continue
+            matches.append(NameMatch(common_code, product_name, source, score, kind))
+
+        matches.sort(key=lambda match: (_MATCH_RANK[match.kind], -match.score))
+        return matches[:limit]
+
+    def find_exact(self, name: str, sources: Optional[Iterable[str]] = None) -> Optional[NameMatch]:
+        """正規化後の完全一致"""
+        query = normalize_name(name)
+        for source in sources or self._sources:
+            entry_id = self._exact.get((source, query))
+            if entry_id is not None:
+                common_code, product_name, source, _, _ = self._entries[entry_id]
+                return NameMatch(common_code, product_name, source, 1.0, MATCH_EXACT)
+        return None
+
+    def best(self, name: str, min_score: float = 0.0,
+             sources: Optional[Iterable[str]] = None,
+             kinds: Iterable[str] = (MATCH_EXACT, MATCH_PARTIAL, MATCH_FUZZY),
+             partial_min_score: Optional[float] = None) -> Optional[NameMatch]:
+        """最上位の候補（指定した一致の種類のみ）"""
+        allowed_kinds = set(kinds)
+        for match in self.search(name, limit=len(self._entries) or 1, min_score=min_score, sources=sources,
+                                 partial_min_score=partial_min_score):
+            if match.kind in allowed_kinds:
+                return match
+        return None
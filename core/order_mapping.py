@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+注文アイテムの共通コード確定モジュール
+取り込み時に注文アイテムを1回だけ共通コードへ解決し、order_itemsに保存する
+
+- order_items.common_code     解決した共通コード（選択肢コードが複数の場合は最初のコード）
+- order_items.mapping_source  解決方法（choice_code / rakuten_sku / product_code / unmapped）
+- order_items.mapping_version 解決に使ったマッピング世代
+- order_item_components       まとめ商品を展開した最終構成品（parent_code = 解決した共通コード）
+
+product_master / choice_code_mapping / package_components が変わった場合は、
+前回のマッピングとの差分（変わった選択肢コード・楽天SKU・まとめ商品）に該当する行だけを再解決する。
+マッピング世代と差分検出用のハッシュは sync_logs の cursor:order_item_mapping に保存する。
+
+使い方:
+    mapper = OrderItemMapper(supabase)
+    rows = mapper.annotate(rows)                 # insert前に共通コードを付与
+    result = supabase.table('order_items').insert(rows).execute()
+    mapper.save_components(result.data)          # 構成品行を保存
+
+    OrderItemMapper(supabase).remap_changed()    # マッピング更新後に差分だけ再解決
+"""
+
+import re
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .database import Database
+from .fanout import chunk_values, fetch_in_chunks
+from .mapping_index import MappingIndex
+from .pagination import fetch_all
+from .sync_cursor import SyncCursor, content_hash
+
+logger = logging.getLogger(__name__)
+
+MAPPING_CURSOR_NAME = 'order_item_mapping'
+COMPONENTS_TABLE = 'order_item_components'
+
+SOURCE_CHOICE_CODE = 'choice_code'
+SOURCE_RAKUTEN_SKU = 'rakuten_sku'
+SOURCE_PRODUCT_CODE = 'product_code'
+SOURCE_UNMAPPED = 'unmapped'
+
+# 再解決に必要なorder_itemsの列
+MAPPING_COLUMNS = 'id, quantity, choice_code, selected_choice_raw, rakuten_item_number, product_code'
+
+# ilike検索に使える選択肢コード（PostgRESTのフィルタ構文を壊さない文字のみ）
+_SAFE_CODE = re.compile(r'^[0-9A-Za-z_-]+$')
+_WRITE_BATCH_SIZE = 500
+
+
+def resolve_item(item: Dict, index: MappingIndex) -> Tuple[List[str], str]:
+    """注文アイテムを共通コードに解決し、(共通コードのリスト, 解決方法) を返す
+
+    優先順位: 選択肢コード → 楽天SKU（rakuten_item_number） → product_code
+    """
+    choice_text = item.get('choice_code') or item.get('selected_choice_raw') or ''
+    common_codes = []
+    for code in index.choice_scanner.scan(choice_text):
+        row = index.find_choice_code(code)
+        if row and row.get('common_code'):
+            common_codes.append(row['common_code'])
+    if common_codes:
+        return common_codes, SOURCE_CHOICE_CODE
+
+    for source, key in ((SOURCE_RAKUTEN_SKU, item.get('rakuten_item_number')),
+                        (SOURCE_PRODUCT_CODE, item.get('product_code'))):
+        row = index.find_rakuten_sku(key)
+        if row and row.get('common_code'):
+            return [row['common_code']], source
+
+    return [], SOURCE_UNMAPPED
+
+
+def build_component_rows(item: Dict, common_codes: Iterable[str], index: MappingIndex) -> List[Dict]:
+    """解決した共通コードを部品表で展開し、order_item_componentsの行を作成"""
+    quantity = int(item.get('quantity') or 0)
+    totals: Dict[Tuple[str, str], float] = {}
+    for parent_code in common_codes:
+        for component_code, count in index.expand_bundle(parent_code, quantity).items():
+            key = (parent_code, component_code)
+            totals[key] = totals.get(key, 0) + count
+    return [
+        {
+            'order_item_id': item['id'],
+            'parent_code': parent_code,
+            'common_code': component_code,
+            'quantity': count
+        }
+        for (parent_code, component_code), count in totals.items()
+    ]
+
+
+def mapping_fingerprint(index: MappingIndex) -> Dict[str, str]:
+    """差分検出用のキー → ハッシュ（選択肢コード・楽天SKU・まとめ商品）"""
+    hashes = {}
+    for code, row in index.choice_codes.items():
+        hashes[f"choice:{code}"] = content_hash(row.get('common_code'))
+    for sku, row in index.rakuten_skus.items():
+        hashes[f"sku:{sku}"] = content_hash(row.get('common_code'))
+    for package_code, components in index.bom.flattened.items():
+        hashes[f"bom:{package_code}"] = content_hash(components)
+    return hashes
+
+
+def diff_fingerprints(previous: Dict[str, str], current: Dict[str, str]) -> Dict[str, Set[str]]:
+    """追加・変更・削除されたキーを種類別に返す"""
+    changed = {'choice': set(), 'sku': set(), 'bom': set()}
+    for key in set(previous) | set(current):
+        if previous.get(key) != current.get(key):
+            kind, _, value = key.partition(':')
+            changed[kind].add(value)
+    return changed
+
+
+def stored_mapping(item: Dict) -> Optional[Tuple[Optional[str], str]]:
+    """order_itemsに保存済みの (共通コード, 解決方法)。未解決の行はNone"""
+    if item.get('mapping_version') is None:
+        return None
+    return item.get('common_code'), item.get('mapping_source') or SOURCE_UNMAPPED
+
+
+class OrderItemMapper:
+    """order_itemsへの共通コードの保存と差分再解決
+
+    order_itemsにマッピング列がない（マイグレーション未適用の）場合は何もしない。
+    """
+
+    def __init__(self, client=None, index: Optional[MappingIndex] = None):
+        self.client = client or Database.get_client()
+        self.index = index or MappingIndex.get(self.client)
+        self.cursor = SyncCursor.load(MAPPING_CURSOR_NAME, self.client)
+        self.version = int(self.cursor.value or 0)
+        self.enabled = self._columns_available()
+
+    def _columns_available(self) -> bool:
+        try:
+            self.client.table("order_items").select("common_code, mapping_source, mapping_version").limit(1).execute()
+            return True
+        except Exception as e:
+            logger.warning(f"order_itemsにマッピング列がないため共通コードの保存をスキップします: {e}")
+            return False
+
+    def annotate(self, rows: List[Dict]) -> List[Dict]:
+        """insert前の行に common_code / mapping_source / mapping_version を設定"""
+        if not self.enabled:
+            return rows
+        for row in rows:
+            common_codes, source = resolve_item(row, self.index)
+            row['common_code'] = common_codes[0] if common_codes else None
+            row['mapping_source'] = source
+            row['mapping_version'] = self.version
+        return rows
+
+    def save_components(self, rows: List[Dict], replace: bool = False) -> int:
+        """保存済みの行（idを含む）の構成品行を保存し、保存件数を返す"""
+        if not self.enabled or not rows:
+            return 0
+        component_rows = []
+        for row in rows:
+            common_codes, _ = resolve_item(row, self.index)
+            component_rows.extend(build_component_rows(row, common_codes, self.index))
+
+        if replace:
+            for chunk in chunk_values(row['id'] for row in rows):
+                self.client.table(COMPONENTS_TABLE).delete().in_("order_item_id", chunk).execute()
+        for i in range(0, len(component_rows), _WRITE_BATCH_SIZE):
+            self.client.table(COMPONENTS_TABLE).insert(component_rows[i:i + _WRITE_BATCH_SIZE]).execute()
+        return len(component_rows)
+
+    def remap(self, rows: List[Dict], version: Optional[int] = None) -> int:
+        """既存の行を再解決して保存（同じ解決結果の行は1回のupdateにまとめる）"""
+        if not self.enabled or not rows:
+            return 0
+        version = self.version if version is None else version
+        groups: Dict[Tuple[Optional[str], str], List[int]] = {}
+        for row in rows:
+            common_codes, source = resolve_item(row, self.index)
+            groups.setdefault((common_codes[0] if common_codes else None, source), []).append(row['id'])
+
+        for (common_code, source), ids in groups.items():
+            for chunk in chunk_values(ids):
+                self.client.table("order_items").update({
+                    'common_code': common_code,
+                    'mapping_source': source,
+                    'mapping_version': version
+                }).in_("id", chunk).execute()
+        self.save_components(rows, replace=True)
+        return len(rows)
+
+    def _affected_rows(self, changed: Dict[str, Set[str]]) -> Dict[int, Dict]:
+        """差分に該当する行と、まだ解決されていない行を取得"""
+        columns = MAPPING_COLUMNS
+        rows: Dict[int, Dict] = {}
+
+        def collect(found):
+            for row in found:
+                rows[row['id']] = row
+
+        collect(fetch_all(lambda: self.client.table("order_items").select(columns).is_("mapping_version", "null")))
+
+        skus = sorted(changed['sku'])
+        if skus:
+            for column in ("rakuten_item_number", "product_code"):
+                collect(fetch_in_chunks(lambda: self.client.table("order_items").select(columns), column, skus)[0])
+
+        codes = sorted(code for code in changed['choice'] if _SAFE_CODE.match(code))
+        for chunk in chunk_values(codes, max_items=50):
+            condition = ",".join(
+                f"{column}.ilike.*{code}*" for code in chunk for column in ("choice_code", "selected_choice_raw")
+            )
+            collect(fetch_all(lambda: self.client.table("order_items").select(columns).or_(condition)))
+
+        # まとめ商品の構成が変わった場合は、その商品に解決済みの行だけ構成品を作り直す
+        packages = sorted(changed['bom'])
+        if packages:
+            components, _ = fetch_in_chunks(
+                lambda: self.client.table(COMPONENTS_TABLE).select("id, order_item_id"), "parent_code", packages
+            )
+            item_ids = {row['order_item_id'] for row in components} - set(rows)
+            if item_ids:
+                collect(fetch_in_chunks(lambda: self.client.table("order_items").select(columns), "id", item_ids)[0])
+        return rows
+
+    def remap_changed(self) -> Dict:
+        """前回からのマッピングの差分に該当する行だけを再解決し、マッピング世代を進める"""
+        if not self.enabled:
+            return {'status': 'skipped', 'remapped': 0}
+
+        self.index.ensure_fresh()
+        current = mapping_fingerprint(self.index)
+        if self.cursor.value is None:
+            # 初回は未解決の行（全行）を解決するだけ
+            changed = {'choice': set(), 'sku': set(), 'bom': set()}
+        else:
+            changed = diff_fingerprints(self.cursor.hashes, current)
+
+        rows = self._affected_rows(changed)
+        if not rows and not any(changed.values()) and self.cursor.value is not None:
+            return {'status': 'unchanged', 'version': self.version, 'remapped': 0}
+
+        new_version = self.version + 1
+        remapped = self.remap(list(rows.values()), new_version)
+
+        stats = {
+            'remapped': remapped,
+            'changed_choice_codes': len(changed['choice']),
+            'changed_skus': len(changed['sku']),
+            'changed_packages': len(changed['bom'])
+        }
+        if self.cursor.advance(new_version, hashes=current, stats=stats):
+            self.version = new_version
+        logger.info(f"注文アイテムの再マッピング完了 (v{new_version}): {stats}")
+        return {'status': 'success', 'version': new_version, **stats}
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ページング読み込みモジュール
+PostgRESTの1リクエスト1000件上限を超えるテーブルを、
+idによるキーセットページングで順次読み込むジェネレータ
+
+使い方:
+    for row in iter_rows(lambda: supabase.table('orders').select('*').gte('order_date', start)):
+        ...
+
+クエリビルダーは条件を追加すると自身を書き換えるため、
+ページごとに新しいビルダーを返す関数（query_factory）を渡す
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+from .database import Database, execute_async
+
+logger = logging.getLogger(__name__)
+
+# PostgRESTの1リクエストあたりの最大取得件数
+DEFAULT_PAGE_SIZE = 1000
+
+
+def _page_query(query_factory: Callable, key: str, after: Any, page_size: int):
+    """afterより後ろの1ページ分のクエリを組み立てる"""
+    query = query_factory()
+    if after is not None:
+        query = query.gt(key, after)
+    return query.order(key).range(0, page_size - 1)
+
+
+def _fetch_page(query_factory: Callable, key: str, after: Any, page_size: int) -> List[Dict]:
+    """1ページ分を取得"""
+    result = _page_query(query_factory, key, after, page_size).execute()
+    return result.data or []
+
+
+def iter_pages(query_factory: Callable, key: str = 'id',
+               page_size: int = DEFAULT_PAGE_SIZE, prefetch: bool = False) -> Iterator[List[Dict]]:
+    """ページ単位で行リストを返すジェネレータ
+
+    Args:
+        query_factory: フィルタ済みの新しいクエリビルダーを返す関数（keyの列をselectに含めること）
+        key: キーセットページングに使う一意・昇順の列
+        page_size: 1ページの件数
+        prefetch: Trueの場合、呼び出し側が現在のページを処理している間に次ページを先読みする
+    """
+    after = None
+    pending = None
+    page = _fetch_page(query_factory, key, after, page_size)
+
+    while page:
+        has_next = len(page) >= page_size
+        after = page[-1][key]
+
+        if has_next and prefetch:
+            pending = Database.get_executor().submit(_fetch_page, query_factory, key, after, page_size)
+
+        yield page
+
+        if not has_next:
+            break
+        if pending is not None:
+            page = pending.result()
+            pending = None
+        else:
+            page = _fetch_page(query_factory, key, after, page_size)
+
+
+def iter_rows(query_factory: Callable, key: str = 'id',
+              page_size: int = DEFAULT_PAGE_SIZE, prefetch: bool = False) -> Iterator[Dict]:
+    """全ページの行を1行ずつ返すジェネレータ"""
+    for page in iter_pages(query_factory, key, page_size, prefetch):
+        yield from page
+
+
+def fetch_all(query_factory: Callable, key: str = 'id',
+              page_size: int = DEFAULT_PAGE_SIZE, prefetch: bool = False) -> List[Dict]:
+    """全ページの行をリストで取得"""
+    return list(iter_rows(query_factory, key, page_size, prefetch))
+
+
+async def aiter_pages(query_factory: Callable, key: str = 'id',
+                      page_size: int = DEFAULT_PAGE_SIZE, prefetch: bool = True) -> AsyncIterator[List[Dict]]:
+    """iter_pagesの非同期版（async関数内でイベントループをブロックしない）"""
+    after = None
+    pending: Optional[asyncio.Task] = None
+    page = (await execute_async(_page_query(query_factory, key, after, page_size))).data or []
+
+    try:
+        while page:
+            has_next = len(page) >= page_size
+            after = page[-1][key]
+
+            if has_next and prefetch:
+                pending = asyncio.ensure_future(
+                    execute_async(_page_query(query_factory, key, after, page_size))
+                )
+
+            yield page
+
+            if not has_next:
+                break
+            if pending is not None:
+                result = await pending
+                pending = None
+            else:
+                result = await execute_async(_page_query(query_factory, key, after, page_size))
+            page = result.data or []
+    finally:
+        # 途中で打ち切られた場合は先読みを破棄
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+async def aiter_rows(query_factory: Callable, key: str = 'id',
+                     page_size: int = DEFAULT_PAGE_SIZE, prefetch: bool = True) -> AsyncIterator[Dict]:
+    """iter_rowsの非同期版"""
+    async for page in aiter_pages(query_factory, key, page_size, prefetch):
+        for row in page:
+            yield row
+
+
+async def afetch_all(query_factory: Callable, key: str = 'id',
+                     page_size: int = DEFAULT_PAGE_SIZE, prefetch: bool = True) -> List[Dict]:
+    """fetch_allの非同期版"""
+    rows = []
+    async for page in aiter_pages(query_factory, key, page_size, prefetch):
+        rows.extend(page)
+    return rows
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+APIレート制限モジュール
+外部API（楽天RMSなど）への同時リクエストを一定のレートに抑えるトークンバケット
+
+使い方:
+    bucket = AsyncTokenBucket(rate=1.0, capacity=2)
+    await bucket.acquire()
+    response = await client.post(...)
+    if response.status_code == 429:
+        bucket.pause(backoff_delay(attempt, response))
+"""
+
+import time
+import random
+import asyncio
+import logging
+from typing import Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# リトライ対象のHTTPステータス
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class AsyncTokenBucket:
+    """asyncio用トークンバケット
+
+    rate件/秒でトークンを補充し、最大capacity件までバーストを許可する。
+    トークンは取得時に先に予約するため、複数のタスクが同時にacquireしても
+    合計のリクエストレートはrateを超えない。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rateは正の値を指定してください")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """トークンを取得（不足している場合は補充されるまで待機）"""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= tokens
+        wait = max(-self._tokens / self.rate, self._paused_until - now, 0.0)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """429などを受けた場合に、全タスクのリクエストを一定時間止める"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def backoff_delay(attempt: int, response: Optional[httpx.Response] = None,
+                  base: float = 1.0, max_delay: float = 60.0) -> float:
+    """リトライまでの待機秒数（Retry-Afterがあれば優先、なければ指数バックオフ＋ジッター）"""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), max_delay)
+            except ValueError:
+                pass
+    delay = min(base * (2 ** attempt), max_delay)
+    return delay + random.uniform(0, delay / 2)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+注文アイテムの在庫減算（1回だけ）モジュール
+在庫を減算したorder_itemsに減算済みマーク（reduction_batch_id）を付け、
+マークの設定と在庫の調整をRPC（reduce_order_items）の1トランザクションで行う（SQLは sql/add_order_item_reduction.sql）
+
+- 処理対象は「マークのないアイテム」なので、日付範囲の再実行や途中からの再開で二重に減算しない
+- 後から取り込まれた過去日付のアイテムも次の実行で拾われる
+- 1件でも別の処理が先にマークしたアイテムが含まれる場合は AlreadyReducedError（何も変更されない）
+
+使い方:
+    for items in iter_pages(lambda: unreduced_query(supabase), page_size=batch_size):
+        adjustments = ...  # stock_adjustment()のリスト
+        reduce_order_items([item['id'] for item in items], adjustments, client=supabase)
+"""
+
+import uuid
+import logging
+from typing import Dict, Iterable, List, Optional
+from .database import Database
+from .stock import stock_levels
+from .sync_cursor import SyncCursor
+
+logger = logging.getLogger(__name__)
+
+REDUCTION_RPC = 'reduce_order_items'
+
+# mark_legacy_order_itemsで既存の行をマークした時点（cutoff）を記録するカーソル
+LEGACY_CURSOR_NAME = 'order_item_reduction'
+
+
+class AlreadyReducedError(Exception):
+    """減算済みのアイテムが含まれていたため、バッチ全体を適用しなかった"""
+
+
+def new_batch_id() -> str:
+    """減算バッチID"""
+    return uuid.uuid4().hex
+
+
+def reduction_available(client=None) -> bool:
+    """減算済みマークで減算できるか
+
+    order_itemsに減算済みマークの列があり（マイグレーション適用済み）、既存の行のマーク
+    （mark_legacy_order_items）も実行済みの場合だけTrue。既存の行がマークされる前に減算すると、
+    旧方式で減算済みの過去の注文まで在庫から減算してしまうため。
+    """
+    client = client or Database.get_client()
+    try:
+        client.table("order_items").select("reduction_batch_id").limit(1).execute()
+    except Exception as e:
+        logger.warning(f"order_itemsに減算済みマークの列がありません: {e}")
+        return False
+    if not SyncCursor.load(LEGACY_CURSOR_NAME, client).value:
+        logger.warning("既存の注文アイテムの減算済みマークが未設定です（mark_legacy_order_itemsを実行してください）")
+        return False
+    return True
+
+
+def unreduced_query(client, columns: str = "*"):
+    """未減算のorder_itemsのクエリ（部分インデックス idx_order_items_unreduced を使用）"""
+    return client.table("order_items").select(columns).is_("reduction_batch_id", "null")
+
+
+def reduce_order_items(item_ids: Iterable[int], adjustments: List[Dict], batch_id: Optional[str] = None,
+                       clamp_at_zero: bool = True, create_missing: bool = False, client=None) -> Dict[str, Dict]:
+    """アイテムに減算済みマークを付け、同じトランザクションで在庫を調整
+
+    Args:
+        item_ids: このバッチで減算するorder_itemsのid（マッピングできなかったアイテムも含める）
+        adjustments: stock_adjustment()で作成した在庫調整のリスト
+
+    Returns:
+        adjust_stockと同じ {共通コード: {'previous_stock', 'new_stock', 'delta', 'status'}}
+
+    Raises:
+        AlreadyReducedError: 減算済みのアイテムが含まれていた
+    """
+    item_ids = sorted(set(item_ids))
+    if not item_ids:
+        return {}
+    client = client or Database.get_client()
+    batch_id = batch_id or new_batch_id()
+    try:
+        result = client.rpc(REDUCTION_RPC, {
+            'batch_id': batch_id,
+            'item_ids': item_ids,
+            'adjustments': [adjustment for adjustment in adjustments if adjustment.get('common_code')],
+            'clamp_at_zero': clamp_at_zero,
+            'create_missing': create_missing
+        }).execute()
+    except Exception as e:
+        if 'already reduced' in str(e):
+            raise AlreadyReducedError(str(e)) from e
+        raise
+    levels = stock_levels(result.data or [])
+    logger.info(f"在庫減算バッチ {batch_id}: アイテム{len(item_ids)}件, {len(levels)}商品")
+    return levels
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+返品・キャンセルの在庫戻し（1回だけ）モジュール
+在庫に戻したorder_itemsにマーク（is_returned）を付け、マークの設定・在庫の加算・
+return_processing_logへの記録をRPC（restock_returned_items）の1トランザクションで行う
+（SQLは sql/create_return_detection.sql）
+
+- 返品・キャンセル注文は orders.status_changed_at のカーソルで差分だけ取得する
+- カーソルを戻して再実行しても、マーク済みのアイテムは二度と在庫に戻さない
+- 1件でも別の処理が先にマークしたアイテムが含まれる場合は AlreadyRestockedError（何も変更されない）
+
+使い方:
+    for orders in iter_pages(lambda: returned_orders_query(supabase, since)):
+        ...
+        restock_returned_items(item_ids, adjustments, log_entries, client=supabase)
+"""
+
+import uuid
+import logging
+from typing import Dict, Iterable, List, Optional
+from .database import Database
+from .stock import stock_levels
+
+logger = logging.getLogger(__name__)
+
+RESTOCK_RPC = 'restock_returned_items'
+
+# 在庫に戻す注文のステータス（orders.actual_status）
+STATUS_CANCELLED = 'cancelled'
+STATUS_RETURNED = 'returned'
+RETURN_STATUSES = (STATUS_CANCELLED, STATUS_RETURNED)
+
+
+class AlreadyRestockedError(Exception):
+    """在庫戻し済みのアイテムが含まれていたため、バッチ全体を適用しなかった"""
+
+
+def return_detection_available(client=None) -> bool:
+    """ordersにステータス変更日時の列があるか（マイグレーション適用済みか）"""
+    client = client or Database.get_client()
+    try:
+        client.table("orders").select("status_changed_at").limit(1).execute()
+        return True
+    except Exception as e:
+        logger.warning(f"ordersにステータス変更日時の列がありません: {e}")
+        return False
+
+
+def returned_orders_query(client, since: Optional[str] = None, platform_id: Optional[int] = None,
+                          columns: str = "id, order_number, order_date, order_status, actual_status, status_changed_at"):
+    """sinceより後に返品・キャンセルになった注文のクエリ（部分インデックス idx_orders_status_changed_returns を使用）"""
+    query = client.table("orders").select(columns).in_("actual_status", list(RETURN_STATUSES))
+    if platform_id is not None:
+        query = query.eq("platform_id", platform_id)
+    if since:
+        query = query.gt("status_changed_at", since)
+    return query
+
+
+def restock_returned_items(item_ids: Iterable[int], adjustments: List[Dict], log_entries: List[Dict],
+                           batch_id: Optional[str] = None, client=None) -> Dict[str, Dict]:
+    """アイテムに在庫戻し済みマークを付け、同じトランザクションで在庫を加算して返品処理ログを記録
+
+    Args:
+        item_ids: 在庫に戻すorder_itemsのid（共通コードに解決できたアイテムのみ）
+        adjustments: stock_adjustment()で作成した在庫調整のリスト
+        log_entries: 注文ごとの {'order_number', 'processed_items', 'successful_items', 'failed_items', 'error_details'}
+
+    Returns:
+        adjust_stockと同じ {共通コード: {'previous_stock', 'new_stock', 'delta', 'status'}}
+
+    Raises:
+        AlreadyRestockedError: 在庫戻し済みのアイテムが含まれていた
+    """
+    item_ids = sorted(set(item_ids))
+    if not item_ids and not log_entries:
+        return {}
+    client = client or Database.get_client()
+    batch_id = batch_id or str(uuid.uuid4())
+    try:
+        result = client.rpc(RESTOCK_RPC, {
+            'batch_id': batch_id,
+            'item_ids': item_ids,
+            'adjustments': [adjustment for adjustment in adjustments if adjustment.get('common_code')],
+            'log_entries': log_entries
+        }).execute()
+    except Exception as e:
+        if 'already returned' in str(e):
+            raise AlreadyRestockedError(str(e)) from e
+        raise
+    levels = stock_levels(result.data or [])
+    logger.info(f"返品在庫戻しバッチ {batch_id}: 注文{len(log_entries)}件, アイテム{len(item_ids)}件, {len(levels)}商品")
+    return levels
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+在庫シミュレーションモジュール（What-if）
+在庫のスナップショットを1回だけ読み込み、共通コード順の配列に載せて
+減算・返品・製造などの変動ベクトルをメモリ上で適用する（DRY RUNでDBを読み直さない）
+
+- 変動は stock_adjustment() のリスト、または {共通コード: 変動数} で渡す
+- 1回の適用は adjust_inventory_stock と同じ規則（同じ共通コードは合算してから0未満を切り捨て、
+  在庫行のない商品は create_missing=False なら 'missing'）
+- 複数日のシナリオは 日数 × 商品数 の行列で一括計算する
+- 結果は実際の在庫（inventory、または台帳の時点在庫）との差分で確認できる
+
+使い方:
+    simulator = StockSimulator.load(supabase)                  # 現在の在庫
+    simulator.preview(adjustments, clamp_at_zero=True)          # 状態を変えずに結果だけ
+    history = simulator.run([day1, day2, ...], clamp_at_zero=True)
+    simulator.diff(InventoryLedger(supabase).stock_as_of(end_date))
+"""
+
+import logging
+from typing import Dict, Iterable, List, Mapping, Optional, Union
+import numpy as np
+from .database import Database
+from .pagination import fetch_all
+
+logger = logging.getLogger(__name__)
+
+Deltas = Union[Mapping[str, int], Iterable[Dict]]
+
+
+def _delta_items(deltas: Deltas):
+    """変動を (共通コード, 変動数) の列に変換"""
+    if isinstance(deltas, Mapping):
+        return deltas.items()
+    return ((row.get('common_code'), row.get('delta') or 0) for row in deltas)
+
+
+class StockSimulator:
+    """共通コード → 在庫数 の配列に変動ベクトルを適用するシミュレーター
+
+    Attributes:
+        codes: 配列の並び順の共通コード
+        stock: 在庫数（int64の配列）
+        known: inventoryに在庫行がある商品か（bool配列）
+    """
+
+    def __init__(self, levels: Mapping[str, int], known: Optional[Iterable[str]] = None):
+        self.codes: List[str] = sorted(code for code in levels if code)
+        self.index: Dict[str, int] = {code: i for i, code in enumerate(self.codes)}
+        self.stock = np.array([int(levels[code] or 0) for code in self.codes], dtype=np.int64)
+        known = set(self.codes) if known is None else set(known)
+        self.known = np.array([code in known for code in self.codes], dtype=bool)
+
+    @classmethod
+    def load(cls, client=None) -> 'StockSimulator':
+        """inventoryの現在の在庫を1回の読み込み（ページング）で取得"""
+        client = client or Database.get_client()
+        rows = fetch_all(lambda: client.table("inventory").select("id, common_code, current_stock"))
+        levels = {}
+        for row in rows:
+            if row.get('common_code'):
+                levels.setdefault(row['common_code'], int(row.get('current_stock') or 0))
+        logger.info(f"在庫シミュレーター: {len(levels)}商品を読み込みました")
+        return cls(levels)
+
+    @classmethod
+    def from_ledger(cls, ledger, as_of) -> 'StockSimulator':
+        """台帳の時点在庫（as_of時点）から作成（InventoryLedger.stock_as_of）"""
+        return cls(ledger.stock_as_of(as_of))
+
+    def copy(self) -> 'StockSimulator':
+        """同じ状態の別シナリオ"""
+        clone = StockSimulator.__new__(StockSimulator)
+        clone.codes = list(self.codes)
+        clone.index = dict(self.index)
+        clone.stock = self.stock.copy()
+        clone.known = self.known.copy()
+        return clone
+
+    def _add_codes(self, codes: Iterable[str]):
+        """配列にない共通コードを在庫0・在庫行なしとして追加"""
+        new_codes = sorted(set(code for code in codes if code and code not in self.index))
+        if not new_codes:
+            return
+        for code in new_codes:
+            self.index[code] = len(self.codes)
+            self.codes.append(code)
+        self.stock = np.concatenate([self.stock, np.zeros(len(new_codes), dtype=np.int64)])
+        self.known = np.concatenate([self.known, np.zeros(len(new_codes), dtype=bool)])
+
+    def vector(self, deltas: Deltas) -> np.ndarray:
+        """変動を配列の並び順の変動ベクトルに変換（同じ共通コードは合算）"""
+        items = [(code, int(delta)) for code, delta in _delta_items(deltas) if code]
+        self._add_codes(code for code, _ in items)
+        vector = np.zeros(len(self.codes), dtype=np.int64)
+        if items:
+            positions = np.fromiter((self.index[code] for code, _ in items), dtype=np.int64, count=len(items))
+            np.add.at(vector, positions, np.fromiter((delta for _, delta in items), dtype=np.int64, count=len(items)))
+        return vector
+
+    def _step(self, stock: np.ndarray, known: np.ndarray, vector: np.ndarray,
+              clamp_at_zero: bool, create_missing: bool):
+        """1回分の適用（adjust_inventory_stockと同じ規則）"""
+        applicable = known | (create_missing & (vector != 0))
+        new_stock = np.where(applicable, stock + vector, stock)
+        if clamp_at_zero:
+            new_stock = np.where(applicable, np.maximum(new_stock, 0), new_stock)
+        return new_stock, known | applicable
+
+    def _levels(self, before: np.ndarray, after: np.ndarray, known_before: np.ndarray,
+                known_after: np.ndarray, vector: np.ndarray) -> Dict[str, Dict]:
+        """変動した商品の {共通コード: {'previous_stock', 'new_stock', 'delta', 'status'}}"""
+        levels = {}
+        for i in np.flatnonzero(vector):
+            if not known_after[i]:
+                status = 'missing'
+            elif not known_before[i]:
+                status = 'created'
+            else:
+                status = 'simulated'
+            levels[self.codes[i]] = {
+                'previous_stock': int(before[i]) if known_before[i] else None,
+                'new_stock': int(after[i]) if known_after[i] else None,
+                'delta': int(after[i] - before[i]),
+                'status': status
+            }
+        return levels
+
+    def preview(self, deltas: Deltas, clamp_at_zero: bool = False,
+                create_missing: bool = True) -> Dict[str, Dict]:
+        """変動を適用した場合の結果（状態は変えない、adjust_stockと同じ形）"""
+        vector = self.vector(deltas)
+        after, known_after = self._step(self.stock, self.known, vector, clamp_at_zero, create_missing)
+        return self._levels(self.stock, after, self.known, known_after, vector)
+
+    def apply(self, deltas: Deltas, clamp_at_zero: bool = False,
+              create_missing: bool = True) -> Dict[str, Dict]:
+        """変動を適用して状態を更新し、adjust_stockと同じ形の結果を返す"""
+        vector = self.vector(deltas)
+        after, known_after = self._step(self.stock, self.known, vector, clamp_at_zero, create_missing)
+        levels = self._levels(self.stock, after, self.known, known_after, vector)
+        self.stock, self.known = after, known_after
+        return levels
+
+    def run(self, days: List[Deltas], clamp_at_zero: bool = False,
+            create_missing: bool = True) -> np.ndarray:
+        """複数日の変動を順に適用し、各日の終わりの在庫を 日数 × 商品数 の行列で返す（状態も更新）
+
+        0未満の切り捨てがなければ累積和で一括計算し、ある場合は日ごとに配列演算で適用する。
+        """
+        if not days:
+            return np.empty((0, len(self.codes)), dtype=np.int64)
+        vectors = [self.vector(deltas) for deltas in days]
+        # 途中で商品が追加された場合は先に作ったベクトルを同じ長さにそろえる
+        matrix = np.zeros((len(vectors), len(self.codes)), dtype=np.int64)
+        for row, vector in enumerate(vectors):
+            matrix[row, :len(vector)] = vector
+
+        if not clamp_at_zero:
+            applicable = self.known | (create_missing & (matrix != 0).any(axis=0))
+            masked = np.where(applicable, matrix, 0)
+            # 在庫行のない商品は最初の変動の日から在庫行がある扱い
+            history = self.stock + np.cumsum(masked, axis=0)
+            self.stock = history[-1].copy()
+            self.known = applicable
+            return history
+
+        history = np.empty_like(matrix)
+        stock, known = self.stock, self.known
+        for row in range(len(matrix)):
+            stock, known = self._step(stock, known, matrix[row], clamp_at_zero, create_missing)
+            history[row] = stock
+        self.stock, self.known = stock, known
+        return history
+
+    def stock_of(self, common_code: str) -> int:
+        """1商品の在庫数（配列にない商品は0）"""
+        position = self.index.get(common_code)
+        return int(self.stock[position]) if position is not None else 0
+
+    def levels(self) -> Dict[str, int]:
+        """在庫行のある商品の 共通コード → 在庫数"""
+        return {code: int(self.stock[i]) for i, code in enumerate(self.codes) if self.known[i]}
+
+    def diff(self, actual: Optional[Mapping[str, int]] = None, client=None) -> List[Dict]:
+        """シミュレーション結果と実際の在庫（省略時はinventoryの現在の在庫）の差分（差の大きい順）"""
+        if actual is None:
+            actual = StockSimulator.load(client).levels()
+        simulated = self.levels()
+        differences = []
+        for code in sorted(set(simulated) | set(actual)):
+            expected = simulated.get(code, 0)
+            real = int(actual.get(code) or 0)
+            if expected != real:
+                differences.append({
+                    'common_code': code,
+                    'simulated_stock': expected,
+                    'actual_stock': real,
+                    'difference': expected - real
+                })
+        differences.sort(key=lambda row: abs(row['difference']), reverse=True)
+        return differences
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+在庫数の一括調整モジュール
+(共通コード, 変動数, 理由, 参照) のリストをRPC（adjust_inventory_stock）1回で適用し、
+current_stock = current_stock + delta と台帳（inventory_transactions）への記録を
+1トランザクションで行う（SQLは sql/create_adjust_inventory_stock.sql）
+
+在庫を読み取ってPythonで加算し書き戻す方式と違い、往復は1回で、同時実行しても更新が失われない。
+
+使い方:
+    levels = adjust_stock([
+        stock_adjustment('S01', -2, 'sale', reference=order_item_id),
+        stock_adjustment('S02', 5, 'return'),
+    ])
+    levels['S01']['new_stock']
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional
+from .database import Database, run_sync
+
+logger = logging.getLogger(__name__)
+
+STOCK_RPC = 'adjust_inventory_stock'
+PLATFORM_STOCK_RPC = 'adjust_platform_inventory_stock'
+
+# 在庫調整の理由（inventory_transactions.transaction_type）
+REASON_SALE = 'sale'
+REASON_RETURN = 'return'
+REASON_RETURN_COMPONENT = 'return_component'
+REASON_ADJUSTMENT = 'adjustment'
+REASON_PRODUCTION = 'production'
+
+
+def stock_adjustment(common_code: str, delta, reason: str = REASON_ADJUSTMENT,
+                     reference: Optional[int] = None, notes: Optional[str] = None, **extra) -> Dict:
+    """在庫調整1件分
+
+    extraには新規作成時のminimum_stock / product_name、台帳に記録する発生日時occurred_atを指定できる
+    """
+    adjustment = {
+        'common_code': common_code,
+        'delta': int(delta),
+        'reason': reason,
+        'reference': reference,
+        'notes': notes
+    }
+    adjustment.update(extra)
+    return adjustment
+
+
+def stock_levels(rows: List[Dict]) -> Dict[str, Dict]:
+    """RPCの結果行を 共通コード → 調整後の在庫 に変換"""
+    return {
+        row['code']: {
+            'previous_stock': row.get('previous_stock'),
+            'new_stock': row.get('new_stock'),
+            'delta': row.get('applied_delta'),
+            'status': row.get('status')
+        }
+        for row in rows
+    }
+
+
+def adjust_stock(adjustments: Iterable[Dict], clamp_at_zero: bool = False,
+                 create_missing: bool = True, client=None) -> Dict[str, Dict]:
+    """在庫調整のリストを1回のRPCで適用し、共通コード → 調整後の在庫を返す
+
+    Args:
+        adjustments: stock_adjustment()で作成した調整のリスト（同じ共通コードは合算される）
+        clamp_at_zero: 在庫がマイナスになる場合は0で止める
+        create_missing: 在庫行がない商品を新規作成する（Falseの場合はstatus='missing'）
+
+    Returns:
+        {共通コード: {'previous_stock', 'new_stock', 'delta', 'status'}}
+        statusは updated / created / missing
+    """
+    adjustments = [adjustment for adjustment in adjustments if adjustment.get('common_code')]
+    if not adjustments:
+        return {}
+    client = client or Database.get_client()
+    result = client.rpc(STOCK_RPC, {
+        'adjustments': adjustments,
+        'clamp_at_zero': clamp_at_zero,
+        'create_missing': create_missing
+    }).execute()
+    levels = stock_levels(result.data or [])
+    logger.info(f"在庫一括調整: {len(adjustments)}件 → {len(levels)}商品")
+    return levels
+
+
+async def aadjust_stock(adjustments: Iterable[Dict], clamp_at_zero: bool = False,
+                        create_missing: bool = True, client=None) -> Dict[str, Dict]:
+    """adjust_stockの非同期版"""
+    return await run_sync(adjust_stock, list(adjustments), clamp_at_zero, create_missing, client)
+
+
+def adjust_platform_stock(adjustments: Iterable[Dict], platform_id: int, client=None) -> Dict[str, Dict]:
+    """旧スキーマ（product_code × platform_id）の在庫を一括調整し、stock_movementsに記録
+
+    adjustments: {'product_code', 'delta', 'reason', 'reference', 'notes'} のリスト
+    """
+    adjustments = [adjustment for adjustment in adjustments if adjustment.get('product_code')]
+    if not adjustments:
+        return {}
+    client = client or Database.get_client()
+    result = client.rpc(PLATFORM_STOCK_RPC, {
+        'adjustments': adjustments,
+        'target_platform_id': platform_id
+    }).execute()
+    return stock_levels(result.data or [])
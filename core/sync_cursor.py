@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+同期カーソル管理モジュール
+プラットフォームごとの「どこまで同期したか」（ハイウォーターマーク）を
+sync_logsテーブルに保存し、次回はそれ以降の差分だけを取得する
+
+カーソルは sync_type='cursor:<名前>' の1行として保存し、実行のたびにその行を更新する
+（sync_logsに実行ごとの行を増やさない）。
+実行の最後に1回書き込むだけなので、途中で失敗した実行はカーソルを進めない。
+
+使い方:
+    cursor = SyncCursor.load('rakuten_orders')
+    start = cursor.since(default=now - timedelta(days=1))
+    ...
+    cursor.advance(end, hashes=new_hashes)
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from .config import Config
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+CURSOR_PREFIX = 'cursor:'
+
+
+def content_hash(data: Any) -> str:
+    """注文データなどの内容ハッシュ（キー順に依存しない）"""
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class SyncCursor:
+    """1つの同期処理のハイウォーターマーク
+
+    Attributes:
+        name: カーソル名（例: rakuten_orders）
+        value: 最後に正常に処理した位置（日時のISO文字列やorder_items.idなど）
+        hashes: オーバーラップ区間で処理済みの注文番号→内容ハッシュ
+    """
+
+    def __init__(self, name: str, value: Any = None, hashes: Optional[Dict[str, str]] = None, client=None):
+        self.name = name
+        self.value = value
+        self.hashes = hashes or {}
+        self._client = client
+        self._row_id = None
+
+    @property
+    def sync_type(self) -> str:
+        return f"{CURSOR_PREFIX}{self.name}"
+
+    @classmethod
+    def load(cls, name: str, client=None) -> 'SyncCursor':
+        """最新のカーソルを読み込む（未保存・取得失敗時は値なし）"""
+        client = client or Database.get_client()
+        cursor = cls(name, client=client)
+        if client is None:
+            return cursor
+
+        try:
+            result = client.table("sync_logs").select("id, results").eq(
+                "sync_type", cursor.sync_type
+            ).eq("status", "completed").order("created_at", desc=True).limit(1).execute()
+            if result.data:
+                cursor._row_id = result.data[0].get('id')
+                results = result.data[0].get('results') or {}
+                cursor.value = results.get('high_watermark')
+                cursor.hashes = results.get('hashes') or {}
+        except Exception as e:
+            logger.warning(f"同期カーソルの読み込みに失敗しました ({name}): {e}")
+        return cursor
+
+    def since(self, default: datetime, overlap_minutes: Optional[int] = None) -> datetime:
+        """次回の取得開始日時（カーソル - オーバーラップ、カーソルがなければdefault）"""
+        if not self.value:
+            return default
+        if overlap_minutes is None:
+            overlap_minutes = Config.get_sync_overlap_minutes()
+        watermark = datetime.fromisoformat(self.value)
+        if watermark.tzinfo is None:
+            watermark = watermark.replace(tzinfo=timezone.utc)
+        return watermark - timedelta(minutes=overlap_minutes)
+
+    def is_unchanged(self, key: str, data: Any) -> bool:
+        """前回処理時から内容が変わっていないか"""
+        return self.hashes.get(str(key)) == content_hash(data)
+
+    def advance(self, value: Any, hashes: Optional[Dict[str, str]] = None, stats: Optional[Dict] = None) -> bool:
+        """カーソルを進める（既存のカーソル行の更新、初回は1行insertで確定）"""
+        client = self._client or Database.get_client()
+        if client is None:
+            return False
+
+        if isinstance(value, datetime):
+            value = value.isoformat()
+
+        results = {
+            'high_watermark': value,
+            'hashes': hashes if hashes is not None else self.hashes
+        }
+        if stats:
+            results['stats'] = stats
+
+        try:
+            if self._row_id is not None:
+                client.table("sync_logs").update({'results': results}).eq("id", self._row_id).execute()
+            else:
+                result = client.table("sync_logs").insert({
+                    'sync_type': self.sync_type,
+                    'status': 'completed',
+                    'results': results
+                }).execute()
+                if result.data:
+                    self._row_id = result.data[0].get('id')
+        except Exception as e:
+            logger.error(f"同期カーソルの保存に失敗しました ({self.name}): {e}")
+            return False
+
+        self.value = value
+        self.hashes = results['hashes']
+        logger.info(f"同期カーソルを更新しました ({self.name}): {value}")
+        return True
@@ -7,11 +7,24 @@
 
 import re
 import json
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 import logging
+from .choice_scanner import PATTERN_RULES
 
 logger = logging.getLogger(__name__)
 
+# 商品コードプレフィックス（S01など）
+PRODUCT_CODE_PREFIX_PATTERN = re.compile(r'^[A-Z]\d{2}$')
+
+# 商品名中の楽天の選択肢コードパターン（優先順）
+NAME_CHOICE_CODE_PATTERNS = [
+    re.compile(r'【([LMS]\d*)】', re.IGNORECASE),  # 【L01】【M02】【S03】形式
+    re.compile(r'\[([LMS]\d*)\]', re.IGNORECASE),  # [L01][M02][S03]形式
+    re.compile(r'\(([LMS]\d*)\)', re.IGNORECASE),  # (L01)(M02)(S03)形式
+    re.compile(r'\b([LMS]\d+)\b', re.IGNORECASE),  # L01 M02 S03形式（単語境界）
+]
+
 def extract_product_code_prefix(product_name: str) -> str:
     """商品名から先頭の商品コード部分を抽出する
     
@@ -27,7 +40,7 @@ def extract_product_code_prefix(product_name: str) -> str:
     
     # 先頭部分が商品コードのパターンに一致するか確認（S01など）
     prefix = parts[0]
-    if re.match(r'^[A-Z]\d{2}$', prefix):  # 「アルファベット1文字+数字2桁」のパターン
+    if PRODUCT_CODE_PREFIX_PATTERN.match(prefix):  # 「アルファベット1文字+数字2桁」のパターン
         return prefix
     
     return ""
@@ -103,8 +116,8 @@ def extract_selected_choices(selected_choice_text: str) -> List[Dict[str, str]]:
                 choice_info = parts[1].strip()
                 
                 # 商品コード（RXXなど）を抽出
-                code_match = re.search(r'(R\d+|S\d+)', choice_info)
-                code = code_match.group(1) if code_match else ""
+                code_match = PATTERN_RULES['item'].search(choice_info)
+                code = code_match.group() if code_match else ""
                 
                 # 商品名（コードの後のテキスト）
                 name = choice_info
@@ -129,21 +142,14 @@ def extract_choice_code_from_name(product_name: str) -> str:
     """
     if not product_name:
         return ""
-    
-    import re
-    
-    # 楽天の選択肢コードパターン
-    choice_patterns = [
-        r'【([LMS]\d*)】',  # 【L01】【M02】【S03】形式
-        r'\[([LMS]\d*)\]',  # [L01][M02][S03]形式
-        r'\(([LMS]\d*)\)',  # (L01)(M02)(S03)形式
-        r'\b([LMS]\d+)\b',  # L01 M02 S03形式（単語境界）
-    ]
-    
-    for pattern in choice_patterns:
-        matches = re.findall(pattern, product_name, re.IGNORECASE)
-        if matches:
+    return _extract_choice_code_from_name(product_name)
+
+@lru_cache(maxsize=4096)
+def _extract_choice_code_from_name(product_name: str) -> str:
+    for pattern in NAME_CHOICE_CODE_PATTERNS:
+        match = pattern.search(product_name)
+        if match:
             # 最初に見つかったコードを返す
-            return matches[0].upper()
+            return match.group(1).upper()
     
     return ""
\ No newline at end of file
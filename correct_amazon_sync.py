@@ -9,7 +9,7 @@ import os
 import sys
 import logging
 from datetime import datetime, timezone, timedelta
-from supabase import create_client
+from core.database import Database
 from typing import List, Dict, Optional
 
 # ログ設定
@@ -37,7 +37,7 @@ if not all([AMAZON_CLIENT_ID, AMAZON_CLIENT_SECRET, AMAZON_REFRESH_TOKEN]):
     sys.exit(1)
 
 # Supabase接続
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = Database.get_client()
 
 class AmazonUnifiedSync:
     """Amazon統合テーブル同期クラス"""
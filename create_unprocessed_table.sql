@@ -20,7 +20,8 @@ CREATE TABLE IF NOT EXISTS unprocessed_sales_items (
 
 -- インデックス作成
 CREATE INDEX IF NOT EXISTS idx_unprocessed_sales_status ON unprocessed_sales_items(status);
-CREATE INDEX IF NOT EXISTS idx_unprocessed_sales_order_item ON unprocessed_sales_items(order_item_id);
+-- 減算バッチの再試行で同じアイテムが重複して記録されないよう一意にする
+CREATE UNIQUE INDEX IF NOT EXISTS uq_unprocessed_sales_items_order_item ON unprocessed_sales_items(order_item_id);
 CREATE INDEX IF NOT EXISTS idx_unprocessed_sales_created_at ON unprocessed_sales_items(created_at);
 
 -- コメント追加
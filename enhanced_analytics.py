@@ -190,15 +190,11 @@ class RakutenAnalytics:
         try:
             alerts = []
             
-            # 在庫アラート
-            restock_suggestions = self.client.get_restock_suggestions(
-                days_to_analyze=7,
-                safety_stock_days=3
-            )
-            
+            # 在庫アラート（需要予測で在庫日数がリードタイム以下の商品、全商品を一括計算）
+            from core.forecast import RestockForecast
             critical_stock = [
-                item for item in restock_suggestions.get('suggestions', [])
-                if item.get('urgency_level') in ['critical', 'high']
+                item for item in RestockForecast.get().recommendations()
+                if item['priority'] == 'high'
             ]
             
             if critical_stock:
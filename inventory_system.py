@@ -302,48 +302,40 @@ class RakutenInventorySystem:
             return "in_stock"
     
     def get_restock_recommendations(self) -> Dict:
-        """補充推奨商品の取得"""
+        """補充推奨商品の取得（需要予測による発注点、全商品を一括計算）"""
         try:
-            inventory_status = self.get_current_inventory_status()
-            
-            if inventory_status['status'] != 'success':
-                return inventory_status
-            
-            # 補充が必要な商品を抽出
+            from core.forecast import RestockForecast
+            from core.mapping_index import MappingIndex
+            forecast = RestockForecast.get(self.client)
+            index = MappingIndex.get(self.client)
+
             need_restock = []
-            
-            for item in inventory_status['inventory_details']:
-                if item['current_stock'] <= 10:  # 在庫10個以下
-                    # 過去30日の販売ペースを計算
-                    daily_sales = item['total_sales'] / 30 if item['total_sales'] > 0 else 0
-                    days_remaining = item['current_stock'] / daily_sales if daily_sales > 0 else 999
-                    
-                    recommended_qty = max(50, int(daily_sales * 30))  # 30日分または最低50個
-                    
-                    need_restock.append({
-                        'product_code': item['product_code'],
-                        'product_name': item['product_name'],
-                        'current_stock': item['current_stock'],
-                        'total_sales_30days': item['total_sales'],
-                        'daily_average_sales': round(daily_sales, 2),
-                        'days_until_stockout': round(days_remaining, 1),
-                        'recommended_restock_qty': recommended_qty,
-                        'priority': 'high' if item['current_stock'] <= 0 else 'medium' if item['current_stock'] <= 5 else 'low'
-                    })
-            
-            # 優先度でソート
-            need_restock.sort(key=lambda x: (
-                0 if x['priority'] == 'high' else 1 if x['priority'] == 'medium' else 2,
-                x['days_until_stockout']
-            ))
-            
+            for item in forecast.recommendations():
+                # 商品コードは従来どおり楽天の商品コード（product_masterにない場合は共通コード）
+                product = index.find_product(item['common_code']) or {}
+                need_restock.append({
+                    'product_code': product.get('rakuten_sku') or item['common_code'],
+                    'common_code': item['common_code'],
+                    'product_name': item['product_name'],
+                    'current_stock': item['current_stock'],
+                    'total_sales_30days': int(round(item['daily_average_sales'] * 30)),
+                    'daily_average_sales': item['daily_average_sales'],
+                    'forecast_daily_sales': item['forecast_daily_sales'],
+                    'days_until_stockout': item['days_of_cover'],
+                    'reorder_point': item['reorder_point'],
+                    'safety_stock': item['safety_stock'],
+                    'recommended_restock_qty': item['recommended_restock_qty'],
+                    'priority': item['priority']
+                })
+
             return {
                 "status": "success",
                 "total_products_need_restock": len(need_restock),
                 "high_priority": len([item for item in need_restock if item['priority'] == 'high']),
                 "medium_priority": len([item for item in need_restock if item['priority'] == 'medium']),
                 "low_priority": len([item for item in need_restock if item['priority'] == 'low']),
-                "restock_recommendations": need_restock
+                "restock_recommendations": need_restock,
+                "forecast_computed_at": forecast.computed_at
             }
             
         except Exception as e:
@@ -10,7 +10,7 @@ import sys
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
-from supabase import create_client
+from core.database import Database
 
 # 環境変数読み込み
 load_dotenv()
@@ -29,7 +29,7 @@ def keep_alive():
             logger.error("Supabase認証情報が設定されていません")
             return False
         
-        supabase = create_client(url, key)
+        supabase = Database.get_client()
         
         # platformテーブルから1件取得（軽量なクエリ）
         result = supabase.table('platform').select('id').limit(1).execute()
@@ -14,7 +14,7 @@ from fastapi import FastAPI, HTTPException
 import httpx
 import base64
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 import asyncio
 from datetime import timezone
 import pytz
@@ -26,17 +26,24 @@ from dotenv import load_dotenv
 # 環境変数の読み込み
 load_dotenv()
 
+from core.config import Config
+from core.rate_limit import AsyncTokenBucket, RETRYABLE_STATUS_CODES, backoff_delay
+
 # FastAPIアプリケーションの作成
 app = FastAPI()
 
 # Supabaseクライアントの初期化を試みる
 try:
-    from supabase import create_client
+    from core.database import Database, execute_async, run_sync
+    from core.order_mapping import OrderItemMapper
+    from core.stock import adjust_platform_stock
+    from core.deduction_queue import DeductionQueue
+    from core.fanout import afetch_in_chunks
     supabase_url = os.getenv('SUPABASE_URL')
     supabase_key = os.getenv('SUPABASE_KEY')
     
     if supabase_url and supabase_key:
-        supabase = create_client(supabase_url, supabase_key)
+        supabase = Database.get_client()
         logger.info("Supabase client initialized successfully")
     else:
         logger.warning("Supabase credentials not found in environment variables")
@@ -45,6 +52,9 @@ except Exception as e:
     logger.error(f"Failed to initialize Supabase client: {e}")
     supabase = None
 
+# 注文取り込み時の在庫減算キュー（REALTIME_DEDUCTION=trueの場合に起動時に作成）
+deduction_queue = None
+
 # データベース初期化関数のインポート（エラーハンドリング付き）
 try:
     from product_master.db_setup import initialize_database
@@ -227,86 +237,194 @@ class RakutenAPI:
         self.jst = pytz.timezone('Asia/Tokyo')
         self.base_url = 'https://api.rms.rakuten.co.jp/es/2.0'
 
+        # RMS APIへの同時リクエスト数とレートの制限（全チャンクで共有）
+        self.max_concurrency = Config.get_rakuten_max_concurrency()
+        self.max_retries = Config.get_rakuten_max_retries()
+        self.rate_limiter = AsyncTokenBucket(
+            Config.get_rakuten_requests_per_second(),
+            Config.get_rakuten_burst()
+        )
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_loop = None
+        self._detail_semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """コネクションプール付きの共有HTTPクライアントを取得
+
+        AsyncClientは作成したイベントループに紐づくため、
+        別のループ（asyncio.runの再実行など）から呼ばれた場合は作り直す
+        """
+        loop = asyncio.get_running_loop()
+        if self._http_client is None or self._http_client.is_closed or self._http_client_loop is not loop:
+            self._http_client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._http_client_loop = loop
+            # 詳細取得の同時実行数は、検索ページごとの呼び出しをまたいでmax_concurrencyに抑える
+            self._detail_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._http_client
+
+    async def aclose(self):
+        """共有HTTPクライアントを閉じる"""
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+        self._http_client = None
+
+    async def _post(self, url: str, payload: Dict) -> httpx.Response:
+        """レート制限とリトライ付きでPOST（429/5xxは待機して再送）"""
+        client = self._get_http_client()
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                response = await client.post(url, json=payload)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"RMS API通信エラー: {e} ({delay:.1f}秒後に再試行)")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                delay = backoff_delay(attempt, response)
+                logger.warning(f"RMS API {response.status_code}: {delay:.1f}秒後に再試行 ({attempt + 1}/{self.max_retries})")
+                # 他のチャンクも含めてリクエストを一時停止
+                self.rate_limiter.pause(delay)
+                continue
+            return response
+        return response
+
+    # searchOrderItemの1ページあたりの取得件数（APIの上限）
+    SEARCH_PAGE_SIZE = 1000
+
     async def get_orders(self, start_date: datetime, end_date: datetime) -> List[Dict]:
-        """注文データの検索"""
+        """注文データの検索
+
+        検索結果のページが届くたびに、その注文番号の詳細取得を並行して開始する
+        """
+        detail_tasks = []
+
+        try:
+            async for order_numbers in self.iter_order_numbers(start_date, end_date):
+                detail_tasks.append(asyncio.ensure_future(self.get_order_details(order_numbers)))
+
+            all_orders = []
+            for orders in await asyncio.gather(*detail_tasks):
+                all_orders.extend(orders)
+            return all_orders
+
+        except Exception as e:
+            for task in detail_tasks:
+                task.cancel()
+            logger.error(f"Error in get_orders: {str(e)}")
+            raise
+
+    async def iter_order_numbers(self, start_date: datetime, end_date: datetime) -> AsyncIterator[List[str]]:
+        """期間内の注文番号をページ単位で返す非同期ジェネレータ
+
+        1ページ目のPaginationResponseModelから総ページ数を読み取り、
+        2ページ目以降は並列に取得して届いた順に返す
+        """
         url = f'{self.base_url}/purchaseItem/searchOrderItem/'
         
         jst_st = start_date.astimezone(self.jst).strftime("%Y-%m-%dT%H:%M:%S+0900")
         jst_ed = end_date.astimezone(self.jst).strftime("%Y-%m-%dT%H:%M:%S+0900")
 
-        search_data = {
-            "dateType": 1,
-            "startDatetime": jst_st,
-            "endDatetime": jst_ed,
-            "orderProgressList": [100, 200, 300, 400, 500, 600, 700],
-            "PaginationRequestModel": {
-                "requestRecordsAmount": 1000,
-                "requestPage": 1
+        async def search_page(page: int) -> Dict:
+            search_data = {
+                "dateType": 1,
+                "startDatetime": jst_st,
+                "endDatetime": jst_ed,
+                "orderProgressList": [100, 200, 300, 400, 500, 600, 700],
+                "PaginationRequestModel": {
+                    "requestRecordsAmount": self.SEARCH_PAGE_SIZE,
+                    "requestPage": page
+                }
             }
-        }
+            response = await self._post(url, search_data)
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    headers=self.headers,
-                    json=search_data,
-                    timeout=30.0
-                )
+            if response.status_code == 401:
+                raise HTTPException(status_code=401, detail=f"Authentication failed: {response.text}")
 
-                if response.status_code == 401:
-                    raise HTTPException(status_code=401, detail=f"Authentication failed: {response.text}")
+            response.raise_for_status()
+            return response.json()
 
-                response.raise_for_status()
-                data = response.json()
-                order_numbers = data.get('orderNumberList', [])
+        first_page = await search_page(1)
+        order_numbers = first_page.get('orderNumberList') or []
+        if order_numbers:
+            yield order_numbers
 
-                if order_numbers:
-                    return await self.get_order_details(order_numbers)
-                return []
+        pagination = first_page.get('PaginationResponseModel') or {}
+        total_pages = int(pagination.get('totalPages') or 1)
+        if total_pages <= 1:
+            return
 
-        except Exception as e:
-            logger.error(f"Error in get_orders: {str(e)}")
-            raise
+        logger.info(f"Searching {pagination.get('totalRecordsAmount')} orders in {total_pages} pages")
+        tasks = [asyncio.ensure_future(search_page(page)) for page in range(2, total_pages + 1)]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                order_numbers = (await next_page).get('orderNumberList') or []
+                if order_numbers:
+                    yield order_numbers
+        finally:
+            # 途中で打ち切られた場合は残りのページ取得を中止
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
 
     async def get_order_details(self, order_numbers: List[str]) -> List[Dict]:
         """注文の詳細情報を取得"""
         url = f'{self.base_url}/purchaseItem/getOrderItem/'
         chunk_size = 100
-        all_orders = []
-        
-        for i in range(0, len(order_numbers), chunk_size):
+        self._get_http_client()
+        semaphore = self._detail_semaphore
+
+        async def fetch_chunk(i: int) -> List[Dict]:
             chunk = order_numbers[i:i + chunk_size]
             order_data = {'orderNumberList': chunk}
             
-            try:
-                async with httpx.AsyncClient() as client:
+            async with semaphore:
+                try:
                     logger.info(f"Getting details for orders {i+1} to {i+len(chunk)}")
                     
-                    response = await client.post(
-                        url,
-                        headers=self.headers,
-                        json=order_data,
-                        timeout=30.0
-                    )
+                    response = await self._post(url, order_data)
                     
                     if response.status_code == 401:
                         raise HTTPException(status_code=401, detail="Authentication failed")
                     
                     response.raise_for_status()
                     data = response.json()
+                    return data.get('OrderModelList', [])
                     
-                    if 'OrderModelList' in data:
-                        all_orders.extend(data['OrderModelList'])
-                    
-            except Exception as e:
-                logger.error(f"Error getting order details for chunk {i//chunk_size + 1}: {str(e)}")
-                continue
+                except Exception as e:
+                    logger.error(f"Error getting order details for chunk {i//chunk_size + 1}: {str(e)}")
+                    return []
+
+        # チャンクを並列に取得し、元の順序で結合
+        results = await asyncio.gather(
+            *(fetch_chunk(i) for i in range(0, len(order_numbers), chunk_size))
+        )
+        all_orders = []
+        for chunk_orders in results:
+            all_orders.extend(chunk_orders)
         
         return all_orders
 
+    # 一括保存の単位（注文のupsertと商品のinsertをそれぞれまとめて送信）
+    ORDER_BATCH_SIZE = 100
+    ITEM_BATCH_SIZE = 500
+
     async def save_to_supabase(self, orders: List[Dict]):
-        """注文データをSupabaseに保存"""
+        """注文データをSupabaseに保存
+
+        注文はORDER_BATCH_SIZE件ごとに1回のupsertで保存し、返却されたIDを
+        注文番号で対応付けてから、その注文の商品をまとめてinsertする
+        """
         MAX_RETRIES = 3
         RETRY_DELAY = 1
         
@@ -315,12 +433,20 @@ class RakutenAPI:
             platform_response = await self._get_platform_id_with_retry()
             rakuten_platform_id = platform_response.data[0]['id']
             
+            # 注文商品の共通コードは取り込み時に解決して保存する
+            try:
+                item_mapper = await run_sync(OrderItemMapper, supabase)
+            except Exception as e:
+                logger.warning(f"Order item mapping unavailable: {str(e)}")
+                item_mapper = None
+            
             success_count = 0
             error_count = 0
             items_success = 0
             items_error = 0
             failed_orders = []
             processed_orders = set()
+            unique_orders = []
 
             for order in orders:
                 order_number = order.get('orderNumber')
@@ -329,39 +455,26 @@ class RakutenAPI:
                     continue
                     
                 processed_orders.add(order_number)
-                
-                try:
-                    # 注文データの準備
-                    order_data = {
-                        "platform_id": rakuten_platform_id,
-                        "order_number": order["orderNumber"],
-                        "order_date": order.get("orderDatetime") or order.get("shopOrderCfmDatetime"),
-                        "total_amount": float(order.get("totalPrice", 0)),
-                        "shipping_fee": float(order.get("postagePrice", 0)),
-                        "payment_method": order.get("SettlementModel", {}).get("settlementMethodCode", ""),
-                        "order_status": str(order.get("orderProgress", "")),
-                        "coupon_amount": float(order.get("couponAllTotalPrice", 0)),
-                        "point_amount": float(order.get("PointModel", {}).get("usedPoint", 0)),
-                        "request_price": float(order.get("requestPrice", 0)),
-                        "deal_price": float(order.get("goodsPrice", 0)),
-                        "platform_data": json.dumps(order),
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }
+                unique_orders.append(order)
 
-                    # 注文データの保存
-                    order_result = supabase.table("orders").upsert(
-                        order_data,
-                        on_conflict="platform_id,order_number"
-                    ).execute()
+            for i in range(0, len(unique_orders), self.ORDER_BATCH_SIZE):
+                batch = unique_orders[i:i + self.ORDER_BATCH_SIZE]
 
-                    if not order_result.data:
-                        raise Exception(f"Failed to save order: {order_number}")
-
-                    order_id = order_result.data[0]["id"]
-                    logger.info(f"Successfully saved order {order_number} with ID: {order_id}")
+                # 注文データの一括保存
+                order_ids, batch_failed = await self._bulk_upsert_orders(
+                    batch, rakuten_platform_id, MAX_RETRIES, RETRY_DELAY
+                )
+                error_count += len(batch_failed)
+                failed_orders.extend(batch_failed)
+
+                # 注文商品情報の準備
+                item_rows = []
+                for order in batch:
+                    order_number = order["orderNumber"]
+                    order_id = order_ids.get(order_number)
+                    if order_id is None:
+                        continue
 
-                    # 注文商品情報の保存
                     items = []
                     for package in order.get("PackageModelList", []):
                         items.extend(package.get("ItemModelList", []))
@@ -371,177 +484,22 @@ class RakutenAPI:
                         continue
 
                     for item in items:
-                        for attempt in range(MAX_RETRIES):
-                            try:
-                                # まとめ商品の処理
-                                is_parent = item.get("itemType") == 1
-                                parent_product_code = ""
-                                
-                                # SKU情報の処理
-                                sku_models = item.get("SkuModelList", [])
-                                # JSON形式で保存する情報
-                                sku_info = {
-                                    "variantId": sku_models[0].get("variantId") if sku_models else None,
-                                    "merchantDefinedSkuId": sku_models[0].get("merchantDefinedSkuId") if sku_models else None,
-                                    "skuInfo": sku_models[0].get("skuInfo") if sku_models else None
-                                }
-                                
-                                # 新しい列への保存用データを抽出
-                                # SKUモデルからデータを抽出
-                                merchant_item_id, item_number, variant_id, item_choice = extract_sku_data(sku_models)
-                                
-                                # 商品番号と管理番号も設定（APIから直接取得）
-                                if not item_number and item.get("itemNumber"):
-                                    item_number = item.get("itemNumber")
-                                
-                                if not merchant_item_id and item.get("manageNumber"):
-                                    merchant_item_id = item.get("manageNumber")
-                                
-                                # 選択された商品の選択肢情報を抽出
-                                selected_choice = item.get("selectedChoice", "")
-                                choices = extract_selected_choices(selected_choice)
-                                
-                                # 商品名から商品コードプレフィックスを抽出
-                                item_name = item.get("itemName", "")
-                                product_code_prefix = extract_product_code_prefix(item_name)
-
-                                if is_parent:
-                                    # 親商品として処理
-                                    item_data = {
-                                        "order_id": order_id,
-                                        "product_code": str(item.get("itemId", "")),
-                                        "product_name": item_name,
-                                        "quantity": int(item.get("units", 0)),
-                                        "unit_price": float(item.get("price", 0)),
-                                        "total_price": float(item.get("price", 0)) * int(item.get("units", 0)),
-                                        "point_rate": float(item.get("pointRate", 0)) if "pointRate" in item else 0,
-                                        "tax_rate": float(item.get("taxRate", 0)),
-                                        "sku_info": json.dumps(sku_info) if sku_info else None,
-                                        "deal_flag": bool(item.get("dealFlag", False)),
-                                        "restore_inventory_flag": bool(item.get("restoreInventoryFlag", False)),
-                                        "is_parent": True,
-                                        "is_child": False,
-                                        "parent_product_code": "",
-                                        "product_code_prefix": product_code_prefix,
-                                        # 新しいカラムに値を設定
-                                        "merchant_item_id": merchant_item_id,
-                                        "item_number": item_number,
-                                        "variant_id": variant_id,
-                                        "item_choice": json.dumps(choices) if choices else None,
-                                        "selected_choice_raw": selected_choice,  # 元のテキストも保存
-                                        "created_at": datetime.now(timezone.utc).isoformat(),
-                                        "updated_at": datetime.now(timezone.utc).isoformat()
-                                    }
-                                    
-                                    # 親商品のデータを保存
-                                    item_result = supabase.table("order_items").insert(item_data).execute()
-                                    
-                                    if not item_result.data:
-                                        raise Exception(f"No data returned when saving parent item: {item_data['product_code']}")
-                                    
-                                    logger.info(f"Successfully saved parent item {item_data['product_code']} for order {order_number}")
-                                    items_success += 1
-                                    
-                                    # selectedItemsから子商品情報を抽出
-                                    selected_items = item.get("selectedItems", [])
-                                    for child_item in selected_items:
-                                        child_name = child_item.get("itemName", "")
-                                        child_prefix = extract_product_code_prefix(child_name)
-                                        
-                                        child_item_data = {
-                                            "order_id": order_id,
-                                            "product_code": str(child_item.get("itemId", "")),
-                                            "product_name": child_name,
-                                            "quantity": int(item.get("units", 0)),  # 親商品と同じ数量
-                                            "unit_price": 0,  # 個別価格は通常表示されない
-                                            "total_price": 0,
-                                            "point_rate": 0,
-                                            "tax_rate": 0,
-                                            "sku_info": None,
-                                            "deal_flag": False,
-                                            "restore_inventory_flag": False,
-                                            "is_parent": False,
-                                            "is_child": True,
-                                            "parent_product_code": str(item.get("itemId", "")),
-                                            "product_code_prefix": child_prefix,
-                                            # 新しいカラムに値を設定
-                                            "merchant_item_id": child_item.get("manageNumber", ""),
-                                            "item_number": child_item.get("itemNumber", ""),
-                                            "variant_id": "",
-                                            "item_choice": None,
-                                            "selected_choice_raw": None,
-                                            "created_at": datetime.now(timezone.utc).isoformat(),
-                                            "updated_at": datetime.now(timezone.utc).isoformat()
-                                        }
-                                        
-                                        # 子商品データの保存
-                                        child_result = supabase.table("order_items").insert(child_item_data).execute()
-                                        
-                                        if not child_result.data:
-                                            raise Exception(f"No data returned when saving child item: {child_item_data['product_code']}")
-                                        
-                                        logger.info(f"Successfully saved child item {child_item_data['product_code']} for order {order_number}")
-                                        items_success += 1
-                                else:
-                                    # 通常商品の処理
-                                    item_data = {
-                                        "order_id": order_id,
-                                        "product_code": str(item.get("itemId", "")),
-                                        "product_name": item_name,
-                                        "quantity": int(item.get("units", 0)),
-                                        "unit_price": float(item.get("price", 0)),
-                                        "total_price": float(item.get("price", 0)) * int(item.get("units", 0)),
-                                        "point_rate": float(item.get("pointRate", 0)) if "pointRate" in item else 0,
-                                        "tax_rate": float(item.get("taxRate", 0)),
-                                        "sku_info": json.dumps(sku_info) if sku_info else None,
-                                        "deal_flag": bool(item.get("dealFlag", False)),
-                                        "restore_inventory_flag": bool(item.get("restoreInventoryFlag", False)),
-                                        "is_parent": False,
-                                        "is_child": False,
-                                        "parent_product_code": "",
-                                        "product_code_prefix": product_code_prefix,
-                                        # 新しいカラムに値を設定
-                                        "merchant_item_id": merchant_item_id,
-                                        "item_number": item_number,
-                                        "variant_id": variant_id,
-                                        "item_choice": json.dumps(choices) if choices else None,
-                                        "selected_choice_raw": selected_choice,  # 元のテキストも保存
-                                        "created_at": datetime.now(timezone.utc).isoformat(),
-                                        "updated_at": datetime.now(timezone.utc).isoformat()
-                                    }
-                                    
-                                    # 商品データの保存
-                                    item_result = supabase.table("order_items").insert(item_data).execute()
-                                    
-                                    if not item_result.data:
-                                        raise Exception(f"No data returned when saving item: {item_data['product_code']}")
-                                    
-                                    logger.info(f"Successfully saved item {item_data['product_code']} for order {order_number}")
-                                    items_success += 1
-                                    
-                                break
-
-                            except Exception as e:
-                                error_msg = str(e)
-                                logger.error(f"[DEBUG] Error saving item: {error_msg}")
-                                logger.error(f"[DEBUG] Stacktrace: {traceback.format_exc()}")
-                                
-                                if attempt < MAX_RETRIES - 1:
-                                    logger.warning(f"Retrying... Attempt {attempt + 1} of {MAX_RETRIES}")
-                                    await asyncio.sleep(RETRY_DELAY)
-                                else:
-                                    items_error += 1
-                                    logger.error(f"Failed all retry attempts for item")
+                        try:
+                            item_rows.extend(self._build_item_rows(item, order_id))
+                        except Exception as e:
+                            logger.error(f"Error preparing item {item.get('itemId')} for order {order_number}: {str(e)}")
+                            items_error += 1
 
                     success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error processing order {order_number}: {str(e)}")
-                    error_count += 1
-                    failed_orders.append({
-                        'order_number': order_number,
-                        'error': str(e)
-                    })
+
+                # 注文商品情報の一括保存
+                saved, failed = await self._bulk_insert_items(item_rows, MAX_RETRIES, RETRY_DELAY, item_mapper)
+                items_success += saved
+                items_error += failed
+                logger.info(
+                    f"Saved orders {i + 1} to {i + len(batch)}: "
+                    f"{len(order_ids)} orders, {saved} items ({failed} failed)"
+                )
 
             result = {
                 'total_orders': len(orders),
@@ -560,6 +518,300 @@ class RakutenAPI:
             logger.error(f"Critical error in save_to_supabase: {str(e)}")
             raise
 
+    def _build_order_data(self, order: Dict, platform_id: int) -> Dict:
+        """ordersテーブルに保存する注文データを作成"""
+        now = datetime.now(timezone.utc).isoformat()
+        return {
+            "platform_id": platform_id,
+            "order_number": order["orderNumber"],
+            "order_date": order.get("orderDatetime") or order.get("shopOrderCfmDatetime"),
+            "total_amount": float(order.get("totalPrice", 0)),
+            "shipping_fee": float(order.get("postagePrice", 0)),
+            "payment_method": order.get("SettlementModel", {}).get("settlementMethodCode", ""),
+            "order_status": str(order.get("orderProgress", "")),
+            "coupon_amount": float(order.get("couponAllTotalPrice", 0)),
+            "point_amount": float(order.get("PointModel", {}).get("usedPoint", 0)),
+            "request_price": float(order.get("requestPrice", 0)),
+            "deal_price": float(order.get("goodsPrice", 0)),
+            "platform_data": json.dumps(order),
+            "created_at": now,
+            "updated_at": now
+        }
+
+    def _build_item_rows(self, item: Dict, order_id: int) -> List[Dict]:
+        """order_itemsテーブルに保存する行を作成（まとめ商品は子商品の行も含む）"""
+        now = datetime.now(timezone.utc).isoformat()
+
+        # まとめ商品の処理
+        is_parent = item.get("itemType") == 1
+        
+        # SKU情報の処理
+        sku_models = item.get("SkuModelList", [])
+        # JSON形式で保存する情報
+        sku_info = {
+            "variantId": sku_models[0].get("variantId") if sku_models else None,
+            "merchantDefinedSkuId": sku_models[0].get("merchantDefinedSkuId") if sku_models else None,
+            "skuInfo": sku_models[0].get("skuInfo") if sku_models else None
+        }
+        
+        # 新しい列への保存用データを抽出
+        # SKUモデルからデータを抽出
+        merchant_item_id, item_number, variant_id, item_choice = extract_sku_data(sku_models)
+        
+        # 商品番号と管理番号も設定（APIから直接取得）
+        if not item_number and item.get("itemNumber"):
+            item_number = item.get("itemNumber")
+        
+        if not merchant_item_id and item.get("manageNumber"):
+            merchant_item_id = item.get("manageNumber")
+        
+        # 選択された商品の選択肢情報を抽出
+        selected_choice = item.get("selectedChoice", "")
+        choices = extract_selected_choices(selected_choice)
+        
+        # 商品名から商品コードプレフィックスを抽出
+        item_name = item.get("itemName", "")
+        product_code_prefix = extract_product_code_prefix(item_name)
+
+        rows = [{
+            "order_id": order_id,
+            "product_code": str(item.get("itemId", "")),
+            "product_name": item_name,
+            "quantity": int(item.get("units", 0)),
+            "unit_price": float(item.get("price", 0)),
+            "total_price": float(item.get("price", 0)) * int(item.get("units", 0)),
+            "point_rate": float(item.get("pointRate", 0)) if "pointRate" in item else 0,
+            "tax_rate": float(item.get("taxRate", 0)),
+            "sku_info": json.dumps(sku_info) if sku_info else None,
+            "deal_flag": bool(item.get("dealFlag", False)),
+            "restore_inventory_flag": bool(item.get("restoreInventoryFlag", False)),
+            "is_parent": is_parent,
+            "is_child": False,
+            "parent_product_code": "",
+            "product_code_prefix": product_code_prefix,
+            # 新しいカラムに値を設定
+            "merchant_item_id": merchant_item_id,
+            "item_number": item_number,
+            "variant_id": variant_id,
+            "item_choice": json.dumps(choices) if choices else None,
+            "selected_choice_raw": selected_choice,  # 元のテキストも保存
+            "created_at": now,
+            "updated_at": now
+        }]
+
+        if not is_parent:
+            return rows
+
+        # selectedItemsから子商品情報を抽出
+        for child_item in item.get("selectedItems", []):
+            child_name = child_item.get("itemName", "")
+            child_prefix = extract_product_code_prefix(child_name)
+            
+            rows.append({
+                "order_id": order_id,
+                "product_code": str(child_item.get("itemId", "")),
+                "product_name": child_name,
+                "quantity": int(item.get("units", 0)),  # 親商品と同じ数量
+                "unit_price": 0,  # 個別価格は通常表示されない
+                "total_price": 0,
+                "point_rate": 0,
+                "tax_rate": 0,
+                "sku_info": None,
+                "deal_flag": False,
+                "restore_inventory_flag": False,
+                "is_parent": False,
+                "is_child": True,
+                "parent_product_code": str(item.get("itemId", "")),
+                "product_code_prefix": child_prefix,
+                # 新しいカラムに値を設定
+                "merchant_item_id": child_item.get("manageNumber", ""),
+                "item_number": child_item.get("itemNumber", ""),
+                "variant_id": "",
+                "item_choice": None,
+                "selected_choice_raw": None,
+                "created_at": now,
+                "updated_at": now
+            })
+
+        return rows
+
+    async def _bulk_upsert_orders(self, batch: List[Dict], platform_id: int,
+                                  max_retries: int, retry_delay: float) -> Tuple[Dict[str, int], List[Dict]]:
+        """注文をまとめてupsertし、注文番号→order_idの対応と失敗した注文を返す
+
+        一括保存が失敗した場合や返却されなかった注文は1件ずつ保存し直し、
+        失敗を注文単位で記録する
+        """
+        order_ids = {}
+        failed_orders = []
+        rows = []
+
+        for order in batch:
+            try:
+                rows.append(self._build_order_data(order, platform_id))
+            except Exception as e:
+                logger.error(f"Error processing order {order.get('orderNumber')}: {str(e)}")
+                failed_orders.append({
+                    'order_number': order.get('orderNumber'),
+                    'error': str(e)
+                })
+
+        if not rows:
+            return order_ids, failed_orders
+
+        for attempt in range(max_retries):
+            try:
+                result = await execute_async(
+                    supabase.table("orders").upsert(rows, on_conflict="platform_id,order_number")
+                )
+                for saved in result.data or []:
+                    order_ids[saved["order_number"]] = saved["id"]
+                break
+            except Exception as e:
+                logger.error(f"Error bulk saving {len(rows)} orders: {str(e)}")
+                if attempt < max_retries - 1:
+                    logger.warning(f"Retrying... Attempt {attempt + 1} of {max_retries}")
+                    await asyncio.sleep(retry_delay)
+
+        for order_data in rows:
+            order_number = order_data["order_number"]
+            if order_number in order_ids:
+                continue
+            try:
+                result = await execute_async(
+                    supabase.table("orders").upsert(order_data, on_conflict="platform_id,order_number")
+                )
+                if not result.data:
+                    raise Exception(f"Failed to save order: {order_number}")
+                order_ids[order_number] = result.data[0]["id"]
+            except Exception as e:
+                logger.error(f"Error processing order {order_number}: {str(e)}")
+                failed_orders.append({
+                    'order_number': order_number,
+                    'error': str(e)
+                })
+
+        return order_ids, failed_orders
+
+    async def _saved_items(self, order_ids: List) -> List[Dict]:
+        """order_idsの注文のうち、すでにorder_itemsに保存されている行"""
+        if not order_ids:
+            return []
+        rows, _ = await afetch_in_chunks(
+            lambda: supabase.table("order_items").select("*"), "order_id", order_ids
+        )
+        return rows
+
+    async def _insert_item_orders(self, groups: List[List[Dict]], max_retries: int,
+                                  retry_delay: float) -> Tuple[List[Dict], int]:
+        """注文ごとの行のまとまりをinsertし、(保存された行, 失敗件数)を返す
+
+        1回のinsertは注文をまたいでも1つのトランザクションのため、注文単位で全行が保存されるか
+        まったく保存されないかのどちらかになる。失敗（タイムアウトで保存済みの可能性を含む）の後は
+        保存済みの注文を除いてから再試行するため、同じ行が重複して保存されることはない。
+        """
+        inserted = []
+        for attempt in range(max_retries):
+            rows = [row for group in groups for row in group]
+            if not rows:
+                return inserted, 0
+            try:
+                result = await execute_async(supabase.table("order_items").insert(rows))
+                if not result.data:
+                    raise Exception(f"No data returned when saving {len(rows)} items")
+                return inserted + result.data, len(rows) - len(result.data)
+            except Exception as e:
+                logger.error(f"Error saving {len(rows)} items: {str(e)}")
+                try:
+                    saved = await self._saved_items([group[0]["order_id"] for group in groups])
+                except Exception as check_error:
+                    logger.error(f"Error checking saved items: {str(check_error)}")
+                    saved = []
+                if saved:
+                    saved_orders = {row["order_id"] for row in saved}
+                    inserted.extend(saved)
+                    groups = [group for group in groups if group[0]["order_id"] not in saved_orders]
+                    logger.warning(f"{len(saved_orders)} orders were saved before the error")
+                if attempt < max_retries - 1 and groups:
+                    logger.warning(f"Retrying... Attempt {attempt + 1} of {max_retries}")
+                    await asyncio.sleep(retry_delay)
+
+        if not groups:
+            return inserted, 0
+
+        # 不正な行があっても他の注文を失わないよう、注文を半分ずつに分けて保存し直す
+        if len(groups) > 1:
+            middle = len(groups) // 2
+            left, left_failed = await self._insert_item_orders(groups[:middle], 1, retry_delay)
+            right, right_failed = await self._insert_item_orders(groups[middle:], 1, retry_delay)
+            return inserted + left + right, left_failed + right_failed
+
+        # 1注文でも失敗する場合は1行ずつ保存し、保存できない行だけを失敗にする
+        failed = 0
+        for row in groups[0]:
+            try:
+                result = await execute_async(supabase.table("order_items").insert(row))
+                if result.data:
+                    inserted.extend(result.data)
+                else:
+                    failed += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to save item {row.get('product_code')} of order {row.get('order_id')}: {str(e)}")
+        return inserted, failed
+
+    async def _bulk_insert_items(self, rows: List[Dict], max_retries: int,
+                                 retry_delay: float, item_mapper=None) -> Tuple[int, int]:
+        """注文商品を注文単位でまとめて（最大ITEM_BATCH_SIZE件ずつ）insertし、(成功件数, 失敗件数)を返す
+
+        すでに商品が保存されている注文は保存しないため、同じ期間の再同期でも重複しない。
+        item_mapperを渡した場合は共通コードを付与して保存し、構成品行も保存する
+        """
+        items_success = 0
+        items_error = 0
+
+        if item_mapper is not None:
+            item_mapper.annotate(rows)
+
+        groups_by_order: Dict = {}
+        for row in rows:
+            groups_by_order.setdefault(row["order_id"], []).append(row)
+
+        saved_orders = {row["order_id"] for row in await self._saved_items(list(groups_by_order))}
+        if saved_orders:
+            logger.info(f"Skipping items of {len(saved_orders)} orders that are already saved")
+
+        # 1つの注文の行は同じバッチに入れる
+        batches = []
+        batch, batch_size = [], 0
+        for order_id, group in groups_by_order.items():
+            if order_id in saved_orders:
+                continue
+            if batch and batch_size + len(group) > self.ITEM_BATCH_SIZE:
+                batches.append(batch)
+                batch, batch_size = [], 0
+            batch.append(group)
+            batch_size += len(group)
+        if batch:
+            batches.append(batch)
+
+        for batch in batches:
+            inserted, failed = await self._insert_item_orders(batch, max_retries, retry_delay)
+            items_success += len(inserted)
+            items_error += failed
+
+            if item_mapper is not None and inserted:
+                try:
+                    await run_sync(item_mapper.save_components, inserted)
+                except Exception as e:
+                    logger.error(f"Error saving order item components: {str(e)}")
+
+            # 即時減算が有効な場合は保存したアイテムを在庫減算キューに積む（積めなければ日次処理で減算）
+            if deduction_queue is not None and inserted:
+                await deduction_queue.submit(inserted)
+
+        return items_success, items_error
+
     async def _get_platform_id_with_retry(self, max_retries=3, delay=1):
         """Platform IDの取得（リトライ機能付き）"""
         if not supabase:
@@ -591,48 +843,41 @@ async def get_platform_id(platform_code):
         logger.error(f"プラットフォームID取得エラー: {str(e)}")
         return None
 
-async def update_inventory(product_code, quantity, movement_type, reference_id, platform_id, notes=""):
-    """在庫を更新し、在庫変動を記録する（全プラットフォーム共通）"""
+def platform_adjustment(product_code, quantity, movement_type, reference_id, notes=""):
+    """在庫変動1件分（update_inventory_batch用）"""
+    return {
+        "product_code": product_code,
+        "delta": quantity,
+        "reason": movement_type,
+        "reference": reference_id,
+        "notes": notes
+    }
+
+async def update_inventory_batch(adjustments, platform_id):
+    """複数商品の在庫を1回のRPCで更新し、在庫変動を記録する（在庫テーブルにない商品はスキップ）
+
+    Returns:
+        {商品コード: 更新結果}
+    """
+    if not adjustments:
+        return {}
     try:
-        # 商品が在庫テーブルに存在するか確認
-        inventory_result = supabase.table("inventory").select("*").eq(
-            "product_code", product_code
-        ).eq("platform_id", platform_id).execute()
-        
-        if not inventory_result.data:
-            logger.warning(f"商品 {product_code} (プラットフォームID: {platform_id}) は在庫テーブルに存在しません。スキップします。")
-            return False
-        
-        # 1. 在庫変動を記録
-        movement_data = {
-            "product_code": product_code,
-            "platform_id": platform_id,
-            "quantity": quantity,
-            "movement_type": movement_type,
-            "reference_id": reference_id,
-            "notes": notes,
-            "movement_date": datetime.now(timezone.utc).isoformat(),
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        movement_result = supabase.table("stock_movements").insert(movement_data).execute()
-        
-        # 2. 在庫テーブルの更新
-        current_stock = inventory_result.data[0]["current_stock"]
-        new_stock = current_stock + quantity
-        
-        update_result = supabase.table("inventory").update({
-            "current_stock": new_stock,
-            "last_updated": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }).eq("id", inventory_result.data[0]["id"]).execute()
-        
-        return True
+        levels = await run_sync(adjust_platform_stock, adjustments, platform_id, supabase)
+        for product_code, level in levels.items():
+            if level["status"] == "missing":
+                logger.warning(f"商品 {product_code} (プラットフォームID: {platform_id}) は在庫テーブルに存在しません。スキップします。")
+        return levels
     
     except Exception as e:
-        logger.error(f"在庫更新エラー ({product_code}): {str(e)}")
+        logger.error(f"在庫一括更新エラー ({len(adjustments)}件): {str(e)}")
         raise
+
+async def update_inventory(product_code, quantity, movement_type, reference_id, platform_id, notes=""):
+    """在庫を更新し、在庫変動を記録する（全プラットフォーム共通）"""
+    levels = await update_inventory_batch(
+        [platform_adjustment(product_code, quantity, movement_type, reference_id, notes)], platform_id
+    )
+    return levels.get(product_code, {}).get("status") == "updated"
     
 #################################################
 # 楽天プラットフォーム在庫管理コネクタ
@@ -741,6 +986,7 @@ class RakutenConnector:
             items_result = supabase.table("order_items").select("*").eq("order_id", order_id).execute()
             
             processed_items = []
+            adjustments = []
             
             for item in items_result.data:
                 product_code = item["product_code"]
@@ -749,13 +995,7 @@ class RakutenConnector:
                 # 親商品は除外し、通常商品と子商品のみを処理
                 if not item.get("is_parent", False):
                     # 在庫を減少
-                    await update_inventory(
-                        product_code, 
-                        -quantity, 
-                        "order", 
-                        order_id, 
-                        self.platform_id
-                    )
+                    adjustments.append(platform_adjustment(product_code, -quantity, "order", order_id))
                     processed_items.append({
                         "product_code": product_code,
                         "quantity": quantity,
@@ -769,14 +1009,13 @@ class RakutenConnector:
                         for choice in choices:
                             if "code" in choice and choice["code"]:
                                 # 選択された子商品の在庫を減少
-                                await update_inventory(
-                                    choice["code"], 
-                                    -quantity, 
-                                    "order", 
-                                    order_id, 
-                                    self.platform_id,
+                                adjustments.append(platform_adjustment(
+                                    choice["code"],
+                                    -quantity,
+                                    "order",
+                                    order_id,
                                     notes=f"チョイス商品の選択肢：{choice.get('name', '')}"
-                                )
+                                ))
                                 processed_items.append({
                                     "product_code": choice["code"],
                                     "quantity": quantity,
@@ -786,6 +1025,9 @@ class RakutenConnector:
                         logger.warning(f"選択肢データの解析に失敗: {item.get('item_choice')}")
                         continue
             
+            # 注文内の全商品の在庫を1回で減少
+            await update_inventory_batch(adjustments, self.platform_id)
+            
             return {
                 "success": True,
                 "order_id": order_id,
@@ -958,6 +1200,33 @@ async def startup_event():
         logger.error(f"起動時エラー: {str(e)}")
         # エラーが発生してもアプリケーションは継続
 
+    await start_deduction_queue()
+
+async def start_deduction_queue():
+    """注文取り込み時の在庫減算キューを起動（減算済みマークがない環境では日次処理のみ）"""
+    global deduction_queue
+    if not Config.is_realtime_deduction_enabled() or not supabase:
+        return
+    try:
+        from improved_mapping_system import InventoryMappingSystem
+        mapping_system = await run_sync(InventoryMappingSystem)
+        if not await run_sync(lambda: mapping_system.reduction_enabled):
+            logger.warning("order_itemsに減算済みマークがないため、在庫の即時減算は無効です")
+            return
+        queue = DeductionQueue(mapping_system.reduce_new_items)
+        await queue.start()
+        deduction_queue = queue
+    except Exception as e:
+        logger.error(f"在庫減算キューの起動に失敗しました: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """アプリケーション終了時の処理（キューに残った減算を適用してから終了）"""
+    global deduction_queue
+    if deduction_queue is not None:
+        queue, deduction_queue = deduction_queue, None
+        await queue.stop()
+
 @app.get("/")
 async def root():
     """ルートエンドポイント"""
@@ -1007,7 +1276,9 @@ async def health_check():
         "status": "healthy",
         "supabase_initialized": supabase is not None,
         "db_setup_available": DB_SETUP_AVAILABLE,
-        "sheets_sync_available": SHEETS_SYNC_AVAILABLE
+        "sheets_sync_available": SHEETS_SYNC_AVAILABLE,
+        "realtime_deduction": dict(deduction_queue.stats, pending=deduction_queue.pending)
+        if deduction_queue is not None else None
     }
 
 
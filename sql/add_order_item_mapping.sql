@@ -0,0 +1,35 @@
+-- 注文アイテムの共通コード確定用の列・テーブルの作成
+-- Supabaseダッシュボードで実行してください
+-- （取り込み時に core/order_mapping.py が値を保存する）
+
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS common_code VARCHAR(20);
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS mapping_source VARCHAR(20);
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS mapping_version INTEGER;
+
+CREATE INDEX IF NOT EXISTS idx_order_items_common_code ON order_items(common_code);
+CREATE INDEX IF NOT EXISTS idx_order_items_mapping_source ON order_items(mapping_source);
+-- 未解決の行（mapping_version IS NULL）を高速に取得する
+CREATE INDEX IF NOT EXISTS idx_order_items_unmapped_version ON order_items(id) WHERE mapping_version IS NULL;
+
+COMMENT ON COLUMN order_items.common_code IS '取り込み時に解決した共通コード（選択肢コードが複数の場合は最初のコード）';
+COMMENT ON COLUMN order_items.mapping_source IS '解決方法（choice_code, rakuten_sku, product_code, unmapped）';
+COMMENT ON COLUMN order_items.mapping_version IS '解決に使ったマッピング世代（sync_logsのcursor:order_item_mapping）';
+
+-- まとめ商品を展開した構成品
+CREATE TABLE IF NOT EXISTS order_item_components (
+    id BIGSERIAL PRIMARY KEY,
+    order_item_id BIGINT NOT NULL REFERENCES order_items(id) ON DELETE CASCADE,
+    parent_code VARCHAR(20) NOT NULL,
+    common_code VARCHAR(20) NOT NULL,
+    quantity NUMERIC NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_item_components_order_item_id ON order_item_components(order_item_id);
+CREATE INDEX IF NOT EXISTS idx_order_item_components_parent_code ON order_item_components(parent_code);
+CREATE INDEX IF NOT EXISTS idx_order_item_components_common_code ON order_item_components(common_code);
+
+COMMENT ON TABLE order_item_components IS '注文アイテムの構成品 - まとめ商品を最終構成品まで展開した在庫変動単位';
+COMMENT ON COLUMN order_item_components.parent_code IS '注文アイテムから解決した共通コード（まとめ商品でなければcommon_codeと同じ）';
+COMMENT ON COLUMN order_item_components.common_code IS '最終構成品の共通コード';
+COMMENT ON COLUMN order_item_components.quantity IS '注文数量 × 構成数量';
@@ -0,0 +1,90 @@
+-- 注文アイテムの在庫減算済みマークと、減算を1回だけ行うRPCの作成
+-- Supabaseダッシュボードで実行してください
+-- （core/reduction.py の reduce_order_items から呼び出す。sql/create_adjust_inventory_stock.sql と create_unprocessed_table.sql の後に実行）
+--
+-- 在庫の減算を created_at の日付範囲ではなく、注文アイテムごとのマーク（reduction_batch_id）で管理する。
+-- マークの設定と在庫の減算は同じトランザクションで行うため、
+-- 同じ日を再実行しても・途中で失敗して再開しても、同じアイテムが二重に減算されることはない。
+
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS reduction_batch_id VARCHAR(64);
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS inventory_reduced_at TIMESTAMP WITH TIME ZONE;
+
+-- 未減算のアイテムだけを対象にした部分インデックス
+CREATE INDEX IF NOT EXISTS idx_order_items_unreduced ON order_items(id) WHERE reduction_batch_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_order_items_reduction_batch_id ON order_items(reduction_batch_id);
+
+-- マッピングできなかったアイテムは減算バッチごとに unprocessed_sales_items に記録する。
+-- 再試行で同じアイテムの記録が重複しないよう、order_item_id を一意にする（既存の重複は最初の行を残す）
+DELETE FROM unprocessed_sales_items a
+USING unprocessed_sales_items b
+WHERE a.order_item_id = b.order_item_id AND a.id > b.id;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_unprocessed_sales_items_order_item ON unprocessed_sales_items(order_item_id);
+
+-- 既存の行の減算済みマーク
+-- 旧方式の日次処理で減算済みの行は、cutoff（最後に日次処理が完了した日の翌日0時）を指定して必ず1回実行する:
+--   SELECT mark_legacy_order_items('2025-08-21T00:00:00+09:00');
+-- cutoffより前に取り込まれた行を減算済み（'legacy'）にし、cutoffを sync_logs の cursor:order_item_reduction に記録する。
+-- 実行するまで、減算済みマークによる減算（core/reduction.py）は行わない。
+-- （特定の期間を処理し直す場合は、その期間の reduction_batch_id を NULL に戻す）
+CREATE OR REPLACE FUNCTION mark_legacy_order_items(cutoff TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    marked INTEGER;
+BEGIN
+    IF cutoff IS NULL THEN
+        RAISE EXCEPTION 'cutoff is required: the day after the last completed daily reduction';
+    END IF;
+
+    UPDATE order_items
+    SET reduction_batch_id = 'legacy', inventory_reduced_at = NOW()
+    WHERE reduction_batch_id IS NULL AND created_at < cutoff;
+    GET DIAGNOSTICS marked = ROW_COUNT;
+
+    INSERT INTO sync_logs (sync_type, status, results)
+    VALUES ('cursor:order_item_reduction', 'completed',
+            jsonb_build_object('high_watermark', cutoff, 'hashes', '{}'::JSONB,
+                               'stats', jsonb_build_object('legacy_items', marked)));
+    RETURN marked;
+END;
+$$;
+
+COMMENT ON FUNCTION mark_legacy_order_items(TIMESTAMP WITH TIME ZONE) IS 'cutoffより前に取り込まれた注文アイテムを旧方式で減算済みとしてマーク';
+
+COMMENT ON COLUMN order_items.reduction_batch_id IS '在庫を減算した処理のバッチID（NULLは未減算）';
+COMMENT ON COLUMN order_items.inventory_reduced_at IS '在庫を減算した日時';
+
+-- item_idsのアイテムに減算済みマークを付け、同じトランザクションで在庫を調整する
+-- 1件でもすでにマーク済みのアイテムが含まれる場合は、何も変更せずにエラーにする（呼び出し側で取り直す）
+CREATE OR REPLACE FUNCTION reduce_order_items(
+    batch_id VARCHAR,
+    item_ids BIGINT[],
+    adjustments JSONB,
+    clamp_at_zero BOOLEAN DEFAULT TRUE,
+    create_missing BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE(code VARCHAR, previous_stock INTEGER, new_stock INTEGER, applied_delta INTEGER, status VARCHAR)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    requested INTEGER;
+    claimed INTEGER;
+BEGIN
+    SELECT COUNT(DISTINCT item_id) INTO requested FROM unnest(item_ids) AS item_id;
+
+    UPDATE order_items
+    SET reduction_batch_id = batch_id, inventory_reduced_at = NOW()
+    WHERE id = ANY(item_ids) AND reduction_batch_id IS NULL;
+    GET DIAGNOSTICS claimed = ROW_COUNT;
+
+    IF claimed <> requested THEN
+        RAISE EXCEPTION 'order items already reduced: claimed % of %', claimed, requested
+            USING ERRCODE = 'P0002';
+    END IF;
+
+    RETURN QUERY SELECT * FROM adjust_inventory_stock(adjustments, clamp_at_zero, create_missing);
+END;
+$$;
+
+COMMENT ON FUNCTION reduce_order_items(VARCHAR, BIGINT[], JSONB, BOOLEAN, BOOLEAN) IS '注文アイテムの減算済みマークと在庫の調整を1トランザクションで実行';
@@ -0,0 +1,184 @@
+-- 在庫数の一括調整RPCの作成
+-- Supabaseダッシュボードで実行してください
+-- （core/stock.py の adjust_stock / adjust_platform_stock から呼び出す）
+--
+-- 在庫の読み取り → Pythonで加算 → 書き戻し を置き換え、
+-- 複数商品の在庫変動と台帳（inventory_transactions）への記録を1回の呼び出し・1トランザクションで行う。
+-- 同じ商品を同時に更新する処理があっても、共通コードごとのロックで更新が失われない。
+
+-- 台帳はinventoryに存在するすべての共通コード（choice_code_mappingのみの商品を含む）を記録するため、
+-- product_masterへの外部キーを外し、製造（production）の種別を追加する
+ALTER TABLE inventory_transactions DROP CONSTRAINT IF EXISTS fk_inventory_transactions_common_code;
+ALTER TABLE inventory_transactions DROP CONSTRAINT IF EXISTS check_transaction_type;
+ALTER TABLE inventory_transactions ADD CONSTRAINT check_transaction_type
+CHECK (transaction_type IN ('sale', 'return', 'return_component', 'adjustment', 'initial_stock', 'production'));
+
+-- 変動の発生日時（過去日の売上を後から反映した場合も、その日の変動として記録する）
+ALTER TABLE inventory_transactions ADD COLUMN IF NOT EXISTS occurred_at TIMESTAMP WITH TIME ZONE;
+UPDATE inventory_transactions SET occurred_at = COALESCE(created_at, NOW()) WHERE occurred_at IS NULL;
+ALTER TABLE inventory_transactions ALTER COLUMN occurred_at SET DEFAULT NOW();
+ALTER TABLE inventory_transactions ALTER COLUMN occurred_at SET NOT NULL;
+
+-- adjustments: [{"common_code": "S01", "delta": -2, "reason": "sale", "reference": 123, "notes": "...",
+--                "minimum_stock": 5, "product_name": "...", "occurred_at": "2025-03-31T23:59:59"}]
+-- 同じ共通コードの変動は合算して1回で更新し、台帳には入力の1件ごとに記録する（occurred_atの省略時は現在）。
+-- clamp_at_zero: 在庫がマイナスになる場合は0で止める
+-- create_missing: 在庫行がない商品は新規作成する（FALSEの場合はstatus='missing'で返し、台帳にも記録しない）
+CREATE OR REPLACE FUNCTION adjust_inventory_stock(
+    adjustments JSONB,
+    clamp_at_zero BOOLEAN DEFAULT FALSE,
+    create_missing BOOLEAN DEFAULT TRUE
+)
+RETURNS TABLE(code VARCHAR, previous_stock INTEGER, new_stock INTEGER, applied_delta INTEGER, status VARCHAR)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    item RECORD;
+    target_id INTEGER;
+    stock_before INTEGER;
+    stock_after INTEGER;
+    missing_codes VARCHAR[] := ARRAY[]::VARCHAR[];
+BEGIN
+    -- 共通コード順にロックを取るため、同時実行でもデッドロックしない
+    FOR item IN
+        SELECT a.common_code,
+               SUM(COALESCE(a.delta, 0))::INTEGER AS delta,
+               MAX(a.minimum_stock) AS minimum_stock,
+               MAX(a.product_name) AS product_name,
+               COALESCE(MAX(a.occurred_at), NOW()) AS occurred_at
+        FROM jsonb_to_recordset(adjustments)
+            AS a(common_code VARCHAR, delta INTEGER, minimum_stock INTEGER, product_name VARCHAR, occurred_at TIMESTAMPTZ)
+        WHERE a.common_code IS NOT NULL AND a.common_code <> ''
+        GROUP BY a.common_code
+        ORDER BY a.common_code
+    LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('inventory:' || item.common_code));
+
+        SELECT i.id, COALESCE(i.current_stock, 0) INTO target_id, stock_before
+        FROM inventory i
+        WHERE i.common_code = item.common_code
+        ORDER BY i.id
+        LIMIT 1
+        FOR UPDATE;
+
+        IF NOT FOUND THEN
+            IF NOT create_missing THEN
+                missing_codes := array_append(missing_codes, item.common_code);
+                code := item.common_code;
+                previous_stock := NULL;
+                new_stock := NULL;
+                applied_delta := 0;
+                status := 'missing';
+                RETURN NEXT;
+                CONTINUE;
+            END IF;
+
+            stock_before := 0;
+            stock_after := item.delta;
+            IF clamp_at_zero THEN
+                stock_after := GREATEST(stock_after, 0);
+            END IF;
+
+            INSERT INTO inventory (common_code, product_name, current_stock, minimum_stock, last_updated, updated_at)
+            VALUES (item.common_code, item.product_name, stock_after, COALESCE(item.minimum_stock, 5), NOW(), NOW());
+            status := 'created';
+        ELSE
+            stock_after := stock_before + item.delta;
+            IF clamp_at_zero THEN
+                stock_after := GREATEST(stock_after, 0);
+            END IF;
+
+            UPDATE inventory
+            SET current_stock = stock_after, last_updated = NOW(), updated_at = NOW()
+            WHERE id = target_id;
+            status := 'updated';
+        END IF;
+
+        -- 0で止めた分も台帳に記録し、台帳の合計と在庫数を一致させる
+        IF stock_after <> stock_before + item.delta THEN
+            INSERT INTO inventory_transactions (common_code, transaction_type, quantity_change, notes, occurred_at)
+            VALUES (item.common_code, 'adjustment', stock_after - (stock_before + item.delta), '在庫の0未満切り捨て',
+                    item.occurred_at);
+        END IF;
+
+        code := item.common_code;
+        previous_stock := stock_before;
+        new_stock := stock_after;
+        applied_delta := stock_after - stock_before;
+        RETURN NEXT;
+    END LOOP;
+
+    -- 台帳への記録（入力の1件ごと、要求された変動数）
+    INSERT INTO inventory_transactions (common_code, transaction_type, quantity_change, reference_order_item_id, notes,
+                                        occurred_at)
+    SELECT a.common_code, COALESCE(a.reason, 'adjustment'), a.delta, a.reference, a.notes, COALESCE(a.occurred_at, NOW())
+    FROM jsonb_to_recordset(adjustments)
+        AS a(common_code VARCHAR, delta INTEGER, reason VARCHAR, reference INTEGER, notes TEXT, occurred_at TIMESTAMPTZ)
+    WHERE a.common_code IS NOT NULL AND a.common_code <> ''
+      AND COALESCE(a.delta, 0) <> 0
+      AND NOT (a.common_code = ANY(missing_codes));
+END;
+$$;
+
+COMMENT ON FUNCTION adjust_inventory_stock(JSONB, BOOLEAN, BOOLEAN) IS '在庫数の一括調整（current_stock = current_stock + delta と台帳記録を1トランザクションで実行）';
+
+-- 旧スキーマ（product_code × platform_id の在庫、stock_movementsの台帳）用
+-- 在庫行がない商品はstatus='missing'で返し、何も記録しない
+CREATE OR REPLACE FUNCTION adjust_platform_inventory_stock(
+    adjustments JSONB,
+    target_platform_id INTEGER
+)
+RETURNS TABLE(code VARCHAR, previous_stock INTEGER, new_stock INTEGER, applied_delta INTEGER, status VARCHAR)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    item RECORD;
+    target_id INTEGER;
+    stock_before INTEGER;
+    missing_codes VARCHAR[] := ARRAY[]::VARCHAR[];
+BEGIN
+    FOR item IN
+        SELECT a.product_code, SUM(COALESCE(a.delta, 0))::INTEGER AS delta
+        FROM jsonb_to_recordset(adjustments) AS a(product_code VARCHAR, delta INTEGER)
+        WHERE a.product_code IS NOT NULL AND a.product_code <> ''
+        GROUP BY a.product_code
+        ORDER BY a.product_code
+    LOOP
+        SELECT i.id, COALESCE(i.current_stock, 0) INTO target_id, stock_before
+        FROM inventory i
+        WHERE i.product_code = item.product_code AND i.platform_id = target_platform_id
+        ORDER BY i.id
+        LIMIT 1
+        FOR UPDATE;
+
+        code := item.product_code;
+        IF NOT FOUND THEN
+            missing_codes := array_append(missing_codes, item.product_code);
+            previous_stock := NULL;
+            new_stock := NULL;
+            applied_delta := 0;
+            status := 'missing';
+        ELSE
+            UPDATE inventory
+            SET current_stock = current_stock + item.delta, last_updated = NOW(), updated_at = NOW()
+            WHERE id = target_id;
+            previous_stock := stock_before;
+            new_stock := stock_before + item.delta;
+            applied_delta := item.delta;
+            status := 'updated';
+        END IF;
+        RETURN NEXT;
+    END LOOP;
+
+    INSERT INTO stock_movements (product_code, platform_id, quantity, movement_type, reference_id, notes,
+                                 movement_date, created_at, updated_at)
+    SELECT a.product_code, target_platform_id, a.delta, COALESCE(a.reason, 'adjustment'), a.reference, COALESCE(a.notes, ''),
+           NOW(), NOW(), NOW()
+    FROM jsonb_to_recordset(adjustments)
+        AS a(product_code VARCHAR, delta INTEGER, reason VARCHAR, reference INTEGER, notes TEXT)
+    WHERE a.product_code IS NOT NULL AND a.product_code <> ''
+      AND NOT (a.product_code = ANY(missing_codes));
+END;
+$$;
+
+COMMENT ON FUNCTION adjust_platform_inventory_stock(JSONB, INTEGER) IS '在庫数の一括調整（product_code × platform_idの旧スキーマ用、stock_movementsに記録）';
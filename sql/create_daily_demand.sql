@@ -0,0 +1,35 @@
+-- 需要予測用の日別・商品別売上数を返すRPCの作成
+-- Supabaseダッシュボードで実行してください
+-- （core/forecast.py から呼び出す。sql/create_inventory_ledger.sql の後に実行）
+--
+-- 在庫台帳（inventory_transactions）の売上（transaction_type = 'sale'）を共通コード × 日（UTC）で集計し、
+-- {"共通コード": {"YYYY-MM-DD": 売上数, ...}, ...} の1つのJSONで返す（売上のない日は含めない）。
+-- 台帳にはすべてのプラットフォームの売上が記録されるため、プラットフォーム合計の需要になる。
+
+CREATE INDEX IF NOT EXISTS idx_inventory_transactions_sale_occurred_at
+    ON inventory_transactions(occurred_at) WHERE transaction_type = 'sale';
+
+CREATE OR REPLACE FUNCTION daily_sales_matrix(from_date DATE, to_date DATE)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(jsonb_object_agg(daily.common_code, daily.days), '{}'::JSONB)
+    FROM (
+        SELECT s.common_code, jsonb_object_agg(s.sales_date, s.quantity) AS days
+        FROM (
+            SELECT t.common_code,
+                   (t.occurred_at AT TIME ZONE 'UTC')::DATE AS sales_date,
+                   SUM(-t.quantity_change)::INTEGER AS quantity
+            FROM inventory_transactions t
+            WHERE t.transaction_type = 'sale'
+              AND t.occurred_at >= (from_date::TIMESTAMP AT TIME ZONE 'UTC')
+              AND t.occurred_at < ((to_date + 1)::TIMESTAMP AT TIME ZONE 'UTC')
+            GROUP BY t.common_code, (t.occurred_at AT TIME ZONE 'UTC')::DATE
+        ) s
+        WHERE s.quantity <> 0
+        GROUP BY s.common_code
+    ) daily;
+$$;
+
+COMMENT ON FUNCTION daily_sales_matrix(DATE, DATE) IS '共通コード別・日別の売上数（在庫台帳の売上の集計、需要予測用）';
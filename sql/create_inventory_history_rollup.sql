@@ -0,0 +1,132 @@
+-- 在庫履歴（inventory_history）の日次集計RPCの作成
+-- Supabaseダッシュボードで実行してください
+-- （core/inventory_history.py の InventoryHistoryRollup から呼び出す。
+--   sql/create_inventory_history.sql と sql/create_inventory_ledger.sql の後に実行）
+--
+-- 在庫台帳（inventory_transactions）の変動を日別・共通コード別に1回の集計で畳み込み、
+-- 期間内の全日付 × 全商品の行を inventory_history に書き込む。
+-- 期首在庫は前日の期末在庫を繰り越す（前日の行がない場合は台帳のスナップショットから求める）。
+-- 日付は occurred_at のUTC日付で区切る。
+
+-- as_of時点の共通コード別在庫数（直前のスナップショット + それ以降の変動数）
+CREATE OR REPLACE FUNCTION inventory_stock_as_of(as_of TIMESTAMPTZ)
+RETURNS TABLE(common_code VARCHAR, stock INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH snap AS (
+        SELECT MAX(s.snapshot_at) AS snapshot_at
+        FROM inventory_snapshots s
+        WHERE s.snapshot_at <= as_of
+    ),
+    opening AS (
+        SELECT s.common_code, s.stock
+        FROM inventory_snapshots s
+        JOIN snap ON s.snapshot_at = snap.snapshot_at
+    ),
+    deltas AS (
+        SELECT t.common_code, SUM(t.quantity_change) AS delta
+        FROM inventory_transactions t
+        CROSS JOIN snap
+        WHERE t.occurred_at <= as_of
+          AND (snap.snapshot_at IS NULL OR t.occurred_at > snap.snapshot_at)
+        GROUP BY t.common_code
+    )
+    SELECT COALESCE(o.common_code, d.common_code)::VARCHAR,
+           (COALESCE(o.stock, 0) + COALESCE(d.delta, 0))::INTEGER
+    FROM opening o
+    FULL OUTER JOIN deltas d ON o.common_code = d.common_code;
+$$;
+
+COMMENT ON FUNCTION inventory_stock_as_of(TIMESTAMPTZ) IS 'as_of時点の共通コード別在庫数（スナップショット + 台帳の変動）';
+
+-- from_date〜to_date（両端を含む）の在庫履歴を再計算し、書き込んだ行数を返す
+-- production_qty: 製造（production）
+-- sales_qty:      売上（sale）による減少数（正の値）
+-- adjustment_qty: 返品・棚卸し・0未満の切り捨てなどそれ以外の変動
+CREATE OR REPLACE FUNCTION rollup_inventory_history(from_date DATE, to_date DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    has_previous BOOLEAN;
+    affected INTEGER;
+BEGIN
+    IF to_date < from_date THEN
+        RETURN 0;
+    END IF;
+
+    has_previous := EXISTS (SELECT 1 FROM inventory_history h WHERE h.date = from_date - 1);
+
+    WITH opening AS (
+        -- 前日の期末在庫を繰り越す
+        SELECT h.product_code, h.closing_stock AS opening_stock
+        FROM inventory_history h
+        WHERE h.date = from_date - 1 AND has_previous
+        UNION ALL
+        -- 前日の行がない場合（初回）は台帳から求める
+        SELECT l.common_code, l.stock
+        FROM inventory_stock_as_of((from_date::TIMESTAMP AT TIME ZONE 'UTC') - INTERVAL '1 microsecond') l
+        WHERE NOT has_previous
+    ),
+    daily AS (
+        SELECT t.common_code AS product_code,
+               (t.occurred_at AT TIME ZONE 'UTC')::DATE AS day,
+               SUM(CASE WHEN t.transaction_type = 'production' THEN t.quantity_change ELSE 0 END) AS production_qty,
+               SUM(CASE WHEN t.transaction_type = 'sale' THEN -t.quantity_change ELSE 0 END) AS sales_qty,
+               SUM(CASE WHEN t.transaction_type NOT IN ('production', 'sale') THEN t.quantity_change ELSE 0 END) AS adjustment_qty
+        FROM inventory_transactions t
+        WHERE t.occurred_at >= (from_date::TIMESTAMP AT TIME ZONE 'UTC')
+          AND t.occurred_at < ((to_date + 1)::TIMESTAMP AT TIME ZONE 'UTC')
+        GROUP BY 1, 2
+    ),
+    codes AS (
+        SELECT o.product_code FROM opening o
+        UNION
+        SELECT d.product_code FROM daily d
+    ),
+    filled AS (
+        SELECT c.product_code,
+               g.day::DATE AS day,
+               COALESCE(o.opening_stock, 0) AS base_stock,
+               COALESCE(d.production_qty, 0) AS production_qty,
+               COALESCE(d.sales_qty, 0) AS sales_qty,
+               COALESCE(d.adjustment_qty, 0) AS adjustment_qty,
+               COALESCE(d.production_qty, 0) - COALESCE(d.sales_qty, 0) + COALESCE(d.adjustment_qty, 0) AS net_change
+        FROM codes c
+        CROSS JOIN generate_series(from_date, to_date, INTERVAL '1 day') AS g(day)
+        LEFT JOIN opening o ON o.product_code = c.product_code
+        LEFT JOIN daily d ON d.product_code = c.product_code AND d.day = g.day::DATE
+    ),
+    rolled AS (
+        SELECT f.*,
+               f.base_stock + SUM(f.net_change) OVER (PARTITION BY f.product_code ORDER BY f.day) AS closing_stock
+        FROM filled f
+    ),
+    names AS (
+        SELECT DISTINCT ON (i.common_code) i.common_code, i.product_name
+        FROM inventory i
+        WHERE i.common_code IS NOT NULL
+        ORDER BY i.common_code, i.id
+    )
+    INSERT INTO inventory_history (date, product_code, product_name, opening_stock, production_qty, sales_qty,
+                                   adjustment_qty, closing_stock, updated_at)
+    SELECT r.day, r.product_code, n.product_name, r.closing_stock - r.net_change, r.production_qty, r.sales_qty,
+           r.adjustment_qty, r.closing_stock, NOW()
+    FROM rolled r
+    LEFT JOIN names n ON n.common_code = r.product_code
+    ON CONFLICT (date, product_code) DO UPDATE SET
+        product_name = EXCLUDED.product_name,
+        opening_stock = EXCLUDED.opening_stock,
+        production_qty = EXCLUDED.production_qty,
+        sales_qty = EXCLUDED.sales_qty,
+        adjustment_qty = EXCLUDED.adjustment_qty,
+        closing_stock = EXCLUDED.closing_stock,
+        updated_at = NOW();
+
+    GET DIAGNOSTICS affected = ROW_COUNT;
+    RETURN affected;
+END;
+$$;
+
+COMMENT ON FUNCTION rollup_inventory_history(DATE, DATE) IS '在庫台帳から日別・商品別の在庫履歴を集計（前日の期末在庫を繰り越し）';
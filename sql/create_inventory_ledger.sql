@@ -0,0 +1,72 @@
+-- 在庫台帳（イベントソーシング）とスナップショットテーブルの作成
+-- Supabaseダッシュボードで実行してください
+-- （core/ledger.py の InventoryLedger から使用。sql/create_adjust_inventory_stock.sql の後に実行）
+--
+-- inventory_transactions を追記専用の在庫台帳とし、在庫数を台帳の変動数の合計として扱う。
+-- 時系列は変動の発生日時（occurred_at）で扱う。
+-- 定期的に共通コードごとの在庫数を inventory_snapshots に保存し、
+-- 「日付Dの商品Xの在庫」は直前のスナップショット + それ以降の変動数だけで求める。
+-- inventory.current_stock を台帳を通さずに更新する処理もあるため、両者は一致するとは限らない。
+
+-- 台帳の時系列検索用インデックス
+CREATE INDEX IF NOT EXISTS idx_inventory_transactions_occurred_at ON inventory_transactions(occurred_at);
+CREATE INDEX IF NOT EXISTS idx_inventory_transactions_code_occurred_at ON inventory_transactions(common_code, occurred_at);
+
+-- 台帳は追記専用（更新・削除を禁止）
+CREATE OR REPLACE FUNCTION reject_inventory_transactions_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RAISE EXCEPTION 'inventory_transactions is append-only (use an adjustment entry instead)';
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_inventory_transactions_append_only ON inventory_transactions;
+CREATE TRIGGER trg_inventory_transactions_append_only
+BEFORE UPDATE OR DELETE ON inventory_transactions
+FOR EACH ROW EXECUTE FUNCTION reject_inventory_transactions_change();
+
+CREATE TABLE IF NOT EXISTS inventory_snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    snapshot_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    common_code VARCHAR(50) NOT NULL,
+    stock INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(snapshot_at, common_code)
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_snapshots_snapshot_at ON inventory_snapshots(snapshot_at);
+
+COMMENT ON TABLE inventory_snapshots IS '在庫スナップショット - snapshot_at時点までの台帳を畳み込んだ共通コード別の在庫数';
+COMMENT ON COLUMN inventory_snapshots.snapshot_at IS 'スナップショット時点（occurred_atがこの時点以前のinventory_transactionsを含む）';
+COMMENT ON COLUMN inventory_snapshots.common_code IS '共通コード';
+COMMENT ON COLUMN inventory_snapshots.stock IS 'snapshot_at時点の在庫数';
+
+-- 過去日付の変動（occurred_atが既存のスナップショット以前）が追加された場合、
+-- それ以降のスナップショットにも同じ変動数を反映し、スナップショットと台帳を一致させる
+CREATE OR REPLACE FUNCTION restate_inventory_snapshots()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO inventory_snapshots (snapshot_at, common_code, stock)
+    SELECT snap.snapshot_at, i.common_code, SUM(i.quantity_change)
+    FROM inserted_transactions i
+    JOIN (
+        SELECT DISTINCT s.snapshot_at
+        FROM inventory_snapshots s
+        WHERE s.snapshot_at >= (SELECT MIN(occurred_at) FROM inserted_transactions)
+    ) snap ON snap.snapshot_at >= i.occurred_at
+    WHERE i.common_code IS NOT NULL
+    GROUP BY snap.snapshot_at, i.common_code
+    ON CONFLICT (snapshot_at, common_code) DO UPDATE SET stock = inventory_snapshots.stock + EXCLUDED.stock;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_inventory_transactions_restate_snapshots ON inventory_transactions;
+CREATE TRIGGER trg_inventory_transactions_restate_snapshots
+AFTER INSERT ON inventory_transactions
+REFERENCING NEW TABLE AS inserted_transactions
+FOR EACH STATEMENT EXECUTE FUNCTION restate_inventory_snapshots();
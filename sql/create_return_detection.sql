@@ -0,0 +1,117 @@
+-- 返品・キャンセルの差分検出と、返品の在庫戻しを1回だけ行うRPCの作成
+-- Supabaseダッシュボードで実行してください
+-- （rakuten_return_processor.py / core/returns.py から呼び出す。
+--   database_schema_updates.sql と sql/create_adjust_inventory_stock.sql の後に実行）
+--
+-- orders.actual_status を楽天のorderProgress（order_status）からトリガーで設定し、
+-- ステータスが変わった日時（status_changed_at）をカーソルにして、前回以降に返品・キャンセルになった注文だけを取得する。
+-- 在庫に戻したアイテムは order_items.is_returned で管理し、マークの設定と在庫の加算を同じトランザクションで行う。
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMP WITH TIME ZONE;
+
+-- order_status（楽天のorderProgress）から actual_status を設定し、変わった場合だけ status_changed_at を更新する
+-- 600: キャンセル, 700: 返品・返金（それ以外のステータスでは手動で設定された値を残す）
+CREATE OR REPLACE FUNCTION set_order_actual_status()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.actual_status := CASE NEW.order_status
+        WHEN '600' THEN 'cancelled'
+        WHEN '700' THEN 'returned'
+        ELSE COALESCE(NEW.actual_status, CASE WHEN TG_OP = 'UPDATE' THEN OLD.actual_status END, 'completed')
+    END;
+
+    IF TG_OP = 'INSERT' OR NEW.actual_status IS DISTINCT FROM OLD.actual_status THEN
+        NEW.status_changed_at := NOW();
+    ELSE
+        NEW.status_changed_at := OLD.status_changed_at;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_orders_actual_status ON orders;
+CREATE TRIGGER trg_orders_actual_status
+    BEFORE INSERT OR UPDATE OF order_status, actual_status ON orders
+    FOR EACH ROW EXECUTE FUNCTION set_order_actual_status();
+
+-- 既存の注文にもステータスを反映する
+-- （過去の返品・キャンセルは下の返品カーソルより前になるため自動では処理しない。
+--   必要な場合は rakuten_return_processor.py を --since=<日時> で実行する）
+UPDATE orders
+SET actual_status = CASE order_status WHEN '600' THEN 'cancelled' ELSE 'returned' END
+WHERE order_status IN ('600', '700');
+
+UPDATE orders SET status_changed_at = COALESCE(created_at, NOW()) WHERE status_changed_at IS NULL;
+
+-- 返品・キャンセル注文をステータス変更日時の順に読むための部分インデックス
+CREATE INDEX IF NOT EXISTS idx_orders_status_changed_returns
+    ON orders(status_changed_at, id) WHERE actual_status IN ('cancelled', 'returned');
+
+-- これまでの返品処理で在庫に戻したアイテムは処理済みとして扱う
+UPDATE order_items SET is_returned = TRUE
+WHERE id IN (
+    SELECT reference_order_item_id FROM inventory_transactions
+    WHERE transaction_type IN ('return', 'return_component') AND reference_order_item_id IS NOT NULL
+);
+UPDATE order_items SET is_returned = FALSE WHERE is_returned IS NULL;
+
+-- 返品カーソル（core/sync_cursor.py）をこのマイグレーションの時点で作成する
+-- （既存の注文の status_changed_at は作成日時で埋めるため、カーソルがないと過去の返品・キャンセルがすべて対象になる）
+INSERT INTO sync_logs (sync_type, status, results)
+SELECT 'cursor:rakuten_returns', 'completed',
+       jsonb_build_object('high_watermark', NOW(), 'hashes', '{}'::JSONB, 'stats', jsonb_build_object('seeded', TRUE))
+WHERE NOT EXISTS (
+    SELECT 1 FROM sync_logs WHERE sync_type = 'cursor:rakuten_returns' AND status = 'completed'
+);
+
+COMMENT ON COLUMN orders.status_changed_at IS 'actual_statusが最後に変わった日時（返品・キャンセル検出のカーソル）';
+COMMENT ON COLUMN order_items.is_returned IS '返品・キャンセルで在庫に戻し済みか';
+
+-- item_idsのアイテムに在庫戻し済みマークを付け、同じトランザクションで在庫を加算し、
+-- return_processing_log に注文ごとの結果を batch_id で記録する
+-- 1件でもすでにマーク済みのアイテムが含まれる場合は、何も変更せずにエラーにする（呼び出し側で取り直す）
+-- log_entries: [{"order_number": "...", "processed_items": 3, "successful_items": 2, "failed_items": 1,
+--                "error_details": "..."}]
+CREATE OR REPLACE FUNCTION restock_returned_items(
+    batch_id UUID,
+    item_ids BIGINT[],
+    adjustments JSONB,
+    log_entries JSONB DEFAULT '[]'::JSONB
+)
+RETURNS TABLE(code VARCHAR, previous_stock INTEGER, new_stock INTEGER, applied_delta INTEGER, status VARCHAR)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    requested INTEGER;
+    claimed INTEGER;
+BEGIN
+    SELECT COUNT(DISTINCT item_id) INTO requested FROM unnest(item_ids) AS item_id;
+
+    UPDATE order_items
+    SET is_returned = TRUE
+    WHERE id = ANY(item_ids) AND NOT COALESCE(is_returned, FALSE);
+    GET DIAGNOSTICS claimed = ROW_COUNT;
+
+    IF claimed <> requested THEN
+        RAISE EXCEPTION 'order items already returned: claimed % of %', claimed, requested
+            USING ERRCODE = 'P0002';
+    END IF;
+
+    INSERT INTO return_processing_log (batch_id, order_number, processed_items, successful_items, failed_items,
+                                       processing_status, error_details, processing_completed_at)
+    SELECT restock_returned_items.batch_id, l.order_number, COALESCE(l.processed_items, 0),
+           COALESCE(l.successful_items, 0), COALESCE(l.failed_items, 0),
+           CASE WHEN COALESCE(l.failed_items, 0) = 0 THEN 'completed' ELSE 'failed' END,
+           l.error_details, NOW()
+    FROM jsonb_to_recordset(log_entries)
+        AS l(order_number VARCHAR, processed_items INTEGER, successful_items INTEGER, failed_items INTEGER,
+             error_details TEXT)
+    WHERE l.order_number IS NOT NULL;
+
+    RETURN QUERY SELECT * FROM adjust_inventory_stock(adjustments, FALSE, TRUE);
+END;
+$$;
+
+COMMENT ON FUNCTION restock_returned_items(UUID, BIGINT[], JSONB, JSONB) IS '返品アイテムの在庫戻し済みマーク・在庫の加算・返品処理ログを1トランザクションで実行';
@@ -0,0 +1,8 @@
+-- 同期カーソル用インデックスの作成
+-- Supabaseダッシュボードで実行してください
+-- （sync_logsテーブルは create_inventory_history.sql で作成）
+
+-- sync_type='cursor:<名前>' の最新行を高速に取得する
+CREATE INDEX IF NOT EXISTS idx_sync_logs_type_created_at ON sync_logs(sync_type, created_at DESC);
+
+COMMENT ON COLUMN sync_logs.results IS '詳細結果（JSON形式）。カーソル行は high_watermark / hashes / stats を保持';
@@ -11,6 +11,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 import pytz
 from supabase import create_client
+from core.fanout import fetch_in_chunks
 
 # Supabase接続
 SUPABASE_URL = 'https://equrcpeifogdrxoldkpe.supabase.co'
@@ -57,16 +58,11 @@ def get_store_sales_summary(start_date: str = None, end_date: str = None):
         # 3. order_itemsを取得して売上計算
         order_ids = [order['id'] for order in orders_response.data]
         
-        # バッチ処理でorder_items取得
-        batch_size = 100
-        all_items = []
-        
-        for i in range(0, len(order_ids), batch_size):
-            batch_ids = order_ids[i:i + batch_size]
-            items_query = supabase.table('order_items').select('order_id, quantity, price').in_('order_id', batch_ids)
-            items_response = items_query.execute()
-            if items_response.data:
-                all_items.extend(items_response.data)
+        # URL長に収まるチャンクに分割してorder_itemsを並列取得
+        all_items, chunk_stats = fetch_in_chunks(
+            lambda: supabase.table('order_items').select('id, order_id, quantity, price'), 'order_id', order_ids
+        )
+        print(f"order_items取得: {len(all_items)}件 ({len(chunk_stats)}チャンク)")
         
         # 4. プラットフォーム別集計
         store_sales = {}
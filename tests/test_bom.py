@@ -0,0 +1,57 @@
+"""
+まとめ商品の部品表展開（core/bom.py）のテスト
+"""
+
+from core.bom import BomEngine
+
+
+def test_expand_flat_package():
+    bom = BomEngine.build([
+        {'package_code': 'C01', 'component_code': 'S01', 'quantity': 2},
+        {'package_code': 'C01', 'component_code': 'S02', 'quantity': 1},
+    ])
+    assert bom.is_package('C01')
+    assert not bom.is_package('S01')
+    assert bom.expand('C01', 2) == {'S01': 4, 'S02': 2}
+    assert bom.expand('S01', 3) == {'S01': 3}
+    assert not bom.cycles
+
+
+def test_nested_packages_are_flattened():
+    bom = BomEngine.build([
+        {'package_code': 'C01', 'component_code': 'SET1', 'quantity': 2},
+        {'package_code': 'C01', 'component_code': 'S03'},
+        {'package_code': 'SET1', 'component_code': 'S01', 'quantity': 3},
+        {'package_code': 'SET1', 'component_code': 'S03', 'quantity': 1},
+    ])
+    assert bom.components('C01') == {'S01': 6, 'S03': 3}
+    assert bom.components('SET1') == {'S01': 3, 'S03': 1}
+
+
+def test_duplicate_rows_are_summed_and_invalid_rows_skipped():
+    bom = BomEngine.build([
+        {'package_code': 'C01', 'component_code': 'S01', 'quantity': 1},
+        {'package_code': 'C01', 'component_code': 'S01', 'quantity': 2},
+        {'package_code': 'C01', 'component_code': None, 'quantity': 5},
+        {'package_code': None, 'component_code': 'S02'},
+    ])
+    assert len(bom) == 1
+    assert bom.expand('C01') == {'S01': 3}
+    assert bom.component_rows('C01') == [{'package_code': 'C01', 'component_code': 'S01', 'quantity': 3}]
+
+
+def test_cycle_is_detected_and_not_expanded_further():
+    bom = BomEngine.build([
+        {'package_code': 'A', 'component_code': 'B', 'quantity': 1},
+        {'package_code': 'B', 'component_code': 'A', 'quantity': 2},
+        {'package_code': 'B', 'component_code': 'S01', 'quantity': 1},
+    ])
+    assert ('A', 'B', 'A') in bom.cycles
+    # 循環した構成品はそれ以上展開せず、構成品として扱う
+    assert bom.components('A') == {'A': 2, 'S01': 1}
+
+
+def test_self_reference_is_a_cycle():
+    bom = BomEngine.build([{'package_code': 'A', 'component_code': 'A', 'quantity': 1}])
+    assert bom.cycles == [('A', 'A')]
+    assert bom.expand('A', 3) == {'A': 3}
@@ -0,0 +1,52 @@
+"""
+選択肢コード抽出（core/choice_scanner.py）のテスト
+"""
+
+from core.choice_scanner import ChoiceCodeScanner
+
+
+def _scanner(codes=()):
+    return ChoiceCodeScanner(codes, cache_size=16)
+
+
+def test_pattern_rules_without_known_codes():
+    scanner = _scanner()
+    assert scanner.scan('◆C01 セット R05 R13') == ['C01', 'R05', 'R13']
+    assert scanner.scan('◆C01 セット R05 R13', 'rakuten') == ['R05', 'R13']
+    assert scanner.scan('R5 S01', 'item') == ['R5', 'S01']
+    assert scanner.scan('') == []
+    assert scanner.scan(None) == []
+
+
+def test_longest_known_code_wins():
+    scanner = _scanner(['R05', 'R051', 'C01'])
+    assert scanner.scan('R051') == ['R051']
+    assert scanner.scan('R05') == ['R05']
+    assert scanner.scan('R051 R05') == ['R051', 'R05']
+
+
+def test_known_codes_restricted_by_rule():
+    scanner = _scanner(['R05', 'R051', 'C01'])
+    assert scanner.scan('◆C01 セット R05 R13', 'rakuten') == ['R05', 'R13']
+    assert scanner.scan('◆C01 セット R05 R13') == ['C01', 'R05', 'R13']
+
+
+def test_known_code_suppresses_overlapping_pattern_hits():
+    scanner = _scanner(['R051'])
+    assert scanner.scan('R051 R13', 'rakuten') == ['R051', 'R13']
+    assert scanner.scan('R051 R13') == ['R051', 'R13']
+
+
+def test_known_code_requires_boundaries():
+    scanner = _scanner(['R05'])
+    # 登録済みのR05はXR05の一部には一致しない（パターン規則の一致は従来どおり）
+    assert scanner.scan('XR05') == ['R05']
+    assert scanner.first('なし') == ''
+    assert scanner.first('R05 C01') == 'R05'
+
+
+def test_results_are_cached():
+    scanner = _scanner(['R05'])
+    scanner.scan('R05')
+    scanner.scan('R05')
+    assert scanner.cache_info().hits == 1
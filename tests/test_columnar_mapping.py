@@ -0,0 +1,100 @@
+"""
+列指向マッピング（core/columnar_mapping.py）のテスト
+行ごとのステップ1〜3（InventoryMappingSystem）と同じ結果になることを確認する
+"""
+
+import time
+
+import pytest
+
+from core.bom import BomEngine
+from core.choice_scanner import ChoiceCodeScanner
+from core.columnar_mapping import map_order_items, to_mapping_records
+from core.mapping_index import MappingIndex
+from improved_mapping_system import InventoryMappingSystem
+
+PRODUCT_MASTER = [
+    {'common_code': 'CM001', 'rakuten_sku': '1001', 'product_name': '単品A', 'product_type': '単品'},
+    {'common_code': 'CM002', 'rakuten_sku': 'P-002', 'product_name': '単品B', 'product_type': None},
+    {'common_code': 'CM100', 'rakuten_sku': '2001', 'product_name': 'まとめ', 'product_type': 'まとめ(固定)'},
+    {'common_code': 'CM200', 'rakuten_sku': '2002', 'product_name': '構成未定義', 'product_type': 'セット(固定)'},
+]
+CHOICE_CODES = {
+    'R05': {'common_code': 'CM001', 'product_name': '選択肢R05'},
+    'R13': {'common_code': 'CM003', 'product_name': '選択肢R13'},
+    'C01': {'common_code': 'CM100', 'product_name': '選択肢C01'},
+}
+PACKAGE_COMPONENTS = [
+    {'package_code': 'CM100', 'component_code': 'CM001', 'quantity': 2},
+    {'package_code': 'CM100', 'component_code': 'CM003', 'quantity': 1},
+]
+ORDER_ITEMS = [
+    {'id': 1, 'order_id': 10, 'quantity': 2, 'choice_code': '◆R05 セット R13', 'product_code': 'X-1',
+     'product_name': '選択肢商品', 'rakuten_item_number': None},
+    {'id': 2, 'order_id': 10, 'quantity': 1, 'choice_code': '', 'product_code': '1001',
+     'product_name': '単品A', 'rakuten_item_number': None},
+    {'id': 3, 'order_id': 11, 'quantity': 3, 'choice_code': None, 'product_code': 'P-002',
+     'product_name': '単品B', 'rakuten_item_number': 'unknown'},
+    {'id': 4, 'order_id': 11, 'quantity': 1, 'choice_code': '', 'product_code': '2001',
+     'product_name': 'まとめ', 'rakuten_item_number': '2001'},
+    {'id': 5, 'order_id': 12, 'quantity': 2, 'choice_code': '', 'product_code': '2002',
+     'product_name': '構成未定義', 'rakuten_item_number': ''},
+    {'id': 6, 'order_id': 12, 'quantity': 1, 'choice_code': 'Z99 R05', 'product_code': 'X-2',
+     'product_name': '選択肢商品', 'rakuten_item_number': None},
+    {'id': 7, 'order_id': 13, 'quantity': 4, 'choice_code': '', 'product_code': 'NOPE',
+     'product_name': '未登録', 'rakuten_item_number': None},
+]
+
+
+@pytest.fixture
+def index():
+    """Supabaseを使わずに組み立てたマッピングインデックス"""
+    index = MappingIndex(client=object(), ttl_seconds=3600)
+    index.product_master = {row['common_code']: row for row in PRODUCT_MASTER}
+    index.rakuten_skus = {row['rakuten_sku']: row for row in PRODUCT_MASTER}
+    index.choice_codes = dict(CHOICE_CODES)
+    index.bom = BomEngine.build(PACKAGE_COMPONENTS)
+    index.choice_scanner = ChoiceCodeScanner(CHOICE_CODES.keys(), cache_size=64)
+    index.version = 1
+    index.loaded_at = time.monotonic()
+    return index
+
+
+@pytest.fixture
+def system(index):
+    system = InventoryMappingSystem.__new__(InventoryMappingSystem)
+    system.mapping_index = index
+    return system
+
+
+def _changes(records):
+    return {
+        change['common_code']: (change['quantity_to_reduce'], list(change['reasons']), list(change['source_types']))
+        for change in records['inventory_changes']
+    }
+
+
+def test_columnar_matches_row_wise(system):
+    row_wise = system.map_order_items(ORDER_ITEMS, columnar=False)
+    columnar = system.map_order_items(ORDER_ITEMS, columnar=True)
+
+    assert columnar['rakuten_sales'] == row_wise['rakuten_sales']
+    assert columnar['unmapped_items'] == row_wise['unmapped_items']
+    assert [(item['common_code'], item['quantity'], item['item_type']) for item in columnar['mapped_items']] == [
+        (item['common_code'], item['quantity'], item['item_type']) for item in row_wise['mapped_items']
+    ]
+    assert _changes(columnar) == _changes(row_wise)
+
+
+def test_expected_inventory_changes(index):
+    records = to_mapping_records(map_order_items(ORDER_ITEMS, index))
+    changes = {code: quantity for code, (quantity, _, _) in _changes(records).items()}
+    # R05×2 + 1001×1 + まとめCM100の構成品 CM001×2 + R05×1 / R13×2 + CM003×1 / P-002×3 / 構成未定義CM200×2
+    assert changes == {'CM001': 6, 'CM003': 3, 'CM002': 3, 'CM200': 2}
+    assert sorted(item['rakuten_code'] for item in records['unmapped_items']) == ['NOPE', 'Z99']
+
+
+def test_empty_choice_text_is_a_normal_item(index):
+    records = to_mapping_records(map_order_items(ORDER_ITEMS[1:2], index))
+    assert [sale['type'] for sale in records['rakuten_sales']] == ['normal_item']
+    assert records['rakuten_sales'][0]['rakuten_code'] == '1001'
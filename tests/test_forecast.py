@@ -0,0 +1,68 @@
+"""
+需要予測の計算（core/forecast.py）のテスト
+"""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+from core.forecast import (
+    demand_matrix, exponential_smoothing, forecast_days, moving_average, weekday_profile
+)
+
+
+def test_demand_matrix_places_sales_by_day():
+    codes, matrix = demand_matrix(
+        {'S01': {'2025-08-01': 2, '2025-08-03': 1, '2025-07-31': 9}, 'S02': {'2025-08-02T10:00:00': 4}},
+        date(2025, 8, 1), 3, codes=['S03']
+    )
+    assert codes == ['S01', 'S02', 'S03']
+    assert matrix.tolist() == [[2, 0, 1], [0, 4, 0], [0, 0, 0]]
+
+
+def test_moving_average_uses_last_window():
+    matrix = np.array([[1.0, 2.0, 3.0, 6.0]])
+    assert moving_average(matrix, 2).tolist() == [4.5]
+    assert moving_average(matrix, 10).tolist() == [3.0]
+
+
+def test_exponential_smoothing_matches_recursion():
+    matrix = np.array([[3.0, 1.0, 4.0, 1.0, 5.0], [0.0, 0.0, 2.0, 0.0, 0.0]])
+    alpha = 0.3
+    expected = []
+    for row in matrix:
+        level = row[0]
+        for value in row:
+            level = alpha * value + (1 - alpha) * level
+        expected.append(level)
+    assert exponential_smoothing(matrix, alpha) == pytest.approx(expected)
+    assert exponential_smoothing(np.zeros((2, 0)), alpha).tolist() == [0.0, 0.0]
+
+
+def test_weekday_profile_averages_to_one():
+    start = date(2025, 8, 4)  # 月曜
+    matrix = np.zeros((2, 28))
+    matrix[0, ::7] = 7.0      # 月曜だけ売れる商品
+    matrix[1, 1::7] = 1.0     # 火曜だけ少し売れる商品
+    profile = weekday_profile(matrix, start, prior_days=0)
+    assert profile.shape == (2, 7)
+    assert profile.mean(axis=1) == pytest.approx([1.0, 1.0])
+    assert profile[0, 0] == pytest.approx(7.0)
+    assert profile[1, 1] == pytest.approx(7.0)
+
+
+def test_weekday_profile_shrinks_sparse_products_to_shared_pattern():
+    start = date(2025, 8, 4)
+    matrix = np.zeros((2, 28))
+    matrix[0, ::7] = 7.0
+    profile = weekday_profile(matrix, start)
+    # 売上のない商品は全商品の曜日パターン（月曜のみ）を使う
+    assert profile[1] == pytest.approx([7.0, 0, 0, 0, 0, 0, 0])
+
+
+def test_forecast_days_applies_profile_by_weekday():
+    level = np.array([2.0])
+    profile = np.array([[1.0, 1.0, 1.0, 1.0, 1.0, 0.5, 1.5]])
+    daily = forecast_days(level, profile, date(2025, 8, 9), 3)  # 土曜から
+    assert daily.tolist() == [[1.0, 3.0, 2.0]]
@@ -0,0 +1,66 @@
+"""
+商品名n-gramインデックス（core/name_index.py）のテスト
+"""
+
+from core.name_index import MATCH_EXACT, MATCH_FUZZY, MATCH_PARTIAL, NameIndex, normalize_name
+
+
+def _index():
+    return NameIndex.build({
+        'product_master': [
+            {'common_code': 'CM001', 'product_name': 'エゾ鹿ジャーキー 30g'},
+            {'common_code': 'CM002', 'product_name': 'チキンジャーキー 30g'},
+            {'common_code': 'CM003', 'product_name': 'エゾ鹿スライス 50g'},
+        ],
+        'choice_code_mapping': [
+            {'common_code': 'CM101', 'product_name': 'ささみ'},
+        ],
+    })
+
+
+def test_normalize_name():
+    assert normalize_name('ＡＢＣ　ささみ') == 'abcササミ'
+    assert normalize_name('鹿-ジャーキー／30g') == '鹿ジャーキー30g'
+    assert normalize_name(None) == ''
+
+
+def test_normalize_keeps_long_vowel_mark():
+    # 長音符は語の一部（ジャーキー と ジャキ を同じ名前にしない）
+    assert normalize_name('ジャーキー') == 'ジャーキー'
+    assert normalize_name('ジャーキー') != normalize_name('ジャキ')
+
+
+def test_find_exact_after_normalization():
+    index = _index()
+    match = index.find_exact('えぞ鹿ジャーキー　30g')
+    assert match.common_code == 'CM001'
+    assert match.kind == MATCH_EXACT
+    assert index.find_exact('ササミ', sources=['product_master']) is None
+    assert index.find_exact('ササミ').common_code == 'CM101'
+
+
+def test_partial_match_requires_min_score():
+    index = _index()
+    match = index.best('エゾ鹿ジャーキー', kinds=(MATCH_PARTIAL,), partial_min_score=0.5)
+    assert match.common_code == 'CM001'
+    # 名前の一部だけの短い検索語は部分一致として採用しない
+    assert index.best('ジャー', kinds=(MATCH_PARTIAL,), partial_min_score=0.5) is None
+    assert index.best('ジャー', kinds=(MATCH_PARTIAL,), partial_min_score=0.0) is not None
+
+
+def test_fuzzy_match_requires_min_score():
+    index = _index()
+    match = index.best('エゾ鹿ジャーキー 40g', min_score=0.6)
+    assert match.common_code == 'CM001'
+    assert match.kind == MATCH_FUZZY
+    assert index.best('エゾ鹿ジャーキー 40g', min_score=0.95) is None
+
+
+def test_search_orders_by_kind_then_score():
+    index = _index()
+    matches = index.search('エゾ鹿ジャーキー 30g', limit=3, min_score=0.3, partial_min_score=0.0)
+    assert matches[0].kind == MATCH_EXACT
+    assert [match.kind for match in matches] == sorted(
+        (match.kind for match in matches), key=[MATCH_EXACT, MATCH_PARTIAL, MATCH_FUZZY].index
+    )
+    assert len(index) == 4
@@ -0,0 +1,69 @@
+"""
+APIレート制限（core/rate_limit.py）のテスト
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core import rate_limit
+from core.rate_limit import AsyncTokenBucket, backoff_delay
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limit.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limit.asyncio, 'sleep', clock.sleep)
+    return clock
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        AsyncTokenBucket(rate=0)
+
+
+def test_burst_then_wait_for_refill(clock):
+    bucket = AsyncTokenBucket(rate=2.0, capacity=2)
+
+    async def run():
+        for _ in range(4):
+            await bucket.acquire()
+
+    asyncio.run(run())
+    # 最初の2件はバースト、以降は1件あたり0.5秒
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_pause_delays_next_acquire(clock):
+    bucket = AsyncTokenBucket(rate=10.0, capacity=10)
+    bucket.pause(3)
+    asyncio.run(bucket.acquire())
+    assert clock.sleeps == [pytest.approx(3)]
+
+
+def test_backoff_prefers_retry_after():
+    response = SimpleNamespace(headers={'Retry-After': '5'})
+    assert backoff_delay(3, response) == 5.0
+    assert backoff_delay(0, SimpleNamespace(headers={'Retry-After': '600'}), max_delay=60) == 60
+
+
+def test_backoff_is_exponential_with_jitter():
+    for attempt in range(4):
+        delay = backoff_delay(attempt, SimpleNamespace(headers={'Retry-After': 'soon'}))
+        assert 2 ** attempt <= delay <= 2 ** attempt * 1.5
+    assert backoff_delay(10, max_delay=8) <= 12
@@ -0,0 +1,63 @@
+"""
+在庫シミュレーション（core/simulation.py）のテスト
+"""
+
+import numpy as np
+
+from core.simulation import StockSimulator
+from core.stock import REASON_SALE, stock_adjustment
+
+
+def _simulator():
+    return StockSimulator({'S01': 10, 'S02': 3})
+
+
+def test_preview_does_not_change_state():
+    simulator = _simulator()
+    levels = simulator.preview({'S01': -4})
+    assert levels == {'S01': {'previous_stock': 10, 'new_stock': 6, 'delta': -4, 'status': 'simulated'}}
+    assert simulator.stock_of('S01') == 10
+
+
+def test_apply_sums_same_code_and_clamps_at_zero():
+    simulator = _simulator()
+    adjustments = [
+        stock_adjustment('S02', -2, REASON_SALE),
+        stock_adjustment('S02', -2, REASON_SALE),
+    ]
+    levels = simulator.apply(adjustments, clamp_at_zero=True)
+    assert levels['S02']['new_stock'] == 0
+    assert levels['S02']['delta'] == -3
+    assert simulator.stock_of('S02') == 0
+
+
+def test_missing_and_created_products():
+    simulator = _simulator()
+    assert simulator.preview({'S09': -1}, create_missing=False)['S09']['status'] == 'missing'
+    levels = simulator.apply({'S09': 5})
+    assert levels['S09'] == {'previous_stock': None, 'new_stock': 5, 'delta': 5, 'status': 'created'}
+    assert simulator.levels() == {'S01': 10, 'S02': 3, 'S09': 5}
+
+
+def test_run_matches_daily_apply():
+    days = [{'S01': -3}, {'S01': -3, 'S02': -1}, {'S01': -6, 'S03': 2}]
+    for clamp_at_zero in (False, True):
+        batched = _simulator()
+        history = batched.run(days, clamp_at_zero=clamp_at_zero)
+        stepwise = _simulator()
+        for row, deltas in enumerate(days):
+            stepwise.apply(deltas, clamp_at_zero=clamp_at_zero)
+            assert [stepwise.stock_of(code) for code in batched.codes] == list(history[row])
+        assert batched.levels() == stepwise.levels()
+    assert _simulator().run([]).shape == (0, 2)
+
+
+def test_copy_is_independent_and_diff_reports_differences():
+    simulator = _simulator()
+    scenario = simulator.copy()
+    scenario.apply({'S01': -10})
+    assert simulator.stock_of('S01') == 10
+    assert scenario.diff({'S01': 0, 'S02': 1}) == [
+        {'common_code': 'S02', 'simulated_stock': 3, 'actual_stock': 1, 'difference': 2}
+    ]
+    assert isinstance(scenario.stock, np.ndarray)